@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+性能基准测试 / Benchmark harness
+
+功能说明 Function Description:
+-------------------------------------
+- 在临时工作目录中复制本项目脚本，并用 synthetic_exports 生成指定行数的 UK/DE/NL/FR 模拟导出文件
+  Copies the project scripts into a scratch directory and generates UK/DE/NL/FR synthetic exports
+  of the requested size with synthetic_exports.
+- 每个阶段（combine / process / report，以及进程内的完整 pipeline）作为独立子进程运行，记录
+  墙钟时间、每秒处理行数和峰值内存（RSS）
+  Every stage (combine / process / report, plus the in-process end-to-end pipeline) runs as its own
+  subprocess; wall time, rows per second and peak RSS are recorded.
+- 结果可保存为基准（JSON），之后的运行与基准对比：耗时超过容差即视为退化，汇总结果不一致也会报告
+  Results can be saved as a baseline (JSON); later runs are compared against it. Wall time beyond the
+  tolerance counts as a regression, and a different summary result is reported too.
+
+使用方法 Usage:
+-------------------------------------
+python benchmark.py --rows 100000 --save-baseline bench_baseline.json
+python benchmark.py --rows 100000 --baseline bench_baseline.json
+python benchmark.py --rows 1000000 --stages pipeline --stage-args="--no-merged-output --workers 4"
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import hashlib
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+import synthetic_exports
+from file_manifest import SOURCE_KEYWORDS
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 模拟数据的日期 / Date of the synthetic exports
+BENCH_DATE = "2025-10-29"
+
+# 可运行的阶段（按执行顺序） / Stages that can be run, in execution order
+STAGES = ["combine", "process", "report", "pipeline"]
+
+# 默认的耗时退化容差（10%） / Default wall-time regression tolerance (10%)
+TOLERANCE = 0.10
+
+# ===============================================================
+
+
+def stage_command(stage, date, stage_args):
+    """阶段对应的命令行 / Command line of one stage"""
+    scripts = {
+        "combine": ["combine_excel_sheets.py", date, *stage_args],
+        "process": ["process_merged_files.py", date, *stage_args],
+        "report": ["generate_weekly_report.py", "--date", date],
+        "pipeline": ["run_program.py", date, *stage_args],
+    }
+    return [sys.executable, *scripts[stage]]
+
+
+def prepare_workdir(workdir):
+    """把项目脚本复制到工作目录（各脚本以自身所在目录为数据目录） / Copy the scripts into the scratch directory
+    (every script uses its own directory as the data root)"""
+    os.makedirs(workdir, exist_ok=True)
+    for name in os.listdir(PARENT_DIR):
+        if name.endswith(".py"):
+            shutil.copy2(os.path.join(PARENT_DIR, name), workdir)
+
+
+def reset_outputs(workdir, warehouses, keep_cache=False):
+    """删除上一轮的合并文件、汇总、报告、指标库和增量构建状态，只保留源导出文件
+    Remove merged workbooks, summaries, reports, the metrics store and the incremental build state of the previous
+    round, keeping only the source exports
+    """
+    keywords = [kw for kw, _ in SOURCE_KEYWORDS]
+    for warehouse in warehouses:
+        folder = os.path.join(workdir, warehouse)
+        for name in os.listdir(folder):
+            if not any(kw in name for kw in keywords):
+                os.remove(os.path.join(folder, name))
+    for name in os.listdir(workdir):
+        path = os.path.join(workdir, name)
+        if name.startswith(("warehouse_summary_", "warehouse_metrics", "EU_Larger_Items_")):
+            os.remove(path)
+        elif name in ("merged_outputs", ".build_state") or (name == ".parse_cache" and not keep_cache):
+            shutil.rmtree(path)
+
+
+def run_stage(cmd, workdir, log_path):
+    """运行一个阶段，返回 (退出码, 墙钟秒数, 峰值 RSS MB)；无法获取内存时 RSS 为 None
+    Run one stage, returns (exit code, wall seconds, peak RSS in MB); RSS is None where it cannot be measured
+    """
+    with open(log_path, "a", encoding="utf-8") as log:
+        log.write(f"\n$ {' '.join(cmd)}\n")
+        log.flush()
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            # wait4 返回该子进程自身的资源占用 / wait4 returns the resource usage of this child alone
+            _, status, usage = os.wait4(proc.pid, 0)
+            wall = time.perf_counter() - start
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            # Linux 上 ru_maxrss 单位为 KB，macOS 为字节 / ru_maxrss is KB on Linux, bytes on macOS
+            rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        else:
+            proc.wait()
+            wall = time.perf_counter() - start
+            rss = None
+    return proc.returncode, wall, rss
+
+
+def summary_fingerprint(workdir, date):
+    """汇总 CSV 的指纹（去掉文件名列），用于确认结果未变 / Fingerprint of the summary CSV without the file column"""
+    path = os.path.join(workdir, f"warehouse_summary_{date}.csv")
+    if not os.path.exists(path):
+        return None
+    import pandas as pd
+    df = pd.read_csv(path, encoding="utf-8-sig").drop(columns=["文件 / File"], errors="ignore")
+    return hashlib.sha1(df.to_csv(index=False).encode("utf-8")).hexdigest()
+
+
+def run_benchmark(args):
+    """生成数据并按轮次运行各阶段，返回结果字典 / Generate the data, run the stages for every round, return the results"""
+    workdir = args.workdir or tempfile.mkdtemp(prefix="warelytic_bench_")
+    log_path = os.path.join(workdir, "benchmark.log")
+    stage_args = shlex.split(args.stage_args or "")
+    prepare_workdir(workdir)
+
+    print("=" * 80)
+    print(f"工作目录 Scratch directory: {workdir}")
+    started = time.perf_counter()
+    written = synthetic_exports.generate(
+        workdir, args.date, args.rows, args.inventory_rows, args.inbound_rows, args.outbound_rows,
+        args.warehouses, args.headers, args.seed,
+    )
+    input_rows = sum(count for _, count in written.values())
+    input_mb = sum(os.path.getsize(path) for path, _ in written.values()) / (1024 * 1024)
+    print(f"生成完成 Generated {input_rows:,} 行 rows ({input_mb:.1f} MB) in {time.perf_counter() - started:.1f}s")
+    print("=" * 80)
+
+    timings = {stage: [] for stage in args.stages}
+    rss = {stage: [] for stage in args.stages}
+    failed = []
+    fingerprint = None
+    for round_no in range(1, args.repeat + 1):
+        for stage in args.stages:
+            # combine 和 pipeline 从干净的目录开始 / combine and pipeline start from a clean tree
+            if stage in ("combine", "pipeline"):
+                reset_outputs(workdir, args.warehouses, args.warm_cache)
+            code, wall, peak = run_stage(stage_command(stage, args.date, stage_args), workdir, log_path)
+            status = "ok" if code == 0 else f"exit {code}"
+            peak_text = "-" if peak is None else f"{peak:.0f} MB"
+            print(f"[{round_no}/{args.repeat}] {stage:<9} {wall:8.2f}s  {peak_text:>8}  {status}")
+            if code != 0:
+                failed.append(stage)
+            timings[stage].append(wall)
+            rss[stage].append(peak)
+            fingerprint = summary_fingerprint(workdir, args.date) or fingerprint
+
+    stages = {}
+    for stage in args.stages:
+        best = min(timings[stage])
+        peaks = [p for p in rss[stage] if p is not None]
+        stages[stage] = {
+            "wall_s": round(best, 4),
+            "median_s": round(statistics.median(timings[stage]), 4),
+            "rows_per_s": None if stage == "report" else round(input_rows / best, 1),
+            "peak_rss_mb": round(max(peaks), 1) if peaks else None,
+        }
+    result = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "rows": args.rows, "inventory_rows": args.inventory_rows, "inbound_rows": args.inbound_rows,
+            "outbound_rows": args.outbound_rows, "warehouses": args.warehouses, "headers": args.headers,
+            "seed": args.seed, "stage_args": args.stage_args or "", "warm_cache": args.warm_cache,
+        },
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "input_rows": input_rows,
+        "input_mb": round(input_mb, 2),
+        "stages": stages,
+        "summary_sha1": fingerprint,
+        "failed": sorted(set(failed)),
+    }
+    if not args.keep and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        print(f"日志 Log: {log_path}")
+    return result
+
+
+def print_results(result):
+    """打印结果表 / Print the results table"""
+    print("\n" + "=" * 80)
+    print(f"输入 Input: {result['input_rows']:,} 行 rows, {result['input_mb']} MB")
+    print(f"{'stage':<10}{'best (s)':>10}{'median (s)':>12}{'rows/s':>14}{'peak RSS (MB)':>16}")
+    for stage, s in result["stages"].items():
+        rows_per_s = "-" if s["rows_per_s"] is None else f"{s['rows_per_s']:,.0f}"
+        peak = "-" if s["peak_rss_mb"] is None else f"{s['peak_rss_mb']:.0f}"
+        print(f"{stage:<10}{s['wall_s']:>10.2f}{s['median_s']:>12.2f}{rows_per_s:>14}{peak:>16}")
+    if result["failed"]:
+        print(f"[WARN] 阶段失败 Failed stages: {', '.join(result['failed'])}")
+    print("=" * 80)
+
+
+def compare(result, baseline, tolerance=TOLERANCE):
+    """与基准对比并打印差异，返回是否退化 / Compare against the baseline, print the deltas, return whether it regressed"""
+    regressed = False
+    print(f"\n与基准对比 Compared with baseline ({baseline.get('created', '?')}), 容差 tolerance {tolerance:.0%}:")
+    if baseline.get("config") != result["config"]:
+        print("[WARN] 数据或参数与基准不同，对比仅供参考 Data or stage arguments differ from the baseline, "
+              "the comparison is indicative only")
+    for stage, s in result["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base:
+            print(f"  {stage:<10} 基准中没有该阶段 not in baseline")
+            continue
+        delta = s["wall_s"] / base["wall_s"] - 1 if base["wall_s"] else 0.0
+        rss_text = ""
+        if s["peak_rss_mb"] is not None and base.get("peak_rss_mb"):
+            rss_text = f", RSS {base['peak_rss_mb']:.0f} → {s['peak_rss_mb']:.0f} MB"
+        flag = "退化 REGRESSION" if delta > tolerance else "faster" if delta < -tolerance else "same"
+        regressed = regressed or delta > tolerance
+        print(f"  {stage:<10} {base['wall_s']:.2f}s → {s['wall_s']:.2f}s ({delta:+.1%}){rss_text}  {flag}")
+    if baseline.get("summary_sha1") and result["summary_sha1"] and baseline["summary_sha1"] != result["summary_sha1"]:
+        print("[WARN] 汇总结果与基准不同 The summary differs from the baseline")
+        regressed = True
+    return regressed
+
+
+def parse_args(argv=None):
+    """解析命令行参数 / Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="性能基准测试 / Benchmark the pipeline on synthetic iWMS exports.")
+    parser.add_argument("--rows", type=int, default=10_000, help="每个 sheet 的行数（默认 10000） / Rows per sheet (default 10000).")
+    parser.add_argument("--inventory-rows", type=int, help="库存表行数 / Inventory rows.")
+    parser.add_argument("--inbound-rows", type=int, help="入库表行数 / Inbound rows.")
+    parser.add_argument("--outbound-rows", type=int, help="出库表行数 / Outbound rows.")
+    parser.add_argument("--warehouses", nargs="+", default=synthetic_exports.WAREHOUSES, help="仓库文件夹 / Warehouse folders.")
+    parser.add_argument("--headers", choices=["default", "cn", "en"], default="default", help="表头语言 / Header language.")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子 / Random seed.")
+    parser.add_argument("--date", default=BENCH_DATE, help=f"模拟数据日期（默认 {BENCH_DATE}） / Date of the exports.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="要运行的阶段 / Stages to run.")
+    parser.add_argument("--stage-args", help="传给 combine/process/pipeline 的参数 / Extra arguments for combine/process/pipeline, e.g. --stage-args=\"--workers 4\".")
+    parser.add_argument("--repeat", type=int, default=1, help="重复轮数，取最快一次 / Rounds to run, the fastest counts (default 1).")
+    parser.add_argument("--warm-cache", action="store_true", help="轮次之间保留解析缓存 / Keep the parse cache between rounds.")
+    parser.add_argument("--workdir", help="工作目录（默认临时目录，运行后删除） / Scratch directory (default: a temporary one, removed afterwards).")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录 / Keep the temporary scratch directory.")
+    parser.add_argument("--save-baseline", metavar="PATH", help="把结果保存为基准 JSON / Save the results as a baseline JSON.")
+    parser.add_argument("--baseline", metavar="PATH", help="与基准 JSON 对比 / Compare against a baseline JSON.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="耗时退化容差（默认 0.10） / Wall-time regression tolerance (default 0.10).")
+    args = parser.parse_args(argv)
+    args.stages = [s for s in STAGES if s in args.stages]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run_benchmark(args)
+    print_results(result)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"已保存基准 Baseline saved: {args.save_baseline}")
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressed = compare(result, json.load(f), args.tolerance)
+    return 1 if regressed or result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+增量构建状态 / Incremental build state
+
+功能说明 Function Description:
+-------------------------------------
+- 与 make 类似：每个 (仓库, 日期) 单元的结果（汇总行，写出合并文件时还有合并工作簿）记录其输入的签名：
+  三个源文件的内容哈希、相关代码的版本和影响结果的运行选项；签名不变且输出仍在时，合并和指标计算都跳过，
+  直接沿用上次的汇总行
+  Make-style: the output of every (warehouse, date) unit (its summary row and, when written, the merged
+  workbook) records the signature of its inputs: the content hashes of the three source files, the version
+  of the code involved and the run options that change the result. With an unchanged signature and the
+  outputs still present, the combine and metrics stages are skipped and the stored summary row is reused.
+- 汇总（汇总 CSV、指标库、周报）记录所有单元签名的组合；没有单元变化且汇总文件仍在时整个汇总步骤跳过。
+  只有一个仓库的导出变化时，只重新处理该单元，汇总由其余单元保存的汇总行和新结果重新生成
+  The summary stage (summary CSV, metrics store, report) records the combination of every unit signature;
+  when no unit changed and the summary files are still there the whole stage is skipped. When a single
+  warehouse's export changes only that unit is reprocessed and the summary is rebuilt from the stored rows
+  of the other units plus the new one.
+- 内容哈希按 (路径, 大小, 修改时间) 记在 digests.json 中：文件未变化时不重新读取；只被 touch 或重新复制但
+  内容相同的导出也不会触发重算
+  Content hashes are memoised per (path, size, mtime) in digests.json, so an unchanged file is never read
+  again, and an export that was only touched or copied again with the same content triggers nothing.
+- 失败的单元不记录，下次运行自动重试；--force 忽略已有记录，全部重新处理
+  Failed units are not recorded and are retried by the next run; --force ignores the records and rebuilds
+  everything.
+- SKU 主数据只提供单元日期之前的尺寸，重跑结果不随运行历史变化；--dimensions master 时主数据版本是签名的一部分
+  The SKU master only supplies dimensions from before the unit's date, so a rerun does not depend on the run
+  history; with --dimensions master the master revision is part of the signature.
+"""
+
+import os
+import json
+import hashlib
+
+import readers
+import sku_master
+import distributions
+import id_dictionary
+import sheet_ranges
+import intraday
+from work_queue import write_atomic, read_done
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 状态目录（以 . 开头，不会被当作仓库文件夹） / State directory (dot-prefixed, never taken for a warehouse folder)
+STATE_DIR = os.path.join(PARENT_DIR, ".build_state")
+
+# 内容哈希记录 / Content hash memo
+DIGESTS_PATH = os.path.join(STATE_DIR, "digests.json")
+
+# 决定单元结果的代码；任一文件变化时所有单元重新处理
+# Code that determines a unit's result; any change to these files reprocesses every unit
+CODE_MODULES = [
+    'combine_excel_sheets.py', 'process_merged_files.py', 'readers.py', 'xlsx_merge.py', 'parse_cache.py',
+    'id_dictionary.py', 'sku_master.py', 'inventory_delta.py', 'distributions.py', 'exception_rules.py',
+    'metrics_store.py', 'sheet_ranges.py', 'intraday.py', 'dates.py', 'npz_store.py',
+]
+
+# 读取内容哈希时每次读取的字节数 / Bytes read per call while hashing contents
+HASH_BLOCK_BYTES = 1 << 20
+
+# ===============================================================
+
+_code_version = None
+
+
+def code_version():
+    """CODE_MODULES 源码的哈希（每个进程计算一次） / Hash of the CODE_MODULES sources (computed once per process)"""
+    global _code_version
+    if _code_version is None:
+        h = hashlib.sha1()
+        for name in CODE_MODULES:
+            with open(os.path.join(PARENT_DIR, name), 'rb') as f:
+                h.update(name.encode('utf-8') + b'\0' + f.read())
+        _code_version = h.hexdigest()
+    return _code_version
+
+
+def load_digests():
+    """读取内容哈希记录 {路径: [大小, 修改时间, 哈希]} / Load the content hash memo {path: [size, mtime, hash]}"""
+    try:
+        with open(DIGESTS_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_digests(digests):
+    """原子写入内容哈希记录 / Atomically write the content hash memo"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp = f"{DIGESTS_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(digests, f)
+        os.replace(tmp, DIGESTS_PATH)
+    except OSError as e:
+        print(f"[WARN] 写入构建状态失败 Build state write failed: {e}")
+
+
+def content_digest(path, digests):
+    """文件内容的 SHA-1；大小和修改时间与记录一致时直接取记录 / SHA-1 of a file's contents; taken from the memo
+    when size and mtime match the record
+    """
+    st = os.stat(path)
+    known = digests.get(path)
+    if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+        return known[2]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_BYTES):
+            h.update(block)
+    digests[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+    return digests[path][2]
+
+
+def unit_options(write_merged, args, metrics):
+    """影响单元结果的运行选项，run_program 和 --queue（见 work_queue）的单元签名共用同一份
+    Run options that change a unit's result; run_program and --queue (see work_queue) sign their units with
+    the same list
+    """
+    return [write_merged, args.fast_merge, metrics, sku_master.mode(), distributions.enabled(), id_dictionary.token(),
+            sku_master.token() if sku_master.from_master() else None, intraday.enabled(), sheet_ranges.workers(),
+            os.environ.get(readers.READER_ENV)]
+
+
+def unit_signature(files, options, digests):
+    """单元签名：源文件内容哈希、代码版本和运行选项；缺少源文件（或未预选源文件）时为 None
+    Unit signature: source content hashes, code version and run options; None when a source file is missing
+    (or the files were not preselected)
+    """
+    if not files or any(path is None for path in files.values()):
+        return None
+    try:
+        contents = {kind: content_digest(path, digests) for kind, path in sorted(files.items())}
+    except OSError:
+        return None
+    return hashlib.sha1(json.dumps([contents, code_version(), options], default=str).encode('utf-8')).hexdigest()
+
+
+def summary_signature(signatures, options):
+    """汇总签名：所有单元签名（按顺序）和汇总选项 / Summary signature: every unit signature (in order) and the summary options"""
+    return hashlib.sha1(json.dumps([signatures, options], default=str).encode('utf-8')).hexdigest()
+
+
+def _record_path(date_label, name):
+    return os.path.join(STATE_DIR, str(date_label), f"{name}.npz")
+
+
+def _load_record(path, signature):
+    """签名一致且记录的输出仍在时返回记录，否则 None / The record when the signature matches and its outputs still exist, else None"""
+    if signature is None:
+        return None
+    record = read_done(path, signature)
+    if record is None or not all(os.path.exists(p) for p in record.get('outputs', [])):
+        return None
+    return record
+
+
+def _store_record(path, record):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, record)
+
+
+def load_unit(item, date, signature):
+    """签名一致且输出仍在时返回单元记录 {'signature', 'row', 'outputs'}，否则 None
+    The unit record {'signature', 'row', 'outputs'} when the signature matches and the outputs still exist, else None
+    """
+    return _load_record(_record_path(date, item), signature)
+
+
+def store_unit(item, date, signature, row, outputs=()):
+    """记录一个成功单元的汇总行和输出文件 / Record the summary row and output files of a successful unit"""
+    if signature is None or row is None:
+        return
+    _store_record(_record_path(date, item), {'signature': signature, 'row': row, 'outputs': list(outputs)})
+
+
+def summary_is_fresh(label, signature):
+    """汇总签名一致且汇总文件仍在 / Whether the summary signature matches and the summary files still exist"""
+    return _load_record(_record_path(label, '_summary'), signature) is not None
+
+
+def store_summary(label, signature, outputs):
+    """记录已写出的汇总 / Record a written summary"""
+    _store_record(_record_path(label, '_summary'), {'signature': signature, 'outputs': list(outputs)})
@@ -30,6 +30,29 @@ Cross-platform Excel merger script
 -------------------------------------
 --delete-others : 删除非目标日期或无关键词的文件
                   Delete files that are not for the target date or without the required keywords
+--workers N     : 用 N 个进程并行处理仓库文件夹（0 = 全部核心）
+                  Process the warehouse folders with N worker processes (0 = all cores)
+--no-cache      : 不使用解析缓存（.parse_cache），每次重新解析 xlsx
+                  Bypass the parse cache (.parse_cache) and decode every xlsx again
+--fast-merge    : 在 xlsx 包级别合并（复制工作表 XML），不解析单元格
+                  Merge at xlsx package level (copy the worksheet XML) without parsing cells
+--from YYYY-MM-DD --to YYYY-MM-DD : 回填模式，一次处理日期范围内的每一天
+                  Backfill mode, process every day of the range in one run
+--profile [--profile-file PATH] : 把各阶段耗时、行数和内存写入 JSON 行文件（见 profiling）
+                  Write per-stage timings, rows and memory to a JSON-lines file (see profiling)
+--quiet         : 不输出 [DEBUG] 信息 / Do not print the [DEBUG] messages
+--check-headers : 预检时提示与上一次导出不同的表头（见 file_manifest）
+                  Warn during the preflight when a header differs from the previous export (see file_manifest)
+--reader NAME   : 读取后端 auto / openpyxl / calamine / csv（见 readers）；CSV/TSV 导出与 xlsx 使用相同的关键词
+                  Reader backend auto / openpyxl / calamine / csv (see readers); CSV/TSV exports use the same keywords as xlsx
+--dimensions master : 不读取长宽高，体积按 SKU 主数据计算（见 sku_master）
+                      Skip the length/width/height columns, the volume comes from the SKU master (see sku_master)
+--distributions [--top-k N] : 同一次扫描中计算前 N 的 SKU 和每单行数分布（见 distributions）
+                      Compute the top SKUs and the lines-per-order distribution in the same scan (see distributions)
+--sheet-workers N : 大库存表按行区间由 N 个进程并行解析并汇总（0 = 全部核心，见 sheet_ranges）
+                    Parse and aggregate a large inventory sheet in row ranges with N processes (0 = all cores, see sheet_ranges)
+--intraday      : 出库和入库导出只汇总上次运行之后追加的行（需 --no-merged-output 或 --fast-merge，见 intraday）
+                  Aggregate only the outbound / inbound rows appended since the last run (needs --no-merged-output or --fast-merge, see intraday)
 """
 
 import os
@@ -38,6 +61,18 @@ import argparse
 from datetime import datetime, timedelta
 import pandas as pd
 
+from parse_cache import read_excel_cached
+from xlsx_merge import XlsxMergeUnsupported, merge_workbooks
+from worker_pool import resolve_workers, run_units
+import profiling
+import file_manifest
+import readers
+import sku_master
+import distributions
+import sheet_ranges
+import intraday
+from dates import coerce_date
+
 # ==================== 配置区 Configuration Area ====================
 
 # 获取脚本所在目录
@@ -54,7 +89,7 @@ OUTPUT_BASE_DIR = os.path.join(PARENT_DIR, "merged_outputs")
 
 # ===============================================================
 
-def parse_args():
+def parse_args(argv=None):
     """解析命令行参数 / Parse command-line arguments"""
     parser = argparse.ArgumentParser(
         description="合并当天（或指定日期）三个 Excel 文件为一个文件 / Merge 3 Excel files for a given date into one workbook."
@@ -82,6 +117,26 @@ def parse_args():
         help="使用指定日期 / Use the specific date."
     )
 
+    # 日期范围（回填模式）
+    # Date range (backfill mode)
+    parser.add_argument(
+        "--from",
+        dest="date_from",
+        metavar="YYYY-MM-DD",
+        help="回填起始日期（含），需同时指定 --to / First date of a backfill range (inclusive), requires --to."
+    )
+    parser.add_argument(
+        "--to",
+        dest="date_to",
+        metavar="YYYY-MM-DD",
+        help="回填结束日期（含） / Last date of a backfill range (inclusive)."
+    )
+    parser.add_argument(
+        "--long-summary",
+        action="store_true",
+        help="回填模式下输出一个长格式汇总（含日期列），而不是每天一个 / In backfill mode write one long-format summary with a date column instead of one per day."
+    )
+
     # 是否删除非匹配文件
     # Whether to delete files that don’t match the target date or keywords
     parser.add_argument(
@@ -89,14 +144,135 @@ def parse_args():
         action="store_true",
         help="删除非目标日期或无关键词文件（旧行为） / Delete non-matching files (legacy behaviour)."
     )
-    return parser.parse_args()
 
-def coerce_date(date_str: str) -> datetime.date:
-    """验证并转换日期格式 / Validate and convert a string to date format"""
-    try:
-        return datetime.strptime(date_str, "%Y-%m-%d").date()
-    except ValueError as e:
-        raise ValueError(f"日期格式错误 Invalid date '{date_str}'. 期望格式 Expected format: YYYY-MM-DD.") from e
+    # 并行处理的进程数
+    # Number of worker processes for the warehouse folders
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="并行处理仓库文件夹的进程数，0 表示全部核心（默认 1） / Worker processes for the warehouse folders, 0 = all cores (default 1)."
+    )
+
+    # 关闭解析缓存
+    # Disable the parse cache
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="不读写解析缓存 .parse_cache / Do not read or write the parse cache in .parse_cache."
+    )
+
+    # 在 xlsx 包级别合并，不解析单元格
+    # Merge at xlsx package level without parsing cells
+    parser.add_argument(
+        "--fast-merge",
+        action="store_true",
+        help="直接复制工作表 XML、共享字符串和样式来合并，不解码单元格 / Merge by copying worksheet XML, shared strings and styles instead of decoding cells."
+    )
+
+    # 库存文件流式汇总阈值（供 process_merged_files / run_program 使用）
+    # Inventory streaming threshold (used by process_merged_files / run_program)
+    parser.add_argument(
+        "--stream-threshold-mb",
+        type=float,
+        default=None,
+        metavar="N",
+        help="库存文件超过 N MB 时流式汇总（不写合并文件时生效） / Stream inventory files larger than N MB (when the merged workbook is not written)."
+    )
+
+    # 只计算指定的指标（供 process_merged_files / run_program 使用）
+    # Compute only the given metrics (used by process_merged_files / run_program)
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        metavar="NAMES",
+        help="逗号分隔的指标名，'report' 表示周报需要的指标（默认全部） / Comma-separated metric names, 'report' = the metrics the weekly report needs (default all)."
+    )
+
+    # 剖析与安静模式（见 profiling）
+    # Profiling and quiet mode (see profiling)
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="把各阶段的耗时、行数和内存写入 JSON 行文件 / Write per-stage timings, rows and memory to a JSON-lines file."
+    )
+    parser.add_argument(
+        "--profile-file",
+        default=None,
+        metavar="PATH",
+        help="剖析记录文件（默认 profile_<时间>.jsonl，隐含 --profile） / Profile records file (default profile_<timestamp>.jsonl, implies --profile)."
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="不输出 [DEBUG] 信息 / Do not build or print the [DEBUG] messages."
+    )
+
+    # 读取后端（见 readers）
+    # Reader backend (see readers)
+    parser.add_argument(
+        "--reader",
+        choices=["auto", *readers.BACKENDS],
+        default="auto",
+        help="读取后端，默认按文件类型和微基准结果自动选择 / Reader backend, chosen by file type and the micro-benchmark by default."
+    )
+
+    # 体积的尺寸来源（见 sku_master）
+    # Dimension source of the volume (see sku_master)
+    parser.add_argument(
+        "--dimensions",
+        choices=sku_master.MODES,
+        default=None,
+        help="sheet = 读取尺寸列并用 SKU 主数据补全缺失值（默认），master = 不读取尺寸列，只用主数据 / "
+             "sheet = read the dimension columns and fill gaps from the SKU master (default), master = no "
+             "dimension columns, master only."
+    )
+
+    # Top-K 与分布（见 distributions）
+    # Top-K and distributions (see distributions)
+    parser.add_argument(
+        "--distributions",
+        action="store_true",
+        help="同一次扫描中计算出库量 / 在库体积前 N 的 SKU 和每个出库订单的行数分布 / Compute the top SKUs by outbound "
+             "units and by inventory volume and the lines-per-order distribution in the same scan."
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=None,
+        metavar="N",
+        help=f"--distributions 输出前 N 个 SKU（默认 {distributions.TOP_K}） / Number of top SKUs written by --distributions (default {distributions.TOP_K})."
+    )
+
+    # 单个大工作表按行区间并行（见 sheet_ranges）
+    # One large worksheet in parallel row ranges (see sheet_ranges)
+    parser.add_argument(
+        "--sheet-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="库存表按行区间由 N 个进程并行解析，结果与串行相同（0 = 全部核心） / Parse the inventory sheet in row ranges "
+             "with N processes, identical to a serial run (0 = all cores)."
+    )
+
+    # 日内增量（见 intraday）
+    # Intraday increments (see intraday)
+    parser.add_argument(
+        "--intraday",
+        action="store_true",
+        help="出库表和入库表只解析上次运行之后追加的行，前缀变化时完整重算 / Parse only the outbound and inbound rows "
+             "appended since the last run, recomputing in full when the prefix changed."
+    )
+
+    # 预检时比较表头指纹（见 file_manifest）
+    # Compare header fingerprints during the preflight (see file_manifest)
+    parser.add_argument(
+        "--check-headers",
+        action="store_true",
+        help="预检时读取源文件表头，提示与上一次导出不同的表头 / Read the source headers during the preflight and warn when one differs from the previous export."
+    )
+    return parser.parse_args(argv)
 
 def resolve_target_date(args) -> datetime.date:
     """确定目标日期 / Resolve which date to use"""
@@ -108,153 +284,345 @@ def resolve_target_date(args) -> datetime.date:
         return coerce_date(args.date)
     return datetime.now().date()
 
-def main():
-    """主程序入口 / Main entry point"""
-    args = parse_args()
-    target_date = resolve_target_date(args)
-    target_str = target_date.strftime("%Y-%m-%d")
+def resolve_date_range(args):
+    """确定回填日期范围，返回日期字符串列表；未指定 --from/--to 时返回 None
+    Resolve the backfill range as a list of date strings; None without --from/--to
+    """
+    if not (args.date_from or args.date_to):
+        return None
+    if not (args.date_from and args.date_to):
+        raise ValueError("--from 与 --to 必须同时指定 / --from and --to must be given together.")
+    if args.yesterday or args.positional_date or args.date:
+        raise ValueError("--from/--to 不能与单日日期参数同时使用 / --from/--to cannot be combined with a single-date option.")
+    if args.delete_others:
+        raise ValueError("--delete-others 不支持回填模式 / --delete-others is not supported with --from/--to.")
+    start, end = coerce_date(args.date_from), coerce_date(args.date_to)
+    if start > end:
+        raise ValueError(f"起始日期晚于结束日期 Start date {start} is after end date {end}.")
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+
+def iter_warehouse_folders():
+    """列出待处理的仓库子文件夹（跳过隐藏目录、虚拟环境和输出目录） / List the warehouse subfolders to process
+    (hidden folders, virtual environments and the output directory are skipped)
+    """
+    return file_manifest.warehouse_folders(PARENT_DIR)
+
+def select_source_files(folder_path, target_str, delete_others=False):
+    """挑选目标日期的三个源文件 / Pick the three source files for the target date
+
+    返回 {'Outbound': path, 'Inbound': path, 'Inventory': path}（缺失项为 None），
+    目录无法读取时返回 None。
+    Returns the mapping above (missing kinds are None), or None if the folder cannot be read.
+    """
+    # 三类文件占位符
+    # Placeholder for three required Excel files
+    files_to_keep = {'Outbound': None, 'Inbound': None, 'Inventory': None}
 
-    print("\n" + "="*70)
-    print(f"开始执行 - 目标日期 Target date: {target_str}")
-    print(f"脚本所在目录 Parent directory: {PARENT_DIR}")
-    print(f"是否保存到原文件夹 Save to original folder: {SAVE_TO_ORIGIN}")
-    print(f"删除非匹配文件 Delete non-matching files: {args.delete_others}")
-    if not SAVE_TO_ORIGIN:
-        os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
-        print(f"统一输出目录 Unified output directory: {OUTPUT_BASE_DIR}")
-    print("="*70 + "\n")
-
-    processed = 0   # 处理的文件夹数量 / Number of subfolders processed
-    success = 0     # 成功合并数量 / Successfully merged folders count
-
-    # 遍历父目录下的所有子文件夹
-    # Iterate through all subfolders in the parent directory
-    for item in sorted(os.listdir(PARENT_DIR)):
-        folder_path = os.path.join(PARENT_DIR, item)
-
-        # 跳过隐藏文件、系统文件夹和非目录项
-        # Skip hidden files, system folders, and non-directory items
-        if item.startswith('.') or item in {'warelytic', '__pycache__', 'merged_outputs'}:
-            continue
-        if not os.path.isdir(folder_path):
+    try:
+        all_files = os.listdir(folder_path)
+    except Exception as e:
+        print(f"无法读取目录 Cannot read folder: {e}")
+        return None
+
+    # 仅保留 Excel / CSV 文件
+    # Keep only Excel / CSV files
+    excel_files = [f for f in all_files if f.lower().endswith(file_manifest.SOURCE_EXTENSIONS)]
+    print(f"发现 Found {len(excel_files)} 个 Excel 文件: {excel_files or '无 None'}")
+
+    deleted = 0
+    for file in excel_files:
+        file_path = os.path.join(folder_path, file)
+        print(f"\n检查文件 Checking file: {file}")
+
+        # 若开启删除模式且文件名中不含目标日期 → 删除
+        # If delete mode is enabled and file does not contain target date → delete it
+        if delete_others and (target_str not in file):
+            print(f"删除文件 Deleting file: 不含目标日期 Missing target date {target_str}")
+            try:
+                os.remove(file_path)
+                deleted += 1
+            except Exception as e:
+                print(f"删除失败 Delete failed: {e}")
             continue
 
-        print(f"\n处理子文件夹 Processing subfolder: {item}")
-        print(f"路径 Path: {folder_path}")
-        processed += 1
-
-        # 三类文件占位符
-        # Placeholder for three required Excel files
-        files_to_keep = {'Outbound': None, 'Inbound': None, 'Inventory': None}
-
-        try:
-            all_files = os.listdir(folder_path)
-        except Exception as e:
-            print(f"无法读取目录 Cannot read folder: {e}")
+        # 不含目标日期则跳过
+        # Skip files that do not contain target date
+        if target_str not in file:
+            print(f"跳过 Skip: 不含目标日期 Missing target date {target_str}")
             continue
 
-        # 仅保留 Excel 文件
-        # Keep only Excel files
-        excel_files = [f for f in all_files if f.lower().endswith(('.xlsx', '.xls'))]
-        print(f"发现 Found {len(excel_files)} 个 Excel 文件: {excel_files or '无 None'}")
-
-        deleted = 0
-        for file in excel_files:
-            file_path = os.path.join(folder_path, file)
-            print(f"\n检查文件 Checking file: {file}")
-
-            # 若开启删除模式且文件名中不含目标日期 → 删除
-            # If delete mode is enabled and file does not contain target date → delete it
-            if args.delete_others and (target_str not in file):
-                print(f"删除文件 Deleting file: 不含目标日期 Missing target date {target_str}")
+        # 根据关键词识别文件类型
+        # Identify file type by keyword
+        if 'checkPackageNumber' in file:
+            files_to_keep['Outbound'] = file_path
+            print("匹配 Match → Outbound")
+        elif 'acceptanceOfDataQuery' in file:
+            files_to_keep['Inbound'] = file_path
+            print("匹配 Match → Inbound")
+        elif 'commodityInventoryInformationInquiry' in file:
+            files_to_keep['Inventory'] = file_path
+            print("匹配 Match → Inventory")
+        else:
+            # 无关键词文件可选删除
+            # Delete files without valid keywords (if delete mode is on)
+            if delete_others:
+                print(f"含日期但无关键词 → 删除 Has date but no keyword → deleting")
                 try:
                     os.remove(file_path)
                     deleted += 1
                 except Exception as e:
                     print(f"删除失败 Delete failed: {e}")
-                continue
 
-            # 不含目标日期则跳过
-            # Skip files that do not contain target date
-            if target_str not in file:
-                print(f"跳过 Skip: 不含目标日期 Missing target date {target_str}")
-                continue
+    if delete_others:
+        print(f"已删除文件数 Files deleted: {deleted}")
 
-            # 根据关键词识别文件类型
-            # Identify file type by keyword
-            if 'checkPackageNumber' in file:
-                files_to_keep['Outbound'] = file_path
-                print("匹配 Match → Outbound")
-            elif 'acceptanceOfDataQuery' in file:
-                files_to_keep['Inbound'] = file_path
-                print("匹配 Match → Inbound")
-            elif 'commodityInventoryInformationInquiry' in file:
-                files_to_keep['Inventory'] = file_path
-                print("匹配 Match → Inventory")
+    return files_to_keep
+
+def read_source_files(files_to_keep, use_cache=True, reader=None):
+    """读取三个源文件为 DataFrame / Read the three source files into DataFrames
+
+    reader(path, sheet_name, use_cache) 可替换默认的完整读取（例如只读取需要的列），返回 None 表示无需读取该文件。
+    任一文件读取失败时返回空字典。
+    reader(path, sheet_name, use_cache) can replace the default full read (e.g. to read only the needed columns);
+    it returns None for a file that does not need to be read. Returns an empty dict if any file fails to read.
+    """
+    dfs = {}
+    for sheet_name, fpath in files_to_keep.items():
+        print(f"\n读取文件 Reading {sheet_name}: {os.path.basename(fpath)}")
+        try:
+            with profiling.span("read", sheet=sheet_name) as record:
+                if reader is None:
+                    df = read_excel_cached(fpath, use_cache=use_cache)
+                else:
+                    df = reader(fpath, sheet_name, use_cache)
+                record["rows"] = len(df) if isinstance(df, pd.DataFrame) else (df or {}).get("rows")
+            if df is None:
+                print("跳过 Skipped: 无被请求的指标 no requested metric uses this sheet")
+                continue
+            if isinstance(df, pd.DataFrame):
+                print(f"读取成功 Read success: {df.shape[0]} 行 rows × {df.shape[1]} 列 cols")
             else:
-                # 无关键词文件可选删除
-                # Delete files without valid keywords (if delete mode is on)
-                if args.delete_others:
-                    print(f"含日期但无关键词 → 删除 Has date but no keyword → deleting")
-                    try:
-                        os.remove(file_path)
-                        deleted += 1
-                    except Exception as e:
-                        print(f"删除失败 Delete failed: {e}")
+                print("读取成功 Read success: 已流式汇总 streamed totals")
+            dfs[sheet_name] = df
+        except Exception as e:
+            print(f"读取失败 Read failed: {e}")
+            return {}
+    return dfs
+
+def merged_output_path(item, target_str, overwrite=True):
+    """生成输出文件路径（固定为 <仓库><日期>.xlsx，原子替换旧文件；overwrite=False 时如重名则自动编号）
+    Build the output path (always <warehouse><date>.xlsx, atomically replacing the old file; with
+    overwrite=False an existing name is auto-incremented)
+    """
+    output_dir = os.path.join(PARENT_DIR, item) if SAVE_TO_ORIGIN else OUTPUT_BASE_DIR
+    base_name = f"{item}{target_str}.xlsx"
+    output_path = os.path.join(output_dir, base_name)
+    if os.path.exists(output_path) and not overwrite:
+        idx = 1
+        while True:
+            candidate = os.path.join(output_dir, f"{item}{target_str}({idx}).xlsx")
+            if not os.path.exists(candidate):
+                output_path = candidate
+                break
+            idx += 1
+    return output_path
+
+def write_merged_workbook(dfs, output_path):
+    """写入合并结果（先写临时文件再原子替换） / Write merged workbook (temporary file, then atomic rename),
+    returns True on success
+    """
+    print(f"\n输出文件 Writing merged file: {output_path}")
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with profiling.span("write", engine="openpyxl") as record:
+            # 传入文件对象，临时文件名不必以 .xlsx 结尾 / A file object, so the temporary name needs no .xlsx suffix
+            with open(tmp_path, 'wb') as f, pd.ExcelWriter(f, engine='openpyxl') as writer:
+                for sname, df in dfs.items():
+                    df.to_excel(writer, sheet_name=sname, index=False)
+                    print(f"写入 sheet: {sname} ({df.shape[0]} 行 rows)")
+            os.replace(tmp_path, output_path)
+            record["rows"] = sum(len(df) for df in dfs.values())
+        print("合并成功 Merge succeeded!")
+        return True
+    except Exception as e:
+        print(f"合并失败 Merge failed: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+def fast_merge_workbook(files_to_keep, output_path):
+    """包级合并：直接复制工作表 XML，不解析单元格；不支持时返回 False
+    Package-level merge that copies the worksheet XML without parsing cells; returns False when unsupported
+    """
+    print(f"\n快速合并 Fast-merging into: {output_path}")
+    try:
+        with profiling.span("write", engine="fast-merge"):
+            merge_workbooks(files_to_keep, output_path)
+        print("合并成功 Merge succeeded!")
+        return True
+    except XlsxMergeUnsupported as e:
+        print(f"[WARN] 无法快速合并，改用 openpyxl 写出 Fast merge unsupported, falling back to openpyxl: {e}")
+    except Exception as e:
+        print(f"[WARN] 快速合并失败，改用 openpyxl 写出 Fast merge failed, falling back to openpyxl: {e}")
+    return False
+
+def combine_folder(item, folder_path, target_str, delete_others=False, write_output=True, use_cache=True,
+                   reader=None, fast_merge=False, read_frames=True, files_to_keep=None, overwrite=True):
+    """处理单个仓库文件夹 / Combine one warehouse folder
+
+    返回 (合并文件名, {sheet 名: DataFrame})，失败或跳过时返回 None。
+    write_output=False 时不写出合并工作簿，仅返回内存中的 DataFrame。
+    fast_merge=True 时在 xlsx 包级别合并（见 xlsx_merge），写出时无需解析单元格；不支持时自动退回 openpyxl。
+    read_frames=False 时只写出合并文件，不返回 DataFrame（快速合并时完全不解析源文件）。
+    Returns (merged file name, {sheet name: DataFrame}) or None when failed/skipped.
+    With write_output=False the merged workbook is not written; the frames are only returned in memory.
+    With fast_merge=True the workbook is merged at xlsx package level (see xlsx_merge) without parsing
+    cells, falling back to openpyxl when unsupported.
+    With read_frames=False only the merged workbook is written and no frames are returned
+    (a fast merge then never parses the source files).
+    files_to_keep 为已选好的源文件（由 plan_units 从文件清单中查出），此时不再列目录。
+    reader 见 read_source_files / reader: see read_source_files.
+    files_to_keep holds already selected source files (looked up in the file manifest by plan_units);
+    the folder is then not listed again.
+    overwrite 见 merged_output_path / overwrite: see merged_output_path.
+    """
+    with profiling.span("combine", warehouse=item, date=target_str):
+        print(f"\n处理子文件夹 Processing subfolder: {item} ({target_str})")
+        print(f"路径 Path: {folder_path}")
 
-        if args.delete_others:
-            print(f"已删除文件数 Files deleted: {deleted}")
+        if files_to_keep is None:
+            files_to_keep = select_source_files(folder_path, target_str, delete_others)
+        if files_to_keep is None:
+            return None
 
         # 检查是否缺少必须文件
         # Check if any required file is missing
         missing = [k for k, v in files_to_keep.items() if v is None]
         if missing:
             print(f"缺少文件 Missing files → {missing}，跳过此文件夹 Skip this folder.")
-            continue
+            return None
+
+        name = f"{item}{target_str}.xlsx"
+        if write_output:
+            output_path = merged_output_path(item, target_str, overwrite)
+            name = os.path.basename(output_path)
+            if not (fast_merge and fast_merge_workbook(files_to_keep, output_path)):
+                # 读取 Excel 文件并用 openpyxl 写出合并结果
+                # Read the Excel files and write the merged workbook with openpyxl
+                dfs = read_source_files(files_to_keep, use_cache)
+                if not dfs or not write_merged_workbook(dfs, output_path):
+                    return None
+                if reader is None:
+                    return name, dfs if read_frames else {}
+        else:
+            print("跳过写出合并文件 Merged workbook not written (in-memory mode).")
+
+        if not read_frames:
+            return name, {}
 
         # 读取 Excel 文件
         # Read Excel files
-        dfs = {}
-        for sheet_name, fpath in files_to_keep.items():
-            print(f"\n读取文件 Reading {sheet_name}: {os.path.basename(fpath)}")
-            try:
-                df = pd.read_excel(fpath)
-                print(f"读取成功 Read success: {df.shape[0]} 行 rows × {df.shape[1]} 列 cols")
-                dfs[sheet_name] = df
-            except Exception as e:
-                print(f"读取失败 Read failed: {e}")
-                dfs = {}
-                break
-
+        dfs = read_source_files(files_to_keep, use_cache, reader)
         if not dfs:
-            continue
+            return None
+        return name, dfs
+
+def combine_folder_name(item, folder_path, target_str, delete_others=False, write_output=True, use_cache=True,
+                        fast_merge=False, files_to_keep=None):
+    """合并单个文件夹，只返回合并文件名（供进程池使用，避免回传 DataFrame）
+    Combine one folder and return only the merged file name (pool-friendly, frames stay in the worker)
+    """
+    result = combine_folder(item, folder_path, target_str, delete_others, write_output, use_cache,
+                            fast_merge=fast_merge, read_frames=False, files_to_keep=files_to_keep)
+    return None if result is None else result[0]
+
+def plan_units(args, manifest=None):
+    """列出要处理的 (文件夹名, 文件夹路径, 日期, 预选源文件) 单元，按日期、文件夹排序
+    List the (folder name, folder path, date, preselected files) units to process, ordered by date then folder
+
+    源文件从文件清单中查找（见 file_manifest），不再逐个列目录；--delete-others 时预选源文件为 None，
+    由 combine_folder 列目录并删除其余文件。单日模式包含所有仓库，回填模式只包含至少有一个源文件的单元。
+    Source files are looked up in the file manifest (see file_manifest) instead of listing every folder;
+    with --delete-others the preselected files are None and combine_folder lists the folder and deletes the rest.
+    Single-day mode covers every warehouse, backfill mode only the units with at least one source file.
+    """
+    with profiling.span("discovery"):
+        folders = iter_warehouse_folders()
+        dates = resolve_date_range(args)
+        backfill = dates is not None
+        if not backfill:
+            dates = [resolve_target_date(args).strftime("%Y-%m-%d")]
+        if args.delete_others:
+            return [(item, folder_path, date, None) for date in dates for item, folder_path in folders]
+
+        manifest = manifest or file_manifest.refresh(PARENT_DIR)
+        found = file_manifest.source_files(manifest, dates, [item for item, _ in folders])
+        units = []
+        for date in dates:
+            for item, folder_path in folders:
+                files = found.get((item, date))
+                if files is None and backfill:
+                    continue
+                units.append((item, folder_path, date, files or dict.fromkeys(file_manifest.SOURCE_KINDS)))
+        if backfill:
+            print(f"回填 Backfill {dates[0]} → {dates[-1]}: {len(units)} 个单元 (warehouse, date) units")
+        return units
+
+def preflight(args):
+    """解析前检查每个仓库缺少的源文件，返回文件清单 / Check every warehouse for missing source files before parsing;
+    returns the file manifest
+    """
+    manifest = file_manifest.refresh(PARENT_DIR)
+    dates = resolve_date_range(args) or [resolve_target_date(args).strftime("%Y-%m-%d")]
+    file_manifest.preflight(manifest, dates, [item for item, _ in iter_warehouse_folders()], args.check_headers)
+    return manifest
+
+def main(argv=None, write_output=True):
+    """主程序入口 / Main entry point
+
+    返回 {(文件夹名, 日期): 合并文件名}（仅包含成功合并的单元）。
+    Returns {(folder name, date): merged file name} for the units that were combined.
+    """
+    args = parse_args(argv)
+    profiling.configure(args.profile, args.profile_file, args.quiet)
+    readers.configure(args.reader)
+    sku_master.configure(args.dimensions)
+    distributions.configure(args.distributions, args.top_k)
+    sheet_ranges.configure(args.sheet_workers)
+    intraday.configure(args.intraday)
+    dates = resolve_date_range(args)
+    if dates is None:
+        target_label = resolve_target_date(args).strftime("%Y-%m-%d")
+    else:
+        target_label = f"{dates[0]} → {dates[-1]}"
+    workers = resolve_workers(args.workers)
 
-        # 生成输出文件路径（如重名则自动编号）
-        # Generate output file path (auto-increment if exists)
-        output_dir = folder_path if SAVE_TO_ORIGIN else OUTPUT_BASE_DIR
-        base_name = f"{item}{target_str}.xlsx"
-        output_path = os.path.join(output_dir, base_name)
-        if os.path.exists(output_path):
-            idx = 1
-            while True:
-                candidate = os.path.join(output_dir, f"{item}{target_str}({idx}).xlsx")
-                if not os.path.exists(candidate):
-                    output_path = candidate
-                    break
-                idx += 1
-
-        # 写入合并结果
-        # Write merged workbook
-        print(f"\n输出文件 Writing merged file: {output_path}")
-        try:
-            with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                for sname, df in dfs.items():
-                    df.to_excel(writer, sheet_name=sname, index=False)
-                    print(f"写入 sheet: {sname} ({df.shape[0]} 行 rows)")
-            print("合并成功 Merge succeeded!")
-            success += 1
-        except Exception as e:
-            print(f"合并失败 Merge failed: {e}")
+    print("\n" + "="*70)
+    print(f"开始执行 - 目标日期 Target date: {target_label}")
+    print(f"脚本所在目录 Parent directory: {PARENT_DIR}")
+    print(f"是否保存到原文件夹 Save to original folder: {SAVE_TO_ORIGIN}")
+    print(f"删除非匹配文件 Delete non-matching files: {args.delete_others}")
+    print(f"并行进程数 Workers: {workers}")
+    print(f"解析缓存 Parse cache: {not args.no_cache}")
+    print(f"快速合并 Fast merge: {args.fast_merge}")
+    if not SAVE_TO_ORIGIN and write_output:
+        os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
+        print(f"统一输出目录 Unified output directory: {OUTPUT_BASE_DIR}")
+    print("="*70 + "\n")
+
+    # 遍历父目录下的所有子文件夹（回填模式下为每个 (文件夹, 日期) 单元）
+    # Iterate through all subfolders in the parent directory (every (folder, date) unit in backfill mode)
+    manifest = preflight(args)
+    units = plan_units(args, manifest)
+    tasks = [
+        (item, folder_path, date, args.delete_others, write_output, not args.no_cache, args.fast_merge, files)
+        for item, folder_path, date, files in units
+    ]
+    names = run_units(combine_folder_name, tasks, workers)
+    combined = {(item, date): name for (item, _, date, _), name in zip(units, names) if name is not None}
+
+    processed = len(units)     # 处理的单元数量 / Number of units processed
+    success = len(combined)    # 成功合并数量 / Successfully merged units count
 
     # 汇总总结
     # Summary
@@ -264,6 +632,7 @@ def main():
     print(f"成功合并 Successfully merged: {success}")
     print(f"失败或跳过 Failed or skipped: {processed - success}")
     print("="*70)
+    return combined
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+日期参数解析 / Date argument parsing
+
+功能说明 Function Description:
+-------------------------------------
+- 各脚本的 YYYY-MM-DD 日期参数统一由 coerce_date 解析；本模块只依赖标准库，
+  导入它不会连带载入合并、读取和指标模块
+  Every script parses its YYYY-MM-DD date arguments with coerce_date; this module only depends on the
+  standard library, so importing it does not pull in the merge, reader and metric modules.
+"""
+
+from datetime import datetime, date
+
+# ==================== 配置区 Configuration Area ====================
+
+# 日期参数格式 / Date argument format
+DATE_FORMAT = "%Y-%m-%d"
+
+# ===============================================================
+
+
+def coerce_date(date_str: str) -> date:
+    """验证并转换日期格式 / Validate and convert a string to date format"""
+    try:
+        return datetime.strptime(date_str, DATE_FORMAT).date()
+    except ValueError as e:
+        raise ValueError(f"日期格式错误 Invalid date '{date_str}'. 期望格式 Expected format: YYYY-MM-DD.") from e
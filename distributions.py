@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Top-K 与分布指标 / Top-K and distribution metrics
+
+功能说明 Function Description:
+-------------------------------------
+- --distributions 打开后，指标计算读取每个 sheet 时在同一次扫描中顺带按键汇总（见 DISTRIBUTIONS）：
+  出库量前 N 的 SKU、在库体积前 N 的 SKU、每个出库订单的行数分布
+  With --distributions, the metrics pass also totals every sheet per key in the same scan (see
+  DISTRIBUTIONS): the top SKUs by outbound units, the top SKUs by inventory volume and the distribution of
+  lines per outbound order.
+- 每批数据用 np.unique + np.bincount 按键求和（流式读取时逐批合并），前 N 用 np.argpartition 部分排序选出，
+  分布为每个订单行数的 bincount 直方图；不需要第二次读取，也没有逐行 Python 循环
+  Every block is totalled per key with np.unique + np.bincount (merged block by block when streaming); the
+  top N are picked with an np.argpartition partial sort and the distribution is a bincount histogram of
+  the lines per order; no second read and no per-row Python loop.
+- 每个仓库每天的按键合计保存在指标库（warehouse_metrics.db）的 distribution_totals 表中，逐行结果另存为
+  distributions_<日期>.csv；generate_weekly_report --distributions 可在周报中附上任意日期范围的结果
+  （流量按天相加，存量取每个仓库最后一天）
+  The per-key totals of every warehouse and day are kept in the distribution_totals table of the metrics
+  store (warehouse_metrics.db) and written to distributions_<date>.csv; generate_weekly_report
+  --distributions appends them to the report for any date range (flows added over the days, stocks from
+  each warehouse's last day).
+"""
+
+import os
+import zlib
+import sqlite3
+import numpy as np
+import pandas as pd
+
+import metrics_store
+import id_dictionary
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 环境变量：是否计算分布、前 N 的 N / Environment variables: distributions on, N of the top N
+ENABLED_ENV = "WARELYTIC_DISTRIBUTIONS"
+TOP_K_ENV = "WARELYTIC_TOP_K"
+
+# 默认输出前 N 个 SKU / Top N SKUs written by default
+TOP_K = 10
+
+# 汇总行中携带按键合计的键（不写入 CSV） / Summary row key carrying the per-key totals (never written to the CSV)
+DISTRIBUTIONS_KEY = '_distributions'
+
+# 每个分布声明所在 sheet、按哪个字段分组（key）、累加什么（weight）和类型：
+#   'top'       按键求和后取前 N（weight: 'qty' = 数量，'volume' = 单件体积 × 数量 / divisor，见 inv_total_volume_m3）
+#   'histogram' 每个键的行数的分布（如每个订单的行数）
+# span 与 metrics_store.METRICS 相同：flow = 日期范围内按天相加，stock = 取最后一天
+# Each distribution declares its sheet, the field it groups by (key), what it adds up (weight) and its kind:
+#   'top'       totals per key, then the top N (weight: 'qty' = quantity, 'volume' = unit volume × qty / divisor,
+#               see inv_total_volume_m3)
+#   'histogram' distribution of the number of rows per key (e.g. lines per order)
+# span as in metrics_store.METRICS: flow = added over the days of a range, stock = the last day
+DISTRIBUTIONS = {
+    'ob_top_sku_units': {
+        'label': '出库量前N的SKU / ob_top_sku_units', 'sheet': 'Outbound', 'kind': 'top',
+        'key': 'sku', 'weight': 'qty', 'span': 'flow',
+    },
+    'inv_top_sku_volume_m3': {
+        'label': '在库体积前N的SKU(m³) / inv_top_sku_volume_m3', 'sheet': 'Inventory', 'kind': 'top',
+        'key': 'sku', 'weight': 'volume', 'divisor': 1_000_000, 'span': 'stock',
+    },
+    'ob_lines_per_order': {
+        'label': '出库订单行数分布 / ob_lines_per_order', 'sheet': 'Outbound', 'kind': 'histogram',
+        'key': 'order', 'span': 'flow',
+    },
+}
+
+# 输出列 / Output columns
+DATE_COL = '日期 / Date'
+NAME_COL = '分布 / Distribution'
+RANK_COL = '排名 / Rank'
+KEY_COL = '键 / Key'
+VALUE_COL = '值 / Value'
+
+# ===============================================================
+
+
+def configure(enabled=None, top_k=None):
+    """设置 --distributions 和 --top-k / Apply --distributions and --top-k"""
+    if enabled:
+        os.environ[ENABLED_ENV] = "1"
+    if top_k:
+        os.environ[TOP_K_ENV] = str(int(top_k))
+
+
+def configure_from_argv(argv):
+    """按 sys.argv 风格的参数列表配置 / Configure from a sys.argv style argument list"""
+    top_k = None
+    if "--top-k" in argv:
+        idx = argv.index("--top-k")
+        top_k = argv[idx + 1] if idx + 1 < len(argv) else None
+    configure("--distributions" in argv, top_k)
+
+
+def enabled():
+    """是否计算分布 / Whether the distributions are computed"""
+    return os.environ.get(ENABLED_ENV) == "1"
+
+
+def top_k():
+    """前 N 的 N / N of the top N"""
+    return int(os.environ.get(TOP_K_ENV) or TOP_K)
+
+
+def sheet_distributions(sheet_name):
+    """某个 sheet 上要计算的分布（未打开时为空） / Distributions to compute on one sheet (none when switched off)"""
+    if not enabled():
+        return []
+    return [name for name, spec in DISTRIBUTIONS.items() if spec['sheet'] == sheet_name]
+
+
+def connect(db_path=None):
+    """打开指标库并确保分布表存在 / Open the metrics store and make sure the distribution table exists"""
+    conn = sqlite3.connect(db_path or metrics_store.DB_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS distribution_totals ("
+        "warehouse TEXT NOT NULL, date TEXT NOT NULL, name TEXT NOT NULL, n INTEGER, keys BLOB, vals BLOB, "
+        "PRIMARY KEY (warehouse, date, name))"
+    )
+    return conn
+
+
+# -------------------- 按键合计 Per-key totals --------------------
+
+def totals_by_key(keys, weights=None):
+    """按键求和 → {'key': 排序后的键, 'value': 合计}；weights 为 None 时计行数
+    Totals per key → {'key': sorted keys, 'value': totals}; counts rows when weights is None
+    """
+    key, inverse = np.unique(np.asarray(keys), return_inverse=True)
+    return {'key': key, 'value': np.bincount(inverse, weights=weights, minlength=key.size).astype(np.float64)}
+
+
+def merge_totals(parts):
+    """合并多批（多天、多个仓库）的按键合计 / Merge the per-key totals of several blocks (days, warehouses)"""
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return totals_by_key(np.concatenate([p['key'] for p in parts]), np.concatenate([p['value'] for p in parts]))
+
+
+def fold_block(names, block):
+    """一批数据 → {分布名: 按键合计}；block 为 process_merged_files.prepare_block 处理过的 {字段: Series}
+    A block → {distribution name: per-key totals}; block is {field: Series} as prepared by
+    process_merged_files.prepare_block
+
+    缺少字段的分布跳过；空白键（NA 编码）不计，空白数量按 0 计。
+    Distributions with missing fields are skipped; blank keys (the NA code) are dropped, blank quantities count as 0.
+    """
+    parts = {}
+    for name in names:
+        spec = DISTRIBUTIONS[name]
+        needed = [spec['key']] + {'qty': ['qty'], 'volume': ['qty', 'unit_volume']}.get(spec.get('weight'), [])
+        if not all(f in block for f in needed):
+            continue
+        keys = np.asarray(block[spec['key']])
+        keep = keys != id_dictionary.NA_CODE
+        weights = None
+        if spec.get('weight'):
+            weights = pd.to_numeric(block['qty'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+            if spec['weight'] == 'volume':
+                weights = np.asarray(block['unit_volume'], dtype=np.float64) / spec['divisor'] * weights
+            weights = weights[keep]
+        parts[name] = totals_by_key(keys[keep], weights)
+    return parts
+
+
+def merge_parts(blocks):
+    """合并 fold_block 的结果列表 / Merge a list of fold_block results"""
+    names = dict.fromkeys(name for parts in blocks for name in parts)
+    return {name: merge_totals([parts.get(name) for parts in blocks]) for name in names}
+
+
+# -------------------- 结果 Results --------------------
+
+def top_rows(totals, k):
+    """按合计取前 k 个键（argpartition 部分排序，再只对这 k 个排序），返回 (键, 值)
+    The k keys with the largest totals (an argpartition partial sort, then only those k are sorted), as (keys, values)
+    """
+    values = totals['value']
+    if values.size > k:
+        picked = np.argpartition(-values, k - 1)[:k]
+    else:
+        picked = np.arange(values.size)
+    # 值相同按键排序，结果确定 / Ties ordered by key for a deterministic result
+    picked = picked[np.lexsort((totals['key'][picked], -values[picked]))]
+    return totals['key'][picked], values[picked]
+
+
+def histogram(totals):
+    """每个键的行数 → 直方图 (行数, 键的个数) / Rows per key → histogram (row count, number of keys)"""
+    counts = np.bincount(totals['value'].astype(np.int64))
+    buckets = np.flatnonzero(counts)
+    return buckets, counts[buckets].astype(np.float64)
+
+
+def result_rows(name, totals, k=None, db_path=None):
+    """一个分布的输出行 [{排名, 键, 值}]；top 的键解码为 SKU，histogram 的键为每个订单的行数
+    Output rows of one distribution [{rank, key, value}]; top keys are decoded to SKUs, histogram keys are
+    the lines per order
+    """
+    spec = DISTRIBUTIONS[name]
+    if totals is None or not totals['key'].size:
+        return []
+    if spec['kind'] == 'top':
+        keys, values = top_rows(totals, k or top_k())
+        keys = id_dictionary.decode(spec['key'], keys, db_path)
+    else:
+        keys, values = histogram(totals)
+    return [{RANK_COL: i, KEY_COL: key, VALUE_COL: value} for i, (key, value) in enumerate(zip(keys, values), 1)]
+
+
+def details(dated_results, db_path=None):
+    """每个仓库每天每个分布的输出行（DataFrame，可能为空） / Output rows of every warehouse, day and distribution
+    (a DataFrame, possibly empty)
+    """
+    rows = []
+    for date, row in dated_results:
+        for name, totals in row.get(DISTRIBUTIONS_KEY, {}).items():
+            rows += [{DATE_COL: date, metrics_store.WAREHOUSE_COL: row[metrics_store.WAREHOUSE_COL],
+                      NAME_COL: DISTRIBUTIONS[name]['label'], **r} for r in result_rows(name, totals, db_path=db_path)]
+    return pd.DataFrame(rows)
+
+
+def save_details(label, dated_results):
+    """保存 distributions_<label>.csv（没有分布时不写） / Save distributions_<label>.csv (nothing is written without
+    distributions)
+    """
+    df = details(dated_results)
+    if df.empty:
+        return None
+    csv_path = os.path.join(PARENT_DIR, f"distributions_{label}.csv")
+    df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+    print(f"已保存 Top-K 与分布 Distributions saved: {csv_path} ({len(df)} rows)")
+    return csv_path
+
+
+# -------------------- 指标库 Metrics store --------------------
+
+def store_day(date, rows, db_path=None):
+    """保存某一天各仓库的按键合计（键差分后压缩，合计按 float64 压缩）
+    Store the day's per-key totals of every warehouse (keys delta-encoded, totals as float64, zlib-compressed)
+    """
+    params = [
+        (row[metrics_store.WAREHOUSE_COL], str(date), name, int(totals['key'].size),
+         metrics_store.encode_ids(totals['key']), zlib.compress(totals['value'].astype('<f8').tobytes(), 6))
+        for row in rows for name, totals in row.get(DISTRIBUTIONS_KEY, {}).items() if totals is not None
+    ]
+    if not params:
+        return
+    with connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO distribution_totals (warehouse, date, name, n, keys, vals) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (warehouse, date, name) DO UPDATE SET n = excluded.n, keys = excluded.keys, "
+            "vals = excluded.vals",
+            params,
+        )
+    conn.close()
+
+
+def load_range(name, start, end, warehouses=None, db_path=None):
+    """日期范围内、仓库子集上一个分布的按键合计；flow 按天相加，stock 取每个仓库最后一天；无数据时为 None
+    Per-key totals of one distribution over a date range and a warehouse subset; flows are added over the
+    days, stocks use each warehouse's last day; None without data
+    """
+    if not os.path.exists(db_path or metrics_store.DB_PATH):
+        return None
+    sql = "SELECT warehouse, date, keys, vals FROM distribution_totals WHERE name = ? AND date BETWEEN ? AND ?"
+    params = [name, str(start), str(end)]
+    if warehouses:
+        sql += f" AND warehouse IN ({', '.join('?' * len(warehouses))})"
+        params += list(warehouses)
+    conn = connect(db_path)
+    try:
+        found = conn.execute(sql + " ORDER BY date", params).fetchall()
+    finally:
+        conn.close()
+    if DISTRIBUTIONS[name]['span'] == 'stock':
+        # 按日期排序后每个仓库最后一行即最后一天 / Ordered by date, the last row per warehouse is its last day
+        found = list({warehouse: (warehouse, date, keys, vals) for warehouse, date, keys, vals in found}.values())
+    return merge_totals([
+        {'key': metrics_store.decode_ids(keys), 'value': np.frombuffer(zlib.decompress(vals), dtype='<f8')}
+        for _, _, keys, vals in found
+    ])
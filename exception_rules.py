@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+异常检测规则 / Exception detection rules
+
+功能说明 Function Description:
+-------------------------------------
+- 规则是声明式的（见 RULES）：每条规则声明所在 sheet、检查方式和用到的字段；指标计算读取每个 sheet 时在同一批
+  数据上顺带求值（流式读取时逐批合并），不再读取文件
+  Rules are declarative (see RULES): each one declares its sheet, its check and the fields it uses; the
+  metrics pass evaluates them on the same blocks it already reads (merged block by block when streaming),
+  so no file is read again.
+- 检查都是整列的向量化运算：数量为空或非数字、数量为负、尺寸缺失或为 0、尺寸超过 MAX_DIMENSION_MM、
+  同一订单同一 SKU 的重复行（订单和 SKU 编码合成一个 int64 键后按键计数）；没有逐行 Python 循环
+  Every check is a whole-column vectorized operation: blank or non-numeric quantities, negative
+  quantities, missing or zero dimensions, dimensions above MAX_DIMENSION_MM, and repeated lines of the same
+  order and SKU (order and SKU codes packed into one int64 key and counted per key); no per-row Python loop.
+- 入库验收量异常（above_norm）需要历史：计算时只按 SKU 汇总当天验收量，写汇总时与该仓库前 NORM_DAYS 天
+  的按 SKU 验收量比较（回填时同批中较早的日期直接参与），当天验收量超过历史日均 NORM_FACTOR 倍的 SKU 计为异常
+  The inbound receiving check (above_norm) needs history: the pass only totals the day's receiving qty per
+  SKU, and when the summary is written it is compared with the warehouse's per-SKU receiving of the previous
+  NORM_DAYS days (earlier dates of the same backfill batch take part directly); SKUs received at more than
+  NORM_FACTOR times their historical daily average are exceptions.
+- 每个仓库每天每条规则的异常数和最多 SAMPLE_LIMIT 个样例（SKU 或订单号）保存在指标库（warehouse_metrics.db）的
+  exception_counts 表中，并另存为 exceptions_<日期>.csv；generate_weekly_report 用它填写“主要异常”一节
+  （库存规则取每个仓库最后一天，其余按天相加）
+  The count and up to SAMPLE_LIMIT samples (SKUs or order numbers) of every rule, warehouse and day are kept
+  in the exception_counts table of the metrics store (warehouse_metrics.db) and written to
+  exceptions_<date>.csv; generate_weekly_report fills its "Major Exceptions" section from them (inventory
+  rules from each warehouse's last day, the others added over the days).
+"""
+
+import os
+import json
+import zlib
+import sqlite3
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+import metrics_store
+import id_dictionary
+import distributions
+from dates import coerce_date
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 汇总行中携带规则结果的键（不写入 CSV） / Summary row key carrying the rule results (never written to the CSV)
+EXCEPTIONS_KEY = '_exceptions'
+
+# 每条规则每个仓库每天保留的样例数 / Samples kept per rule, warehouse and day
+SAMPLE_LIMIT = 5
+
+# 合理尺寸上限（mm，与尺寸列单位一致） / Largest plausible dimension (mm, the unit of the dimension columns)
+MAX_DIMENSION_MM = 6000
+
+# 入库验收量历史：比较前多少天、SKU 至少有几天历史、超过历史日均多少倍
+# Receiving history: days compared, least days of history per SKU, multiple of the historical daily average
+NORM_DAYS = 28
+NORM_MIN_DAYS = 3
+NORM_FACTOR = 5
+
+# 每条规则声明所在 sheet、检查方式（check）、检查的字段和样例取哪个字段（sample）：
+#   'not_number'  值为空或不是数字
+#   'negative'    值小于 0
+#   'not_positive' 任一字段为空、非数字或不大于 0
+#   'above'       任一字段大于 limit
+#   'duplicate'   所有字段都相同的行出现多次（每组多出的行计为异常）
+#   'above_norm'  按 SKU 汇总的数量超过历史日均 NORM_FACTOR 倍（写汇总时求值）
+# span 与 distributions.DISTRIBUTIONS 相同：flow = 日期范围内按天相加，stock = 取最后一天
+# Each rule declares its sheet, its check, the fields checked and the field its samples come from:
+#   'not_number'   blank or not a number
+#   'negative'     below 0
+#   'not_positive' any field blank, non-numeric or not above 0
+#   'above'        any field above limit
+#   'duplicate'    rows equal on every field occurring more than once (each extra row is an exception)
+#   'above_norm'   per-SKU quantity above NORM_FACTOR times the historical daily average (evaluated at summary time)
+# span as in distributions.DISTRIBUTIONS: flow = added over the days of a range, stock = the last day
+RULES = {
+    'inv_qty_invalid': {
+        'label': '库存数量为空或非数字 / Inventory qty blank or non-numeric', 'sheet': 'Inventory',
+        'check': 'not_number', 'fields': ['qty'], 'sample': 'sku', 'span': 'stock',
+    },
+    'inv_qty_negative': {
+        'label': '库存数量为负 / Negative inventory qty', 'sheet': 'Inventory',
+        'check': 'negative', 'fields': ['qty'], 'sample': 'sku', 'span': 'stock',
+    },
+    'inv_dimensions_missing': {
+        'label': '库存行尺寸缺失 / Inventory lines missing L/W/H', 'sheet': 'Inventory',
+        'check': 'not_positive', 'fields': ['length', 'width', 'height'], 'sample': 'sku', 'span': 'stock',
+    },
+    'inv_dimensions_implausible': {
+        'label': '库存行尺寸异常 / Inventory lines with implausible L/W/H', 'sheet': 'Inventory',
+        'check': 'above', 'limit': MAX_DIMENSION_MM, 'fields': ['length', 'width', 'height'], 'sample': 'sku',
+        'span': 'stock',
+    },
+    'ib_qty_invalid': {
+        'label': '验收量为空或非数字 / Receiving qty blank or non-numeric', 'sheet': 'Inbound',
+        'check': 'not_number', 'fields': ['qty'], 'sample': 'sku', 'span': 'flow',
+    },
+    'ib_qty_negative': {
+        'label': '验收量为负 / Negative receiving qty', 'sheet': 'Inbound',
+        'check': 'negative', 'fields': ['qty'], 'sample': 'sku', 'span': 'flow',
+    },
+    'ib_qty_above_norm': {
+        'label': '验收量远高于历史 / Receiving far above the historical norm', 'sheet': 'Inbound',
+        'check': 'above_norm', 'fields': ['sku', 'qty'], 'sample': 'sku', 'span': 'flow',
+    },
+    'ib_duplicate_lines': {
+        'label': '入库重复行 / Duplicate inbound lines', 'sheet': 'Inbound',
+        'check': 'duplicate', 'fields': ['order', 'sku'], 'sample': 'order', 'span': 'flow',
+    },
+    'ob_qty_invalid': {
+        'label': '复核数量为空或非数字 / Rechecked qty blank or non-numeric', 'sheet': 'Outbound',
+        'check': 'not_number', 'fields': ['qty'], 'sample': 'order', 'span': 'flow',
+    },
+    'ob_qty_negative': {
+        'label': '复核数量为负 / Negative rechecked qty', 'sheet': 'Outbound',
+        'check': 'negative', 'fields': ['qty'], 'sample': 'order', 'span': 'flow',
+    },
+    'ob_duplicate_lines': {
+        'label': '出库重复行 / Duplicate outbound lines', 'sheet': 'Outbound',
+        'check': 'duplicate', 'fields': ['order', 'sku'], 'sample': 'order', 'span': 'flow',
+    },
+}
+
+# 输出列 / Output columns
+DATE_COL = '日期 / Date'
+RULE_COL = '规则 / Rule'
+COUNT_COL = '异常数 / Count'
+SAMPLES_COL = '样例 / Samples'
+
+# ===============================================================
+
+
+def sheet_rules(sheet_name):
+    """某个 sheet 上的规则 / Rules of one sheet"""
+    return [name for name, spec in RULES.items() if spec['sheet'] == sheet_name]
+
+
+def rule_fields(name):
+    """规则用到的字段（含样例字段） / Fields a rule uses (including its sample field)"""
+    spec = RULES[name]
+    return list(dict.fromkeys(spec['fields'] + [spec['sample']]))
+
+
+def connect(db_path=None):
+    """打开指标库并确保异常表和入库历史表存在 / Open the metrics store and make sure the exception and receiving
+    history tables exist
+    """
+    conn = sqlite3.connect(db_path or metrics_store.DB_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS exception_counts ("
+        "warehouse TEXT NOT NULL, date TEXT NOT NULL, rule TEXT NOT NULL, count INTEGER, samples TEXT, "
+        "PRIMARY KEY (warehouse, date, rule))"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS receiving_history ("
+        "warehouse TEXT NOT NULL, date TEXT NOT NULL, n INTEGER, keys BLOB, vals BLOB, "
+        "PRIMARY KEY (warehouse, date))"
+    )
+    return conn
+
+
+# -------------------- 逐批求值 Block evaluation --------------------
+
+_NO_SAMPLES = np.empty(0, dtype=id_dictionary.CODE_DTYPE)
+
+
+def _first_samples(codes, limit=SAMPLE_LIMIT):
+    """前 limit 个不同的非空编码（保持出现顺序） / The first limit distinct non-blank codes (in order of appearance)"""
+    codes = pd.unique(np.asarray(codes))
+    return codes[codes != id_dictionary.NA_CODE][:limit]
+
+
+def evaluate(names, block):
+    """一批数据 → {规则名: 部分结果}；block 为 process_merged_files.prepare_block 处理过的 {字段: Series}
+    A block → {rule name: partial result}; block is {field: Series} as prepared by process_merged_files.prepare_block
+
+    逐行规则得到 {'count', 'samples'}，duplicate 和 above_norm 得到按键合计 {'totals'}（见 distributions.totals_by_key），
+    由 merge_parts / finish 跨批合并；缺少字段的规则跳过。同一批数据中每个字段只转换一次数值。
+    Row rules give {'count', 'samples'}, duplicate and above_norm give per-key totals {'totals'} (see
+    distributions.totals_by_key), merged across blocks by merge_parts / finish; rules with missing fields are
+    skipped. Each field is converted to numbers once per block.
+    """
+    numeric = {}
+
+    def num(field):
+        if field not in numeric:
+            numeric[field] = pd.to_numeric(block[field], errors='coerce').to_numpy(dtype=np.float64)
+        return numeric[field]
+
+    parts = {}
+    for name in names:
+        spec = RULES[name]
+        if not all(f in block for f in spec['fields']):
+            continue
+        check = spec['check']
+        if check == 'duplicate':
+            first, second = (np.asarray(block[f]).astype(np.int64) for f in spec['fields'])
+            keep = first != id_dictionary.NA_CODE
+            keys = (first[keep] << 32) | (second[keep] & 0xFFFFFFFF)
+            parts[name] = {'totals': distributions.totals_by_key(keys)}
+            continue
+        if check == 'above_norm':
+            keys = np.asarray(block['sku'])
+            keep = keys != id_dictionary.NA_CODE
+            parts[name] = {'totals': distributions.totals_by_key(keys[keep], np.nan_to_num(num('qty')[keep]))}
+            continue
+        values = [num(f) for f in spec['fields']]
+        if check == 'not_number':
+            mask = np.logical_or.reduce([np.isnan(v) for v in values])
+        elif check == 'negative':
+            mask = np.logical_or.reduce([v < 0 for v in values])
+        elif check == 'not_positive':
+            mask = np.logical_or.reduce([~(v > 0) for v in values])
+        else:
+            mask = np.logical_or.reduce([v > spec['limit'] for v in values])
+        samples = np.asarray(block[spec['sample']])[mask] if spec['sample'] in block else _NO_SAMPLES
+        parts[name] = {'count': int(mask.sum()), 'samples': _first_samples(samples)}
+    return parts
+
+
+def merge_parts(blocks):
+    """合并 evaluate 的结果列表 / Merge a list of evaluate results"""
+    merged = {}
+    for parts in blocks:
+        for name, part in parts.items():
+            prev = merged.get(name)
+            if prev is None:
+                merged[name] = part
+            elif 'totals' in part:
+                merged[name] = {'totals': distributions.merge_totals([prev['totals'], part['totals']])}
+            else:
+                merged[name] = {'count': prev['count'] + part['count'],
+                                'samples': _first_samples(np.concatenate([prev['samples'], part['samples']]))}
+    return merged
+
+
+def finish(parts):
+    """部分结果 → 每条规则的 {'count', 'samples'}；above_norm 保留按 SKU 合计，写汇总时由 apply_norms 求值
+    Partial results → {'count', 'samples'} per rule; above_norm keeps its per-SKU totals until apply_norms
+    evaluates it at summary time
+    """
+    results = {}
+    for name, part in parts.items():
+        if RULES[name]['check'] == 'duplicate':
+            totals = part['totals']
+            repeated = totals['value'] > 1
+            results[name] = {'count': int((totals['value'][repeated] - 1).sum()),
+                             'samples': _first_samples((totals['key'][repeated] >> 32).astype(id_dictionary.CODE_DTYPE))}
+        else:
+            results[name] = part
+    return results
+
+
+# -------------------- 历史比较 History comparison --------------------
+
+def _decode_totals(keys, vals):
+    return {'key': metrics_store.decode_ids(keys), 'value': np.frombuffer(zlib.decompress(vals), dtype='<f8')}
+
+
+def load_history(warehouse, date, db_path=None):
+    """该仓库 date 之前 NORM_DAYS 天的按 SKU 验收量 {日期: 按键合计} / The warehouse's per-SKU receiving of the
+    NORM_DAYS days before date {date: per-key totals}
+    """
+    if not os.path.exists(db_path or metrics_store.DB_PATH):
+        return {}
+    start = coerce_date(date) - timedelta(days=NORM_DAYS)
+    conn = connect(db_path)
+    try:
+        found = conn.execute(
+            "SELECT date, keys, vals FROM receiving_history WHERE warehouse = ? AND date >= ? AND date < ?",
+            (warehouse, str(start), str(date)),
+        ).fetchall()
+    finally:
+        conn.close()
+    return {d: _decode_totals(keys, vals) for d, keys, vals in found}
+
+
+def above_norm(today, history):
+    """当天按 SKU 合计中超过历史日均 NORM_FACTOR 倍的 SKU → {'count', 'samples'}（样例按倍数从高到低）
+    SKUs of the day's per-SKU totals above NORM_FACTOR times their historical daily average → {'count',
+    'samples'} (samples by ratio, highest first)
+
+    历史日均 = 该 SKU 有验收的日子的合计 / 天数；历史不足 NORM_MIN_DAYS 天的 SKU 不比较。
+    Historical daily average = the SKU's total over the days it was received / those days; SKUs with fewer
+    than NORM_MIN_DAYS days of history are not compared.
+    """
+    days = [h for h in history.values() if h['key'].size]
+    if not days or not today['key'].size:
+        return {'count': 0, 'samples': _NO_SAMPLES}
+    sums = distributions.merge_totals(days)
+    seen = distributions.totals_by_key(np.concatenate([h['key'] for h in days]))
+    pos = np.minimum(np.searchsorted(sums['key'], today['key']), sums['key'].size - 1)
+    known = sums['key'][pos] == today['key']
+    mean = np.where(known, sums['value'][pos] / np.maximum(seen['value'][pos], 1), 0.0)
+    flagged = known & (seen['value'][pos] >= NORM_MIN_DAYS) & (mean > 0) & (today['value'] > NORM_FACTOR * mean)
+    ratio = np.where(flagged, today['value'] / np.where(mean > 0, mean, 1), 0.0)
+    order = np.argsort(-ratio[flagged], kind='stable')
+    return {'count': int(flagged.sum()), 'samples': today['key'][flagged][order][:SAMPLE_LIMIT]}
+
+
+def apply_norms(dated_results, db_path=None):
+    """为带按 SKU 验收量的汇总行求值 above_norm 规则 / Evaluate the above_norm rules of every summary row holding
+    per-SKU receiving totals
+
+    dated_results 为按日期排序的 [(日期, 汇总行)]；回填时同批中较早的日期直接作为历史，其余从指标库读取。
+    dated_results is [(date, summary row)] ordered by date; in a backfill earlier dates of the same batch
+    serve as history directly, the rest comes from the metrics store.
+    """
+    batch = {}
+    for date, row in dated_results:
+        found = row.get(EXCEPTIONS_KEY) or {}
+        warehouse = row[metrics_store.WAREHOUSE_COL]
+        for name, result in found.items():
+            if RULES[name]['check'] != 'above_norm' or 'totals' not in result:
+                continue
+            history = load_history(warehouse, date, db_path)
+            start = str(coerce_date(date) - timedelta(days=NORM_DAYS))
+            history.update({d: t for (w, d), t in batch.items() if w == warehouse and start <= d < str(date)})
+            result.update(above_norm(result['totals'], history))
+            batch[(warehouse, str(date))] = result['totals']
+
+
+# -------------------- 结果 Results --------------------
+
+def _sample_names(found_rows, db_path=None):
+    """所有样例编码一次解码 {样例字段: {编码: 原始值}} / Decode every sample code at once {sample field: {code: value}}"""
+    codes = {}
+    for found in found_rows:
+        for name, result in found.items():
+            if 'count' in result:
+                codes.setdefault(RULES[name]['sample'], []).append(np.asarray(result['samples'], dtype=np.int64))
+    names = {}
+    for kind, parts in codes.items():
+        unique = np.unique(np.concatenate(parts))
+        names[kind] = dict(zip(unique.tolist(), id_dictionary.decode(kind, unique, db_path)))
+    return names
+
+
+def _samples(name, result, names):
+    kind = RULES[name]['sample']
+    return [names[kind][c] for c in np.asarray(result['samples'], dtype=np.int64).tolist()]
+
+
+def details(dated_results, db_path=None):
+    """每个仓库每天每条规则的异常数和样例（DataFrame，可能为空） / Count and samples of every warehouse, day and
+    rule (a DataFrame, possibly empty)
+    """
+    names = _sample_names([row.get(EXCEPTIONS_KEY) or {} for _, row in dated_results], db_path)
+    rows = []
+    for date, row in dated_results:
+        for name, result in (row.get(EXCEPTIONS_KEY) or {}).items():
+            if 'count' not in result:
+                continue
+            rows.append({DATE_COL: date, metrics_store.WAREHOUSE_COL: row[metrics_store.WAREHOUSE_COL],
+                         RULE_COL: RULES[name]['label'], COUNT_COL: result['count'],
+                         SAMPLES_COL: ', '.join(_samples(name, result, names))})
+    return pd.DataFrame(rows)
+
+
+def save_details(label, dated_results):
+    """保存 exceptions_<label>.csv（没有规则结果时不写） / Save exceptions_<label>.csv (nothing is written without
+    rule results)
+    """
+    df = details(dated_results)
+    if df.empty:
+        return None
+    csv_path = os.path.join(PARENT_DIR, f"exceptions_{label}.csv")
+    df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+    print(f"已保存异常明细 Exceptions saved: {csv_path} ({int(df[COUNT_COL].sum())} exceptions)")
+    return csv_path
+
+
+# -------------------- 指标库 Metrics store --------------------
+
+def store_day(date, rows, db_path=None):
+    """保存某一天各仓库的规则结果和按 SKU 验收量（替换该仓库当天原有的结果）
+    Store the day's rule results and per-SKU receiving totals of every warehouse (replacing the warehouse's
+    earlier results for the day)
+    """
+    names = _sample_names([row.get(EXCEPTIONS_KEY) or {} for row in rows], db_path)
+    counts, history = [], []
+    for row in rows:
+        found = row.get(EXCEPTIONS_KEY)
+        if not found:
+            continue
+        warehouse = row[metrics_store.WAREHOUSE_COL]
+        for name, result in found.items():
+            if 'count' in result:
+                samples = json.dumps(_samples(name, result, names), ensure_ascii=False)
+                counts.append((warehouse, str(date), name, result['count'], samples))
+            if 'totals' in result:
+                totals = result['totals']
+                history.append((warehouse, str(date), int(totals['key'].size), metrics_store.encode_ids(totals['key']),
+                                zlib.compress(totals['value'].astype('<f8').tobytes(), 6)))
+    if not counts and not history:
+        return
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.executemany("DELETE FROM exception_counts WHERE warehouse = ? AND date = ?",
+                             list(dict.fromkeys((w, d) for w, d, *_ in counts)))
+            conn.executemany("INSERT INTO exception_counts (warehouse, date, rule, count, samples) VALUES (?, ?, ?, ?, ?)",
+                             counts)
+            conn.executemany(
+                "INSERT INTO receiving_history (warehouse, date, n, keys, vals) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (warehouse, date) DO UPDATE SET n = excluded.n, keys = excluded.keys, vals = excluded.vals",
+                history,
+            )
+    finally:
+        conn.close()
+
+
+def load_range(start, end, warehouses=None, db_path=None):
+    """日期范围内、仓库子集上每条规则的异常数 {规则名: {'count', 'by_warehouse', 'samples'}}；
+    stock 规则取每个仓库最后一天，flow 规则按天相加；无数据时为空
+    Exception counts of every rule over a date range and a warehouse subset {rule: {'count', 'by_warehouse',
+    'samples'}}; stock rules use each warehouse's last day, flow rules are added over the days; in RULES order, empty without data
+    """
+    if not os.path.exists(db_path or metrics_store.DB_PATH):
+        return {}
+    sql = "SELECT warehouse, date, rule, count, samples FROM exception_counts WHERE date BETWEEN ? AND ?"
+    params = [str(start), str(end)]
+    if warehouses:
+        sql += f" AND warehouse IN ({', '.join('?' * len(warehouses))})"
+        params += list(warehouses)
+    conn = connect(db_path)
+    try:
+        found = conn.execute(sql + " ORDER BY date", params).fetchall()
+    finally:
+        conn.close()
+    last = {}
+    for warehouse, date, rule, count, samples in found:
+        if rule in RULES and RULES[rule]['span'] == 'stock':
+            last[(rule, warehouse)] = date
+    results = {}
+    for warehouse, date, rule, count, samples in found:
+        if rule not in RULES or last.get((rule, warehouse), date) != date:
+            continue
+        result = results.setdefault(rule, {'count': 0, 'by_warehouse': {}, 'samples': []})
+        result['count'] += count
+        result['by_warehouse'][warehouse] = result['by_warehouse'].get(warehouse, 0) + count
+        result['samples'] += [s for s in json.loads(samples) if s not in result['samples']]
+    return {rule: dict(results[rule], samples=results[rule]['samples'][:SAMPLE_LIMIT]) for rule in RULES if rule in results}
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+原始导出归档 / Archive of the raw exports
+
+功能说明 Function Description:
+-------------------------------------
+- archive：把每天三个源导出转换为按列压缩的数据集，按 类型 / 仓库 / 日期 分区
+  （archive/kind=Outbound/warehouse=DE/date=2025-10-29/）；列名按 SCHEMA 统一（中英文表头别名见
+  process_merged_files.SHEET_COLUMNS 和 EXTRA_COLUMNS），与原表头无关
+  archive converts each day's three source exports into a column-compressed dataset partitioned by kind /
+  warehouse / date (archive/kind=Outbound/warehouse=DE/date=2025-10-29/); the columns follow one normalized
+  SCHEMA (CN/EN header aliases in process_merged_files.SHEET_COLUMNS and EXTRA_COLUMNS), whatever the
+  original headers were.
+- 每列一个 zlib 压缩的 numpy 数组：数值为 float64，时间为 datetime64，SKU、订单号等文本为 int32 编码加该分区自己的
+  排序字典（分区自包含，不依赖指标库）；_partition.json 记录行数、源文件和每列的最小 / 最大值
+  Every column is one zlib-compressed numpy array: numbers as float64, times as datetime64, SKUs, order
+  numbers and other text as int32 codes plus the partition's own sorted dictionary (partitions are
+  self-contained and do not depend on the metrics store); _partition.json records the row count, the
+  source file and the min / max of every column.
+- query：只打开日期范围和仓库内的分区目录，先用字典和最小 / 最大值跳过不可能匹配的分区，再只解压条件列求出
+  行掩码，最后只解压请求的列；几个月的按 SKU 查询不需要重新打开任何 xlsx
+  query only opens the partition directories inside the date range and warehouses, skips partitions that
+  cannot match using the dictionaries and min / max values, decompresses only the predicate columns to
+  build the row mask and then only the requested columns; a query over months by SKU reopens no xlsx.
+- --prune：归档成功后删除仓库文件夹中的源导出，目录扫描不再被旧文件拖慢，而历史仍可查询
+  --prune removes the archived source exports from the warehouse folders, so old files no longer slow down
+  the directory scans while their history stays queryable.
+
+用法 Usage:
+    python export_archive.py archive [--date 2025-10-29 | --from 2025-06-01 --to 2025-10-31] [--warehouses DE UK] [--prune]
+    python export_archive.py query Outbound --warehouses DE --from 2025-06-01 --where sku=DESKU00000032 --sum qty
+"""
+
+import os
+import sys
+import json
+import zlib
+import shutil
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+import file_manifest
+import process_merged_files
+from parse_cache import read_excel_cached
+from dates import coerce_date
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 归档目录（file_manifest 不会把它当作仓库文件夹） / Archive directory (never taken for a warehouse folder by file_manifest)
+ARCHIVE_DIR = os.path.join(PARENT_DIR, "archive")
+
+# 分区元数据文件 / Partition metadata file
+META_NAME = "_partition.json"
+
+# 压缩级别 / Compression level
+ZLIB_LEVEL = 6
+
+# 指标用到的字段之外归档的列：(字段, 中英文关键词, 匹配模式)，匹配规则同 process_merged_files.SHEET_COLUMNS
+# Columns archived besides the metric fields: (field, CN/EN keywords, match mode), matched like
+# process_merged_files.SHEET_COLUMNS
+EXTRA_COLUMNS = {
+    'Inventory': [
+        ('goods_name',    ['商品名称', 'Goods Name'],         'keyword'),
+        ('location',      ['库位', 'Location'],               'keyword'),
+        ('batch',         ['批次号', 'Batch NO.'],            'keyword'),
+        ('available_qty', ['可用量', 'Available QTY.'],       'keyword'),
+        ('weight',        ['重量', 'Weight'],                 'keyword'),
+        ('status',        ['库存状态', 'Inventory Status'],   'keyword'),
+    ],
+    'Inbound': [
+        ('goods_name',    ['商品名称', 'Goods Name'],         'keyword'),
+        ('expected_qty',  ['预期量', 'Expected QTY.'],        'keyword'),
+        ('time',          ['验收时间', 'Receiving Time'],     'keyword'),
+    ],
+    'Outbound': [
+        ('goods_name',    ['商品名称', 'Goods Name'],         'keyword'),
+        ('time',          ['复核时间', 'Rechecked Time'],     'keyword'),
+        ('carrier',       ['承运商', 'Carrier'],              'keyword'),
+    ],
+}
+
+# 字段类型：text = 分区字典编码，time = datetime64，其余为 float64
+# Field types: text = partition dictionary codes, time = datetime64, everything else float64
+TEXT_FIELDS = {'sku', 'order', 'goods_name', 'location', 'batch', 'status', 'carrier'}
+TIME_FIELDS = {'time'}
+
+# 统一后的表结构 {类型: [字段]} / Normalized schema {kind: [fields]}
+SCHEMA = {
+    kind: list(dict.fromkeys([f for f, _, _ in process_merged_files.SHEET_COLUMNS[kind]]
+                             + [f for f, _, _ in EXTRA_COLUMNS[kind]]))
+    for kind in file_manifest.SOURCE_KINDS
+}
+
+# ===============================================================
+
+
+def field_type(field):
+    """字段类型 text / time / number / Type of a field: text / time / number"""
+    if field in TEXT_FIELDS:
+        return 'text'
+    return 'time' if field in TIME_FIELDS else 'number'
+
+
+def partition_dir(kind, warehouse, date, root=None):
+    """分区目录 / Partition directory"""
+    return os.path.join(root or ARCHIVE_DIR, f"kind={kind}", f"warehouse={warehouse}", f"date={date}")
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, META_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# -------------------- 归档 Archiving --------------------
+
+def resolve_schema(kind, header):
+    """把统一字段映射到表头中的列位置 {字段: 位置} / Map the schema fields to column positions in a header"""
+    cols = [str(c).strip() for c in header]
+    aliases = process_merged_files.SHEET_COLUMNS[kind] + EXTRA_COLUMNS[kind]
+    mapping = {}
+    for field, keywords, mode in aliases:
+        pos = process_merged_files.match_column(cols, keywords, mode)
+        if field not in mapping and pos is not None and pos not in mapping.values():
+            mapping[field] = pos
+    return mapping
+
+
+def read_export(path, kind):
+    """读取一个源导出的统一字段 → ({字段: Series}, 行数)；出库表的第二表头行被跳过
+    Read the schema fields of one source export → ({field: Series}, rows); the outbound extra header row is skipped
+    """
+    header_idx, header, first_row = process_merged_files.sniff_header(path)
+    if header_idx is None:
+        return {}, 0
+    mapping = resolve_schema(kind, header)
+    if not mapping:
+        return {}, 0
+    kwargs = {'usecols': sorted(mapping.values())}
+    names = [header[pos] for pos in kwargs['usecols']]
+    dtype = {header[pos]: str for field, pos in mapping.items()
+             if field_type(field) == 'text' and isinstance(header[pos], str) and names.count(header[pos]) == 1}
+    if dtype:
+        kwargs['dtype'] = dtype
+    if kind == 'Outbound' and process_merged_files.is_subheader_row(first_row, mapping):
+        kwargs['skiprows'] = [header_idx + 1]
+    # 归档的大多是旧文件，不写入解析缓存 / Mostly old files, so they stay out of the parse cache
+    df = read_excel_cached(path, use_cache=False, **kwargs)
+    position = {pos: i for i, pos in enumerate(kwargs['usecols'])}
+    return {field: df.iloc[:, position[pos]] for field, pos in mapping.items()}, len(df)
+
+
+def encode_column(field, series):
+    """一列 → (数组, 排序字典或 None, 列统计) / One column → (array, sorted dictionary or None, column stats)"""
+    kind = field_type(field)
+    if kind == 'text':
+        values = series.where(series.isna(), series.astype(str))
+        codes, uniques = pd.factorize(values, sort=True, use_na_sentinel=True)
+        return codes.astype(np.int32), [str(u) for u in uniques], {'type': kind, 'dtype': '<i4'}
+    if kind == 'time':
+        array = pd.to_datetime(series, errors='coerce').to_numpy(dtype='datetime64[ns]')
+        valid = array[~np.isnat(array)]
+        stats = {'min': str(valid.min()), 'max': str(valid.max())} if valid.size else {}
+        return array, None, {'type': kind, 'dtype': '<M8[ns]', **stats}
+    array = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+    valid = array[~np.isnan(array)]
+    stats = {'min': float(valid.min()), 'max': float(valid.max())} if valid.size else {}
+    return array, None, {'type': kind, 'dtype': '<f8', **stats}
+
+
+def write_partition(kind, warehouse, date, columns, rows, source, root=None):
+    """写出一个分区（临时目录 + 改名替换旧分区） / Write one partition (temporary directory, then renamed over the old one)"""
+    target = partition_dir(kind, warehouse, date, root)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    st = os.stat(source)
+    meta = {'kind': kind, 'warehouse': warehouse, 'date': str(date), 'rows': rows,
+            'source': os.path.basename(source), 'source_size': st.st_size, 'source_mtime_ns': st.st_mtime_ns,
+            'archived_at': datetime.now().isoformat(timespec='seconds'), 'columns': {}}
+    for field, series in columns.items():
+        array, dictionary, stats = encode_column(field, series)
+        with open(os.path.join(tmp, f"{field}.bin"), 'wb') as f:
+            f.write(zlib.compress(array.astype(stats['dtype']).tobytes(), ZLIB_LEVEL))
+        if dictionary is not None:
+            with open(os.path.join(tmp, f"{field}.dict"), 'wb') as f:
+                f.write(zlib.compress(json.dumps(dictionary, ensure_ascii=False).encode('utf-8'), ZLIB_LEVEL))
+        meta['columns'][field] = stats
+    with open(os.path.join(tmp, META_NAME), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    old = f"{target}.{os.getpid()}.old"
+    if os.path.exists(target):
+        os.replace(target, old)
+    os.replace(tmp, target)
+    shutil.rmtree(old, ignore_errors=True)
+    return meta
+
+
+def is_archived(kind, warehouse, date, source, root=None):
+    """该源文件（大小、修改时间不变）是否已归档 / Whether this source file (same size and mtime) is already archived"""
+    meta = _read_meta(partition_dir(kind, warehouse, date, root))
+    if meta is None:
+        return False
+    st = os.stat(source)
+    return (meta.get('source') == os.path.basename(source) and meta.get('source_size') == st.st_size
+            and meta.get('source_mtime_ns') == st.st_mtime_ns)
+
+
+def archive(dates, warehouses=None, prune=False, force=False, root=None):
+    """归档日期列表内的源导出，返回写出的分区数；prune=True 时删除已归档的源文件
+    Archive the source exports of the given dates and return the number of partitions written; with
+    prune=True the archived source files are removed
+    """
+    manifest = file_manifest.refresh(PARENT_DIR)
+    written = 0
+    # 同一类型有多个文件时与合并步骤取同一个（见 file_manifest.source_files） / With several files of one kind the
+    # one the combine step uses is archived (see file_manifest.source_files)
+    for (warehouse, date), files in sorted(file_manifest.source_files(manifest, dates, warehouses).items(),
+                                           key=lambda u: (u[0][1], u[0][0])):
+        for kind, path in files.items():
+            if path is None:
+                continue
+            if force or not is_archived(kind, warehouse, date, path, root):
+                try:
+                    columns, rows = read_export(path, kind)
+                except Exception as e:
+                    print(f"[WARN] 归档失败 Archive failed: {os.path.basename(path)}: {e}")
+                    continue
+                if not columns:
+                    print(f"[WARN] 未匹配到任何列，跳过 No schema column matched, skipped: {os.path.basename(path)}")
+                    continue
+                meta = write_partition(kind, warehouse, date, columns, rows, path, root)
+                written += 1
+                print(f"已归档 Archived: {warehouse} {date} {kind} ({rows} 行 rows, {len(meta['columns'])} 列 cols)")
+            if prune:
+                os.remove(path)
+                print(f"已删除源文件 Source removed: {path}")
+    return written
+
+
+# -------------------- 查询 Queries --------------------
+
+def _partitions(kind, start=None, end=None, warehouses=None, root=None):
+    """日期范围和仓库内的分区目录（只列目录名，不打开文件） / Partition directories inside the date range and
+    warehouses (only directory names are listed, no file is opened)
+    """
+    base = os.path.join(root or ARCHIVE_DIR, f"kind={kind}")
+    if not os.path.isdir(base):
+        return []
+    found = []
+    with os.scandir(base) as it:
+        wh_dirs = [e for e in it if e.is_dir() and e.name.startswith("warehouse=")]
+    for wh in wh_dirs:
+        warehouse = wh.name.split("=", 1)[1]
+        if warehouses and warehouse not in warehouses:
+            continue
+        with os.scandir(wh.path) as it:
+            for e in it:
+                if not e.is_dir() or not e.name.startswith("date=") or e.name.endswith(('.tmp', '.old')):
+                    continue
+                date = e.name.split("=", 1)[1]
+                if (start is None or date >= str(start)) and (end is None or date <= str(end)):
+                    found.append((warehouse, date, e.path))
+    return sorted(found, key=lambda p: (p[1], p[0]))
+
+
+def _load_array(path, field, meta):
+    with open(os.path.join(path, f"{field}.bin"), 'rb') as f:
+        return np.frombuffer(zlib.decompress(f.read()), dtype=meta['columns'][field]['dtype'])
+
+
+def _load_dictionary(path, field):
+    with open(os.path.join(path, f"{field}.dict"), 'rb') as f:
+        return np.array(json.loads(zlib.decompress(f.read())), dtype=object)
+
+
+def _bounds(field, condition):
+    """范围条件 (下限, 上限) 转为列的类型 / A range condition (low, high) converted to the column type"""
+    convert = np.datetime64 if field_type(field) == 'time' else float
+    return tuple(None if v is None else convert(v) for v in condition)
+
+
+def _may_match(field, condition, stats):
+    """按列的最小 / 最大值判断分区能否满足条件 / Whether a partition can satisfy a condition, from the column's min / max"""
+    if 'min' not in stats:
+        return False
+    convert = np.datetime64 if stats['type'] == 'time' else float
+    low, high = convert(stats['min']), convert(stats['max'])
+    if isinstance(condition, tuple):
+        lo, hi = _bounds(field, condition)
+        return (lo is None or high >= lo) and (hi is None or low <= hi)
+    values = [convert(v) for v in (condition if isinstance(condition, list) else [condition])]
+    return any(low <= v <= high for v in values)
+
+
+def _row_mask(path, meta, where):
+    """where 条件的行掩码；分区不可能匹配时为 None / Row mask of the where conditions; None when the partition
+    cannot match
+    """
+    mask = np.ones(meta['rows'], dtype=bool)
+    for field, condition in where.items():
+        stats = meta['columns'].get(field)
+        if stats is None:
+            return None
+        if stats['type'] == 'text':
+            if isinstance(condition, tuple):
+                raise ValueError(f"文本列不支持范围条件 Range conditions are not supported on text column {field}")
+            # 先在分区字典中查找，不在字典中的值不需要解压编码列 / Look the values up in the partition dictionary
+            # first; values missing from it need no decompression of the codes
+            dictionary = _load_dictionary(path, field)
+            wanted = [str(v) for v in (condition if isinstance(condition, list) else [condition])]
+            pos = np.searchsorted(dictionary, wanted)
+            codes = [int(p) for p, v in zip(pos, wanted) if p < dictionary.size and dictionary[p] == v]
+            if not codes:
+                return None
+            mask &= np.isin(_load_array(path, field, meta), codes)
+        else:
+            if not _may_match(field, condition, stats):
+                return None
+            values = _load_array(path, field, meta)
+            if isinstance(condition, tuple):
+                lo, hi = _bounds(field, condition)
+                if lo is not None:
+                    mask &= values >= lo
+                if hi is not None:
+                    mask &= values <= hi
+            else:
+                convert = np.datetime64 if stats['type'] == 'time' else float
+                mask &= np.isin(values, [convert(v) for v in (condition if isinstance(condition, list) else [condition])])
+        if not mask.any():
+            return None
+    return mask
+
+
+def scan(kind, columns=None, start=None, end=None, warehouses=None, where=None, root=None):
+    """查询归档，返回 DataFrame（仓库、日期列加请求的列）；无匹配行时为空
+    Query the archive and return a DataFrame (warehouse and date columns plus the requested ones); empty
+    without matching rows
+
+    columns 为 None 时取 SCHEMA 中的全部字段；where 为 {字段: 值 | [值, ...] | (下限, 上限)}，
+    (下限, 上限) 为闭区间，None 表示不限，只用于数值和时间列。
+    columns None means every SCHEMA field; where is {field: value | [values] | (low, high)}, (low, high)
+    being an inclusive range with None for an open end, for numeric and time columns only.
+    """
+    columns = list(columns or SCHEMA[kind])
+    where = where or {}
+    frames = []
+    for warehouse, date, path in _partitions(kind, start, end, warehouses, root):
+        meta = _read_meta(path)
+        if meta is None:
+            continue
+        mask = _row_mask(path, meta, where)
+        if mask is None:
+            continue
+        data = {'warehouse': warehouse, 'date': date}
+        for field in columns:
+            if field not in meta['columns']:
+                data[field] = None
+                continue
+            values = _load_array(path, field, meta)[mask]
+            if meta['columns'][field]['type'] == 'text':
+                dictionary = _load_dictionary(path, field)
+                decoded = np.full(values.size, None, dtype=object)
+                present = values >= 0
+                decoded[present] = dictionary[values[present]]
+                values = decoded
+            data[field] = values
+        frames.append(pd.DataFrame(data, index=pd.RangeIndex(int(mask.sum()))))
+    if not frames:
+        return pd.DataFrame(columns=['warehouse', 'date', *columns])
+    return pd.concat(frames, ignore_index=True)
+
+
+# -------------------- 命令行 Command line --------------------
+
+def parse_where(items):
+    """--where 字段=值[,值...] 或 字段=下限..上限 → where 字典 / --where field=value[,value...] or field=low..high → where dict"""
+    where = {}
+    for item in items or []:
+        field, _, value = item.partition("=")
+        if not value:
+            raise ValueError(f"--where 需要 字段=值 / --where needs field=value: {item}")
+        if ".." in value:
+            low, _, high = value.partition("..")
+            where[field] = (low or None, high or None)
+        elif "," in value:
+            where[field] = value.split(",")
+        else:
+            where[field] = value
+    return where
+
+
+def parse_args(argv=None):
+    """解析命令行参数 / Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="原始导出归档与查询 / Archive the raw exports and query them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    arc = sub.add_parser("archive", help="归档源导出 / Archive the source exports.")
+    arc.add_argument("--date", help="归档的日期（默认昨天） / Date to archive (default yesterday), YYYY-MM-DD.")
+    arc.add_argument("--from", dest="date_from", help="起始日期 / First date of a range, YYYY-MM-DD.")
+    arc.add_argument("--to", dest="date_to", help="结束日期 / Last date of a range, YYYY-MM-DD.")
+    arc.add_argument("--warehouses", nargs="+", help="只归档这些仓库 / Only archive these warehouses.")
+    arc.add_argument("--prune", action="store_true", help="归档后删除源导出 / Remove the source exports once archived.")
+    arc.add_argument("--force", action="store_true", help="重新归档已归档的文件 / Archive again even when already archived.")
+
+    qry = sub.add_parser("query", help="查询归档 / Query the archive.")
+    qry.add_argument("kind", choices=file_manifest.SOURCE_KINDS, help="数据类型 / Kind of export.")
+    qry.add_argument("--from", dest="date_from", help="起始日期 / First date, YYYY-MM-DD.")
+    qry.add_argument("--to", dest="date_to", help="结束日期 / Last date, YYYY-MM-DD.")
+    qry.add_argument("--warehouses", nargs="+", help="只查询这些仓库 / Only these warehouses.")
+    qry.add_argument("--where", nargs="+", metavar="FIELD=VALUE", help="条件：字段=值[,值...] 或 字段=下限..上限 / Conditions: field=value[,value...] or field=low..high.")
+    qry.add_argument("--columns", help="逗号分隔的输出列（默认全部） / Comma-separated output columns (default all).")
+    qry.add_argument("--sum", metavar="FIELD", help="按仓库汇总该列 / Total this column per warehouse.")
+    qry.add_argument("--out", help="把结果写入 CSV / Write the result to a CSV file.")
+    return parser.parse_args(argv)
+
+
+def archive_dates(args):
+    """archive 子命令的日期列表 / Dates of the archive command"""
+    if args.date_from or args.date_to:
+        if not (args.date_from and args.date_to):
+            raise ValueError("--from 与 --to 必须同时指定 / --from and --to must be given together.")
+        start, end = coerce_date(args.date_from), coerce_date(args.date_to)
+        return [str(start + timedelta(days=i)) for i in range((end - start).days + 1)]
+    return [args.date or str(datetime.now().date() - timedelta(days=1))]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "archive":
+        written = archive(archive_dates(args), args.warehouses, args.prune, args.force)
+        print(f"归档完成 Archive done: {written} 个分区 partitions → {ARCHIVE_DIR}")
+        return 0
+    where = parse_where(args.where)
+    columns = [c.strip() for c in args.columns.split(",")] if args.columns else None
+    if args.sum and columns is not None and args.sum not in columns:
+        columns.append(args.sum)
+    unknown = [f for f in list(where) + (columns or []) if f not in SCHEMA[args.kind]]
+    if unknown:
+        raise ValueError(f"未知字段 Unknown fields: {unknown}. 可选 Available: {', '.join(SCHEMA[args.kind])}")
+    df = scan(args.kind, columns, args.date_from, args.date_to, args.warehouses, where)
+    print(f"匹配行数 Matching rows: {len(df)}")
+    if args.sum:
+        totals = df.groupby('warehouse')[args.sum].sum()
+        for warehouse, value in totals.items():
+            print(f"{warehouse}: {value:,.2f}")
+        print(f"总计 Total: {totals.sum():,.2f}")
+    elif not df.empty:
+        print(df.head(20).to_string(index=False))
+    if args.out:
+        df.to_csv(args.out, index=False, encoding='utf-8-sig')
+        print(f"已保存 Saved: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
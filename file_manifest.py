@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件清单索引 / File manifest index
+
+功能说明 Function Description:
+-------------------------------------
+- 合并和分析步骤共用的文件发现层：用 os.scandir 只列仓库文件夹（和 merged_outputs），
+  把 (仓库, 日期, 类型) 映射到文件路径，并记录大小、修改时间和表头指纹
+  Shared discovery layer for the combine and analysis stages: only the warehouse folders (and merged_outputs)
+  are listed with os.scandir, and (warehouse, date, kind) is mapped to the file path together with its
+  size, mtime and header fingerprint.
+- 只有含源导出文件的文件夹才是仓库；虚拟环境（warelytic 或任何带 pyvenv.cfg 的目录）、缓存、测试和隐藏目录不会被扫描
+  Only folders holding a source export are warehouses; virtual environments (warelytic or any directory
+  holding pyvenv.cfg), caches, tests and hidden directories are never scanned.
+- 清单保存在 .file_manifest.json 中，增量刷新：文件夹的修改时间未变时直接复用上次的结果
+  The manifest is kept in .file_manifest.json and refreshed incrementally: a folder whose mtime has not
+  changed is not listed again.
+- 预检：在解析之前报告各仓库缺少的文件类型（可选检查表头是否与上一次导出不同）
+  Preflight: reports the missing kinds of every warehouse before any parsing starts (optionally checks
+  whether a header differs from the previous export).
+
+类型 Kinds: Outbound / Inbound / Inventory（源文件 source exports），Merged（合并工作簿 merged workbooks）
+"""
+
+import os
+import re
+import json
+import hashlib
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 清单文件（以 . 开头，不会被当作仓库文件夹）/ Manifest file (dot-prefixed, never taken for a warehouse folder)
+MANIFEST_PATH = os.path.join(PARENT_DIR, ".file_manifest.json")
+MANIFEST_VERSION = 2
+
+# 文件名关键词 → sheet 名
+# Filename keyword → sheet name
+SOURCE_KEYWORDS = [
+    ('checkPackageNumber', 'Outbound'),
+    ('acceptanceOfDataQuery', 'Inbound'),
+    ('commodityInventoryInformationInquiry', 'Inventory'),
+]
+SOURCE_KINDS = [kind for _, kind in SOURCE_KEYWORDS]
+
+# 源文件扩展名（同一套关键词匹配 xlsx 和 CSV/TSV 导出） / Source extensions (the same keywords match xlsx and CSV/TSV exports)
+SOURCE_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.tsv')
+
+# 文件名中的日期 / Date inside a file name
+DATE_IN_NAME = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# 不是仓库的目录 / Directories that are not warehouses
+EXCLUDED_DIRS = {'warelytic', '__pycache__', 'merged_outputs', 'archive', 'tests'}
+
+# 统一输出目录（SAVE_TO_ORIGIN = False 时合并文件写在这里）/ Unified output directory for merged workbooks
+OUTPUT_DIR = 'merged_outputs'
+
+# 统一输出目录中的合并文件名：<仓库><日期>[(n)].xlsx / Merged file names in the unified output directory
+MERGED_NAME = re.compile(r"^(?P<warehouse>.+?)(?P<date>\d{4}-\d{2}-\d{2})(?:\(\d+\))?\.xlsx$", re.I)
+
+# ===============================================================
+
+
+def is_warehouse_dir(entry):
+    """目录项是否为仓库文件夹 / Whether a directory entry is a warehouse folder"""
+    if entry.name.startswith('.') or entry.name in EXCLUDED_DIRS:
+        return False
+    if not entry.is_dir():
+        return False
+    # 任何虚拟环境都跳过，不论名称 / Skip any virtual environment, whatever its name
+    if os.path.exists(os.path.join(entry.path, 'pyvenv.cfg')):
+        return False
+    return has_source_export(entry.path)
+
+
+def has_source_export(path):
+    """文件夹中是否有（任意日期的）源导出文件，找到第一个即返回 / Whether a folder holds a source export (of
+    any date), stopping at the first one
+    """
+    with os.scandir(path) as it:
+        for entry in it:
+            kind = classify(entry.name, '') if entry.is_file() else None
+            if kind is not None and kind[0] in SOURCE_KINDS:
+                return True
+    return False
+
+
+def warehouse_folders(root=None):
+    """列出仓库子文件夹 [(名称, 路径)]，按名称排序 / List the warehouse subfolders [(name, path)] sorted by name"""
+    with os.scandir(root or PARENT_DIR) as it:
+        return sorted((e.name, e.path) for e in it if is_warehouse_dir(e))
+
+
+def classify(name, folder, in_output_dir=False):
+    """识别文件类型，返回 (类型, 仓库, [日期]) 或 None / Classify a file as (kind, warehouse, [dates]) or None"""
+    lower = name.lower()
+    if not lower.endswith(SOURCE_EXTENSIONS) or name.startswith('~$'):
+        return None
+    if in_output_dir:
+        m = MERGED_NAME.match(name)
+        return ('Merged', m.group('warehouse'), [m.group('date')]) if m else None
+    dates = DATE_IN_NAME.findall(name)
+    if not dates:
+        return None
+    kind = next((k for kw, k in SOURCE_KEYWORDS if kw in name), None)
+    if kind is not None:
+        return kind, folder, dates
+    if name.startswith(folder) and lower.endswith('.xlsx'):
+        return 'Merged', folder, dates
+    return None
+
+
+def load_manifest(path=None):
+    """读取清单，不存在或版本不符时返回空清单 / Load the manifest, empty when missing or from another version"""
+    try:
+        with open(path or MANIFEST_PATH, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'folders': {}}
+
+
+def save_manifest(manifest, path=None):
+    """原子写入清单 / Atomically write the manifest"""
+    path = path or MANIFEST_PATH
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[WARN] 写入文件清单失败 Manifest write failed: {e}")
+
+
+def _scan_folder(name, path, previous, in_output_dir=False):
+    """用 scandir 列出一个文件夹；未变化的文件沿用上次的表头指纹
+    List one folder with scandir; unchanged files keep their previous header fingerprint
+    """
+    old_files = (previous or {}).get('files', {})
+    files = {}
+    with os.scandir(path) as it:
+        for entry in it:
+            if not entry.is_file():
+                continue
+            kind = classify(entry.name, name, in_output_dir)
+            if kind is None:
+                continue
+            st = entry.stat()
+            old = old_files.get(entry.name, {})
+            unchanged = old.get('size') == st.st_size and old.get('mtime_ns') == st.st_mtime_ns
+            files[entry.name] = {
+                'kind': kind[0], 'warehouse': kind[1], 'dates': kind[2],
+                'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                'header': old.get('header') if unchanged else None,
+            }
+    return files
+
+
+def refresh(root=None, manifest=None, save=True):
+    """增量刷新清单并返回 / Incrementally refresh the manifest and return it
+
+    只有修改时间变化的文件夹会重新列出 / Only folders whose mtime changed are listed again.
+    """
+    root = root or PARENT_DIR
+    manifest = manifest or load_manifest()
+    folders = {}
+    scanned = 0
+    candidates = [(name, path, False) for name, path in warehouse_folders(root)]
+    output_dir = os.path.join(root, OUTPUT_DIR)
+    if os.path.isdir(output_dir):
+        candidates.append((OUTPUT_DIR, output_dir, True))
+    for name, path, in_output_dir in candidates:
+        previous = manifest['folders'].get(name)
+        mtime_ns = os.stat(path).st_mtime_ns
+        if previous and previous.get('mtime_ns') == mtime_ns and previous.get('path') == path:
+            folders[name] = previous
+            continue
+        folders[name] = {'path': path, 'mtime_ns': mtime_ns, 'files': _scan_folder(name, path, previous, in_output_dir)}
+        scanned += 1
+    changed = scanned or set(folders) != set(manifest['folders'])
+    manifest['folders'] = folders
+    if save and changed:
+        save_manifest(manifest)
+    return manifest
+
+
+def lookup(manifest, dates, kinds=None, warehouses=None):
+    """查询清单，返回按 (日期, 仓库, 文件名) 排序的条目列表
+    Query the manifest; returns entries ordered by (date, warehouse, file name)
+
+    每个条目包含 warehouse、date、kind、name、path、size、mtime_ns、header。
+    条目会重新 stat，以发现原地覆盖的文件（文件夹修改时间不变）。
+    Every entry holds warehouse, date, kind, name, path, size, mtime_ns and header. Entries are stat'ed again
+    to catch files overwritten in place (which leave the folder mtime unchanged).
+    """
+    wanted = set(dates)
+    found = []
+    for folder in manifest['folders'].values():
+        for fname, info in folder['files'].items():
+            if kinds and info['kind'] not in kinds:
+                continue
+            if warehouses and info['warehouse'] not in warehouses:
+                continue
+            path = os.path.join(folder['path'], fname)
+            for date in info['dates']:
+                if date not in wanted:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if (st.st_size, st.st_mtime_ns) != (info['size'], info['mtime_ns']):
+                    info.update(size=st.st_size, mtime_ns=st.st_mtime_ns, header=None)
+                found.append({'warehouse': info['warehouse'], 'date': date, 'kind': info['kind'], 'name': fname,
+                              'path': path, 'size': info['size'], 'mtime_ns': info['mtime_ns'],
+                              'header': info['header']})
+    found.sort(key=lambda e: (e['date'], e['warehouse'], e['name']))
+    return found
+
+
+def source_files(manifest, dates, warehouses=None):
+    """{(仓库, 日期): {'Outbound': path, 'Inbound': path, 'Inventory': path}}（缺失项为 None）
+    {(warehouse, date): {'Outbound': path, 'Inbound': path, 'Inventory': path}} (missing kinds are None)
+
+    同一类型有多个文件时取文件名排序的最后一个 / With several files of one kind the last by name wins.
+    """
+    units = {}
+    for e in lookup(manifest, dates, kinds=SOURCE_KINDS, warehouses=warehouses):
+        files = units.setdefault((e['warehouse'], e['date']), dict.fromkeys(['Outbound', 'Inbound', 'Inventory']))
+        files[e['kind']] = e['path']
+    return units
+
+
+def header_fingerprint(path):
+    """工作簿各 sheet（或 CSV）表头行的指纹 / Fingerprint of the header row of every sheet in a workbook (or of a CSV)"""
+    import readers
+    if readers.is_delimited(path):
+        _, rows = readers.head_rows(path, 1)
+        header = rows[0] if rows else []
+        return hashlib.sha1('\x1f'.join('' if v is None else str(v).strip() for v in header).encode('utf-8')).hexdigest()
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        digest = hashlib.sha1()
+        for ws in wb.worksheets:
+            for row in ws.iter_rows(values_only=True):
+                if any(v is not None for v in row):
+                    digest.update(ws.title.encode('utf-8') + b'\x1e')
+                    digest.update('\x1f'.join('' if v is None else str(v).strip() for v in row).encode('utf-8'))
+                    break
+        return digest.hexdigest()
+    finally:
+        wb.close()
+
+
+def _entry_info(manifest, entry):
+    for folder in manifest['folders'].values():
+        if folder['path'] == os.path.dirname(entry['path']):
+            return folder['files'].get(entry['name'])
+    return None
+
+
+def preflight(manifest, dates, warehouses=None, check_headers=False, save=True):
+    """解析前检查：报告每个 (仓库, 日期) 缺少的源文件类型，可选检查表头变化
+    Pre-parse check: report the missing source kinds of every (warehouse, date), optionally header changes
+
+    返回 {(仓库, 日期): [缺少的类型]}，只包含有缺失的单元。
+    Returns {(warehouse, date): [missing kinds]} for the incomplete units only.
+    """
+    names = warehouses or [name for name, folder in manifest['folders'].items() if name != OUTPUT_DIR]
+    units = source_files(manifest, dates, names)
+    missing = {}
+    for date in dates:
+        for warehouse in sorted(names):
+            files = units.get((warehouse, date))
+            absent = SOURCE_KINDS if files is None else [k for k in SOURCE_KINDS if files[k] is None]
+            if absent:
+                missing[(warehouse, date)] = list(absent)
+
+    print(f"预检 Preflight: {len(names)} 个仓库 warehouses × {len(dates)} 天 days, "
+          f"{len(names) * len(dates) - len(missing)} 个完整 complete")
+    for (warehouse, date), absent in missing.items():
+        print(f"[WARN] 缺少文件 Missing files: {warehouse} {date} → {', '.join(absent)}")
+
+    if check_headers:
+        entries = lookup(manifest, dates, kinds=SOURCE_KINDS, warehouses=names)
+        for e in entries:
+            info = _entry_info(manifest, e)
+            if info is not None and info.get('header') is None:
+                info['header'] = header_fingerprint(e['path'])
+        _report_header_changes(manifest, names)
+        if save:
+            save_manifest(manifest)
+    return missing
+
+
+def _report_header_changes(manifest, warehouses):
+    """同一仓库、同一类型的相邻两次导出表头不同时提示 / Warn when consecutive exports of one warehouse and kind differ in header"""
+    history = {}
+    for folder in manifest['folders'].values():
+        for fname, info in folder['files'].items():
+            if info['warehouse'] in warehouses and info['kind'] in SOURCE_KINDS and info.get('header'):
+                for date in info['dates']:
+                    history.setdefault((info['warehouse'], info['kind']), []).append((date, info['header'], fname))
+    for (warehouse, kind), seen in sorted(history.items()):
+        seen.sort()
+        for (_, before, _), (date, after, fname) in zip(seen, seen[1:]):
+            if before != after:
+                print(f"[WARN] 表头与上一次导出不同 Header differs from the previous export: {warehouse} {kind} {date} ({fname})")
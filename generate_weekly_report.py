@@ -3,12 +3,28 @@
 
 import pandas as pd
 import os
+import argparse
 from datetime import datetime, timedelta
 
+import metrics_store
+import profiling
+import distributions
+import exception_rules
+from dates import coerce_date
+
+# Support CML Parameters, for example:
+# python generate_weekly_report.py                                 (this week, Monday - Friday)
+# python generate_weekly_report.py --date 2025-10-29               (the week containing 2025-10-29)
+# python generate_weekly_report.py --month-to-date [--date ...]    (1st of the month up to today / --date)
+# python generate_weekly_report.py --from 2025-10-01 --to 2025-10-31
+# python generate_weekly_report.py --distributions [--top-k 20]   (append the top SKUs and the lines-per-order distribution)
+# 数据来自每日指标库（process_merged_files 写入），无需重新解析 xlsx；库中无数据时退回读取当天的汇总 CSV。
+# Data comes from the daily metrics store written by process_merged_files, so no xlsx is re-parsed;
+# without stored rows for the range the day's summary CSV is used instead.
+
 # ==================== 配置区 ====================
 PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
 CSV_PATH = os.path.join(PARENT_DIR, f"warehouse_summary_{datetime.now().strftime('%Y-%m-%d')}.csv")
-REPORT_PATH = os.path.join(PARENT_DIR, f"EU_Larger_Items_Warehouse_Weekly_Summary_{datetime.now().strftime('%m%d')}.txt")
 
 # 国家映射
 # Mapping Country with Column Content for Data Extraction
@@ -19,29 +35,217 @@ COUNTRY_MAP = {
     'UK': ('英国', 'United Kingdom'),
 }
 
-# 周范围（本周一到周五）
-# Date Variables for Weekly Report Range Print
-today = datetime.now().date()
-monday = today - timedelta(days=today.weekday())
-friday = monday + timedelta(days=4)
-WEEK_RANGE_CN = f"{monday.month}月{monday.day}日 - {friday.month}月{friday.day}日"
-WEEK_RANGE_EN = f"{monday.strftime('%B %d')} - {friday.strftime('%B %d')}"
+# 报告用到的指标（process_merged_files --metrics report 只计算这些）
+# Metrics the report uses (process_merged_files --metrics report computes only these)
+REPORT_METRICS = [
+    'inv_sku_qty_cur', 'inv_units_qty_cur',
+    'ib_order_qty_cur', 'ib_sku_qty_cur', 'ib_units_qty_cur',
+    'ob_units_qty_cur',
+]
+
+# 订单行数分布中单独列出的最大行数，更多的合并为一行 / Largest lines-per-order bucket listed on its own, larger ones are merged
+MAX_LINES_BUCKET = 10
 # ================================================
 
-def load_data():
-    if not os.path.exists(CSV_PATH):
-        print(f"Data files {CSV_PATH} not found!\n 未找到数据文件: {CSV_PATH}")
+def parse_args(argv=None):
+    """解析命令行参数 / Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="生成周报 / Generate the warehouse report for a date range.")
+    parser.add_argument("--date", help="报告所在周（或月）的任意一天 / Any day of the week (or month) to report, YYYY-MM-DD.")
+    parser.add_argument("--month-to-date", action="store_true", help="本月 1 日到 --date（默认今天） / From the 1st of the month up to --date (default today).")
+    parser.add_argument("--from", dest="date_from", help="起始日期 / Start date of an arbitrary range, YYYY-MM-DD.")
+    parser.add_argument("--to", dest="date_to", help="结束日期（默认今天） / End date of the range (default today), YYYY-MM-DD.")
+    parser.add_argument("--distributions", action="store_true", help="附上前 N 的 SKU 和每单行数分布（需要 process_merged_files --distributions） / Append the top SKUs and the lines-per-order distribution (needs process_merged_files --distributions).")
+    parser.add_argument("--top-k", type=int, default=None, metavar="N", help=f"列出前 N 个 SKU（默认 {distributions.TOP_K}） / Number of top SKUs listed (default {distributions.TOP_K}).")
+    args = parser.parse_args(argv)
+    if args.date_to and not args.date_from:
+        parser.error("--to 需要配合 --from 使用 / --to requires --from")
+    if args.date_from and (args.date or args.month_to_date):
+        parser.error("--from/--to 不能与 --date 或 --month-to-date 同时使用 / --from/--to cannot be combined with --date or --month-to-date")
+    return args
+
+def week_range(day):
+    """day 所在周的周一到周五 / Monday to Friday of the week containing day"""
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=4)
+
+def resolve_range(args):
+    """返回 (起始日, 结束日, 是否周报) / Returns (start, end, weekly)"""
+    if args.date_from:
+        start = coerce_date(args.date_from)
+        end = coerce_date(args.date_to) if args.date_to else datetime.now().date()
+        if end < start:
+            raise ValueError(f"结束日期早于起始日期 End date {end} is before start date {start}.")
+        return start, end, False
+    anchor = coerce_date(args.date) if args.date else datetime.now().date()
+    if args.month_to_date:
+        return anchor.replace(day=1), anchor, False
+    return (*week_range(anchor), True)
+
+def range_labels(start, end):
+    """报告标题中的日期范围 / Date range printed in the report titles"""
+    return (
+        f"{start.month}月{start.day}日 - {end.month}月{end.day}日",
+        f"{start.strftime('%B %d')} - {end.strftime('%B %d')}",
+    )
+
+def load_data(csv_path=CSV_PATH):
+    if not os.path.exists(csv_path):
+        print(f"Data files {csv_path} not found!\n 未找到数据文件: {csv_path}")
         print("Please run process_merged_files.py firstly.\n请先运行 process_merged_files.py")
         return None
-    return pd.read_csv(CSV_PATH, encoding='utf-8-sig')
+    return pd.read_csv(csv_path, encoding='utf-8-sig')
 
-def main():
-    print(f"正在生成周报 → {REPORT_PATH}")
-    print(f"Loading for Weekly Report Generation → {REPORT_PATH}")
-    df = load_data()
+def load_range(start, end):
+    """从每日指标库汇总日期范围，无数据时返回 None / Summarise the range from the daily metrics store, None without data"""
+    try:
+        df = metrics_store.summarise_range(start, end)
+    except Exception as e:
+        print(f"[WARN] 读取指标库失败 Metrics store query failed: {e}")
+        return None
+    if df is None:
+        print(f"[WARN] 指标库中没有 {start} → {end} 的数据 No stored metrics for {start} → {end}")
+        return None
+    print(f"[INFO] 指标库 Metrics store: {start} → {end}, "
+          + ", ".join(f"{w} {n} day(s)" for w, n in zip(df['仓库 / Warehouse'], df['天数 / days'])))
+    return df
+
+def distinct_totals(start, end, warehouses):
+    """所选仓库在范围内的精确去重总数（见 metrics_store.distinct_count），缺少 ID 集合的指标不返回
+    Exact distinct totals over the selected warehouses and the range (see metrics_store.distinct_count);
+    metrics without stored ID sets are left out
+    """
+    totals = {}
+    for field in ('ib_order_qty_cur', 'ib_sku_qty_cur', 'inv_sku_qty_cur'):
+        try:
+            n = metrics_store.distinct_count(field, start, end, warehouses)
+        except Exception as e:
+            print(f"[WARN] 读取去重集合失败 Distinct set query failed: {e}")
+            return {}
+        if n is not None:
+            totals[field] = n
+    return totals
+
+def distribution_lines(start, end, warehouses):
+    """报告末尾的 Top-K 与分布段落 (中文行, 英文行)；指标库中没有分布时为空
+    Top-K and distribution sections appended to the report as (CN lines, EN lines); empty without stored distributions
+
+    出库按天相加、在库体积取每个仓库最后一天，跨仓库按 SKU 合并（见 distributions.load_range）。
+    Outbound is added over the days and inventory volume comes from each warehouse's last day, merged per SKU
+    across warehouses (see distributions.load_range).
+    """
+    try:
+        totals = {name: distributions.load_range(name, start, end, warehouses) for name in distributions.DISTRIBUTIONS}
+    except Exception as e:
+        print(f"[WARN] 读取分布失败 Distribution query failed: {e}")
+        return [], []
+    cn, en = [], []
+    k = distributions.top_k()
+    top_ob = distributions.result_rows('ob_top_sku_units', totals['ob_top_sku_units'], k)
+    if top_ob:
+        cn.append(f"6. 出库量前{len(top_ob)}的SKU")
+        en.append(f"6. Top {len(top_ob)} SKUs by Outbound PCs")
+        for r in top_ob:
+            cn.append(f"{r[distributions.RANK_COL]}. {r[distributions.KEY_COL]}: {r[distributions.VALUE_COL]:,.0f}件")
+            en.append(f"{r[distributions.RANK_COL]}. {r[distributions.KEY_COL]}: {r[distributions.VALUE_COL]:,.0f} PCs")
+    top_inv = distributions.result_rows('inv_top_sku_volume_m3', totals['inv_top_sku_volume_m3'], k)
+    if top_inv:
+        cn.append(f"7. 在库体积前{len(top_inv)}的SKU")
+        en.append(f"7. Top {len(top_inv)} SKUs by Inventory Volume")
+        for r in top_inv:
+            cn.append(f"{r[distributions.RANK_COL]}. {r[distributions.KEY_COL]}: {r[distributions.VALUE_COL]:,.2f} m³")
+            en.append(f"{r[distributions.RANK_COL]}. {r[distributions.KEY_COL]}: {r[distributions.VALUE_COL]:,.2f} m³")
+    lines = distributions.result_rows('ob_lines_per_order', totals['ob_lines_per_order'])
+    if lines:
+        buckets = {}
+        for r in lines:
+            bucket = min(int(r[distributions.KEY_COL]), MAX_LINES_BUCKET)
+            buckets[bucket] = buckets.get(bucket, 0) + int(r[distributions.VALUE_COL])
+        orders = sum(buckets.values())
+        cn.append("8. 出库订单行数分布")
+        en.append("8. Lines per Outbound Order")
+        for bucket, n in buckets.items():
+            label = f"{bucket}+" if bucket == MAX_LINES_BUCKET else str(bucket)
+            cn.append(f"{label}行: {n}单 ({n / orders:.1%})")
+            en.append(f"{label} line(s): {n:,} orders ({n / orders:.1%})")
+    return cn, en
+
+def exception_lines(start, end, warehouses):
+    """“主要异常”一节 (中文行, 英文行)：总数，再按规则列出异常数、各国分布和样例
+    The "Major Exceptions" section as (CN lines, EN lines): the total, then every rule with its count, the
+    per-country split and samples
+
+    库存规则取每个仓库最后一天，其余按天相加（见 exception_rules.load_range）；指标库中没有结果时总数为 0。
+    Inventory rules come from each warehouse's last day, the others are added over the days (see
+    exception_rules.load_range); the total is 0 without stored results.
+    """
+    try:
+        found = exception_rules.load_range(start, end, warehouses)
+    except Exception as e:
+        print(f"[WARN] 读取异常结果失败 Exception query failed: {e}")
+        found = {}
+    total = sum(r['count'] for r in found.values())
+    cn, en = [f"总计: {total}件异常"], [f"Total: {total:,} exceptions"]
+    for rule, r in found.items():
+        if not r['count']:
+            continue
+        label_cn, label_en = exception_rules.RULES[rule]['label'].split(' / ', 1)
+        by_country = [(COUNTRY_MAP[w], n) for w, n in r['by_warehouse'].items() if n and w in COUNTRY_MAP]
+        samples = ", ".join(r['samples'])
+        cn.append(f"{label_cn}: {r['count']}件（" + "，".join(f"{c[0]} {n}" for c, n in by_country) + "）"
+                  + (f"，例: {samples}" if samples else ""))
+        en.append(f"{label_en}: {r['count']:,} (" + ", ".join(f"{c[1]} {n:,}" for c, n in by_country) + ")"
+                  + (f", e.g. {samples}" if samples else ""))
+    return cn, en
+
+def metric_value(row, column):
+    """取整数指标值，缺失或为空时为 0 / Integer metric value, 0 when absent or blank"""
+    value = row.get(column)
+    return int(value) if pd.notna(value) else 0
+
+def main(df=None, start=None, end=None, weekly=True):
+    """生成周报 / Generate the weekly report
+
+    start/end 未给出时按命令行参数确定范围（默认本周一到周五），并从每日指标库汇总：
+    入库、出库按天求和，库存取范围内最后一天。
+    df 为处理步骤返回的汇总 DataFrame，仅在指标库没有该范围数据时使用；两者都没有时读取当天的汇总 CSV。
+    Without start/end the range comes from the command line (default this Monday - Friday) and is
+    summarised from the daily metrics store: inbound and outbound summed over the days, inventory from
+    the last day in the range. df is the summary DataFrame returned by the processing step and is only
+    used when the store has no rows for the range; without either the day's summary CSV is loaded.
+    """
+    if start is None:
+        args = parse_args()
+        distributions.configure(args.distributions, args.top_k)
+        start, end, weekly = resolve_range(args)
+    end = end or start
+    range_cn, range_en = range_labels(start, end)
+    if weekly:
+        report_path = os.path.join(PARENT_DIR, f"EU_Larger_Items_Warehouse_Weekly_Summary_{min(end, datetime.now().date()).strftime('%m%d')}.txt")
+    else:
+        report_path = os.path.join(PARENT_DIR, f"EU_Larger_Items_Warehouse_Summary_{start.strftime('%m%d')}-{end.strftime('%m%d')}.txt")
+    print(f"正在生成周报 → {report_path}")
+    print(f"Loading for Weekly Report Generation → {report_path}")
+    stored = load_range(start, end)
+    if stored is not None:
+        df = stored
+    elif df is None:
+        df = load_data()
     if df is None:
         return
 
+    # 同一 SKU / 订单在多天或多国出现时只计一次（需要指标库中的 ID 集合，否则按各国数值相加）
+    # A SKU / order seen on several days or in several countries counts once (needs the ID sets in the
+    # metrics store, otherwise the per-country values are added up)
+    exact = distinct_totals(start, end, [w for w in df['仓库 / Warehouse'] if w in COUNTRY_MAP]) if stored is not None else {}
+
+    # --distributions：附上指标库中该范围的 Top-K 与分布 / --distributions: append the range's top-K and distributions from the store
+    extra_cn, extra_en = [], []
+    if distributions.enabled():
+        extra_cn, extra_en = distribution_lines(start, end, [w for w in df['仓库 / Warehouse'] if w in COUNTRY_MAP])
+
+    # 主要异常：指标库中该范围的异常规则结果 / Major exceptions: the range's exception rule results from the store
+    exceptions_cn, exceptions_en = exception_lines(start, end, [w for w in df['仓库 / Warehouse'] if w in COUNTRY_MAP])
+
     # 初始化汇总
     # Initialise the Summary
     total = {'orders': 0, 'skus': 0, 'pcs': 0}
@@ -55,9 +259,9 @@ def main():
             continue
 
         # Inbound
-        ib_orders = int(row['入库订单数 / ib_order_qty_cur']) if pd.notna(row['入库订单数 / ib_order_qty_cur']) else 0
-        ib_skus = int(row['入库SKU数 / ib_sku_qty_cur']) if pd.notna(row['入库SKU数 / ib_sku_qty_cur']) else 0
-        ib_pcs = int(row['入库总量 / ib_units_qty_cur']) if pd.notna(row['入库总量 / ib_units_qty_cur']) else 0
+        ib_orders = metric_value(row, '入库订单数 / ib_order_qty_cur')
+        ib_skus = metric_value(row, '入库SKU数 / ib_sku_qty_cur')
+        ib_pcs = metric_value(row, '入库总量 / ib_units_qty_cur')
 
         total['orders'] += ib_orders
         total['skus'] += ib_skus
@@ -66,21 +270,25 @@ def main():
         inbound_by_country[country_code] = (ib_orders, ib_skus, ib_pcs)
 
         # Inventory
-        inv_skus = int(row['库存SKU数 / inv_sku_qty_cur']) if pd.notna(row['库存SKU数 / inv_sku_qty_cur']) else 0
-        inv_pcs = int(row['库存总量 / inv_units_qty_cur']) if pd.notna(row['库存总量 / inv_units_qty_cur']) else 0
+        inv_skus = metric_value(row, '库存SKU数 / inv_sku_qty_cur')
+        inv_pcs = metric_value(row, '库存总量 / inv_units_qty_cur')
         inventory_by_country[country_code] = (inv_skus, inv_pcs)
 
         # Outbound
-        ob_pcs = int(row['出库总量 / ob_units_qty_cur']) if pd.notna(row['出库总量 / ob_units_qty_cur']) else 0
+        ob_pcs = metric_value(row, '出库总量 / ob_units_qty_cur')
         outbound_by_country[country_code] = ob_pcs
 
+    total['orders'] = exact.get('ib_order_qty_cur', total['orders'])
+    total['skus'] = exact.get('ib_sku_qty_cur', total['skus'])
+    total_inv_skus = exact.get('inv_sku_qty_cur', sum(v[0] for v in inventory_by_country.values()))
+
     # 生成报告
     # Report Generation
     lines = []
 
     # 中文标题
     # Mandarin Chinese Title
-    lines.append(f"大件仓储汇总（{WEEK_RANGE_CN}）")
+    lines.append(f"大件仓储汇总（{range_cn}）")
     lines.append("1. 入库验收")
     lines.append(f"总计: {total['orders']}单，{total['skus']}个SKU，{total['pcs']}件")
     for code, (orders, skus, pcs) in inbound_by_country.items():
@@ -88,7 +296,6 @@ def main():
             lines.append(f"{COUNTRY_MAP[code][0]}: {orders}单，{skus}个SKU，{pcs}件")
 
     lines.append("2. 在库库存")
-    total_inv_skus = sum(v[0] for v in inventory_by_country.values())
     total_inv_pcs = sum(v[1] for v in inventory_by_country.values())
     lines.append(f"总库存: {total_inv_skus}个SKU，{total_inv_pcs}件")
     for code, (skus, pcs) in inventory_by_country.items():
@@ -101,7 +308,7 @@ def main():
         lines.append(f"{COUNTRY_MAP[code][0]}: {pcs}件")
 
     lines.append("4. 主要异常")
-    lines.append("总计: 0件异常")
+    lines.extend(exceptions_cn)
     lines.append("5. 出勤人数")
     lines.append("总人数范围: 28-34人")
     lines.append("法国: 6-9人")
@@ -109,11 +316,12 @@ def main():
     lines.append("德国: 9-10人")
     lines.append("英国: 6-7人")
     lines.append("平均出勤: 约31人/天")
+    lines.extend(extra_cn)
     lines.append("")
 
     # 英文标题
     # English Title
-    lines.append(f"EU Larger Items Warehouse Weekly Summary ({WEEK_RANGE_EN})")
+    lines.append(f"EU Larger Items Warehouse {'Weekly ' if weekly else ''}Summary ({range_en})")
     lines.append("1. Inbound Receiving")
     lines.append(f"Total: {total['orders']} orders, {total['skus']} SKUs, {total['pcs']:,} PCs")
     for code, (orders, skus, pcs) in inbound_by_country.items():
@@ -131,7 +339,7 @@ def main():
         lines.append(f"{COUNTRY_MAP[code][1]}: {pcs:,} PCs")
 
     lines.append("4. Major Exceptions")
-    lines.append("Total: 0 exceptions")
+    lines.extend(exceptions_en)
     lines.append("5. Attendance")
     lines.append("Total Personnel Range: 28-34 people")
     lines.append("France: 6-9 people")
@@ -139,17 +347,19 @@ def main():
     lines.append("Germany: 9-10 people")
     lines.append("United Kingdom: 6-7 people")
     lines.append("Average Attendance: Approx. 31 people/day")
+    lines.extend(extra_en)
 
     # 写入文件
     # Write into files
-    with open(REPORT_PATH, 'w', encoding='utf-8') as f:
+    with open(report_path, 'w', encoding='utf-8') as f:
         f.write("\n".join(lines))
 
     print("报告生成成功！Report generated and exported successfully!\n ")
-    print(f"文件File generated as : {REPORT_PATH}")
+    print(f"文件File generated as : {report_path}")
     print("\n预览Preview（First 30 lines 前60行）：")
     print("\n".join(lines[:60]))
     print("...")
 
 if __name__ == "__main__":
-    main()
+    with profiling.span("report"):
+        main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SKU / 订单号字典编码 / Persistent dictionary encoding for SKU and order identifiers
+
+功能说明 Function Description:
+-------------------------------------
+- 只追加的字典：每个 SKU 码和订单号映射为一个 int32 整数编码，跨仓库、跨日期共用，保存在指标库
+  （warehouse_metrics.db）的 id_dictionary 表中，因此与库中保存的去重编码集合同生共灭
+  An append-only dictionary maps every SKU code and order number to an int32 code shared across
+  warehouses and days. It lives in the id_dictionary table of the metrics store (warehouse_metrics.db),
+  so it always travels with the distinct code sets stored there.
+- 读取后的 sheet 立即把 ID 列换成 int32 编码、数量和尺寸列向下转换（见 process_merged_files.compact_frame），
+  去重计数和跨仓库并集都在整数数组上完成
+  Right after loading, the ID columns of a sheet become int32 codes and the quantity / dimension columns
+  are downcast (see process_merged_files.compact_frame); distinct counts and cross-warehouse unions run
+  on integer arrays.
+- 每个进程只在第一次用到某类 ID 时读入字典，之后只为新出现的值写库；多个工作进程可以同时追加
+  Each process loads a kind of ID once and afterwards only writes values it has not seen; several worker
+  processes may append at the same time.
+"""
+
+import uuid
+import sqlite3
+import numpy as np
+import pandas as pd
+
+import metrics_store
+
+# ==================== 配置区 Configuration Area ====================
+
+# 编码的数据类型；缺失值编码为 NA_CODE
+# Code dtype; missing values are encoded as NA_CODE
+CODE_DTYPE = np.int32
+NA_CODE = -1
+
+# SQLite 写锁等待时间（秒），多个工作进程同时追加时使用
+# SQLite lock timeout in seconds, for worker processes appending at the same time
+LOCK_TIMEOUT = 60
+
+# ===============================================================
+
+# 本进程已读入的字典 {类型: {值: 编码}} / Dictionary loaded in this process {kind: {value: code}}
+_codes = {}
+_token = {}
+
+
+def connect(db_path=None):
+    """打开指标库并确保字典表存在 / Open the metrics store and make sure the dictionary tables exist"""
+    conn = sqlite3.connect(db_path or metrics_store.DB_PATH, timeout=LOCK_TIMEOUT)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS id_dictionary ("
+        "code INTEGER PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL, UNIQUE (kind, value))"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS id_dictionary_meta (key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def token(db_path=None):
+    """字典的唯一标识；指标库被删除重建后会变化，用作缓存键的一部分
+    Identity of the dictionary; it changes when the metrics store is deleted and rebuilt, so it is part of
+    the cache key of anything holding codes
+    """
+    path = db_path or metrics_store.DB_PATH
+    if path not in _token:
+        conn = connect(path)
+        try:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO id_dictionary_meta VALUES ('token', ?)", (uuid.uuid4().hex,))
+            _token[path] = conn.execute("SELECT value FROM id_dictionary_meta WHERE key = 'token'").fetchone()[0]
+        finally:
+            conn.close()
+    return _token[path]
+
+
+def _load(kind, db_path=None):
+    if kind not in _codes:
+        conn = connect(db_path)
+        try:
+            _codes[kind] = dict(conn.execute("SELECT value, code FROM id_dictionary WHERE kind = ?", (kind,)))
+        finally:
+            conn.close()
+    return _codes[kind]
+
+
+def _append(kind, values, db_path=None):
+    """为新值分配编码（已被其他进程写入的值直接读回） / Assign codes to new values (values another process
+    already wrote are read back)
+    """
+    known = _codes[kind]
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO id_dictionary (kind, value) VALUES (?, ?)",
+                             [(kind, v) for v in values])
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            rows = conn.execute(
+                f"SELECT value, code FROM id_dictionary WHERE kind = ? AND value IN ({', '.join('?' * len(batch))})",
+                [kind, *batch],
+            )
+            known.update(rows)
+    finally:
+        conn.close()
+
+
+def encode(kind, values, db_path=None):
+    """把一列 ID 编码为 int32 数组（缺失值为 NA_CODE） / Encode a column of IDs as an int32 array (blanks become NA_CODE)
+
+    每个不同的值只查一次字典 / Every distinct value is looked up once.
+    """
+    local, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    keys = [str(u) for u in uniques]
+    known = _load(kind, db_path)
+    missing = [k for k in keys if k not in known]
+    if missing:
+        _append(kind, missing, db_path)
+    lookup = np.fromiter((known[k] for k in keys), dtype=CODE_DTYPE, count=len(keys))
+    codes = np.full(len(local), NA_CODE, dtype=CODE_DTYPE)
+    present = local >= 0
+    codes[present] = lookup[local[present]]
+    return codes
+
+
+def decode(kind, codes, db_path=None):
+    """int32 编码 → 原始字符串 / int32 codes → the original strings"""
+    reverse = {code: value for value, code in _load(kind, db_path).items()}
+    missing = [c for c in np.unique(codes) if c != NA_CODE and c not in reverse]
+    if missing:
+        _codes.pop(kind, None)
+        reverse = {code: value for value, code in _load(kind, db_path).items()}
+    return [None if c == NA_CODE else reverse[c] for c in codes]
+
+
+def is_encoded(series):
+    """该列是否已是字典编码（read_excel 不会产生 int32 列） / Whether a column already holds dictionary codes
+    (read_excel never produces int32 columns)
+    """
+    return series.dtype == CODE_DTYPE
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+日内增量汇总 / Intraday incremental aggregation of growing exports
+
+功能说明 Function Description:
+-------------------------------------
+- 出库表（checkPackageNumber）和入库表（acceptanceOfDataQuery）一天内会多次重新导出，每次都是上一次的超集。
+  --intraday 时每个 (仓库, 日期, sheet) 在指标库（warehouse_metrics.db）的 intraday_watermarks 表中保存水位：
+  已汇总的行数、读到的位置（xlsx 为最后一行的行号，CSV 为已读字节数）、最后一个订单号和已读部分的前缀哈希，
+  以及累加器（去重编码集合、合计、分布和异常规则的部分结果，见 process_merged_files.compact_parts）
+  The outbound (checkPackageNumber) and inbound (acceptanceOfDataQuery) exports are re-exported several
+  times a day, each a superset of the previous one. With --intraday every (warehouse, date, sheet) keeps a
+  watermark in the intraday_watermarks table of the metrics store (warehouse_metrics.db): the rows
+  aggregated so far, the position reached (last row number for xlsx, bytes read for CSV), the last order
+  number and a hash of the prefix read, together with the accumulators (distinct code sets, totals,
+  distribution and exception rule partials, see process_merged_files.compact_parts).
+- 下一次导出先核对前缀哈希（xlsx 为已读行的 <row> XML，共享字符串换成文本；CSV 为已读字节），一致时只解析新追加的行并合并进累加器，
+  结果与完整重算相同；前缀变化、文件变短、选项或代码变化、字典重建时自动完整重算
+  The next export first checks the prefix hash (the <row> XML of the rows read, shared strings replaced by
+  their text, for xlsx; the bytes read for CSV); when it matches only the appended rows are parsed and merged into the accumulators, with the
+  same result as a full recompute. A changed prefix, a shorter file, changed options or code, or a rebuilt
+  dictionary trigger a full recompute automatically.
+- 只作用于直接读取源文件的路径（--no-merged-output 或 --fast-merge）；库存表和合并工作簿每次完整读取
+  Only applies where the source files are read directly (--no-merged-output or --fast-merge); the inventory
+  sheet and merged workbooks are always read in full.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+from datetime import datetime
+
+import metrics_store
+import id_dictionary
+import npz_store
+from file_manifest import DATE_IN_NAME
+
+# ==================== 配置区 Configuration Area ====================
+
+# 环境变量：是否启用日内增量 / Environment variable: intraday increments enabled
+INTRADAY_ENV = "WARELYTIC_INTRADAY"
+
+# 增量汇总的 sheet（库存表是时点快照，不会只追加） / Sheets aggregated incrementally (the inventory sheet is a
+# point-in-time snapshot and never just grows)
+SHEETS = ('Outbound', 'Inbound')
+
+# 前缀哈希算法 / Prefix hash algorithm
+HASH_NAME = 'sha1'
+
+# CSV 前缀哈希每次读取的字节数 / Bytes read per call while hashing a CSV prefix
+HASH_BLOCK_BYTES = 1 << 20
+
+# SQLite 写锁等待时间（秒） / SQLite lock timeout in seconds
+LOCK_TIMEOUT = 60
+
+# ===============================================================
+
+
+def configure(enabled=None):
+    """设置 --intraday / Apply --intraday"""
+    if enabled:
+        os.environ[INTRADAY_ENV] = "1"
+
+
+def configure_from_argv(argv):
+    """按 sys.argv 风格的参数列表配置 / Configure from a sys.argv style argument list"""
+    configure("--intraday" in argv)
+
+
+def enabled():
+    """是否启用日内增量 / Whether intraday increments are enabled"""
+    return os.environ.get(INTRADAY_ENV) == "1"
+
+
+def connect(db_path=None):
+    """打开指标库并确保水位表存在 / Open the metrics store and make sure the watermark table exists"""
+    conn = sqlite3.connect(db_path or metrics_store.DB_PATH, timeout=LOCK_TIMEOUT)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS intraday_watermarks ("
+        "warehouse TEXT NOT NULL, date TEXT NOT NULL, sheet TEXT NOT NULL, "
+        "signature TEXT NOT NULL, rows INTEGER NOT NULL, position INTEGER NOT NULL, "
+        "last_key TEXT, prefix_hash TEXT NOT NULL, state BLOB NOT NULL, updated_at TEXT, "
+        "PRIMARY KEY (warehouse, date, sheet))"
+    )
+    return conn
+
+
+def unit_of(path):
+    """源文件 → (仓库, 日期)：仓库为所在文件夹名，日期取自文件名 / Source file → (warehouse, date): the warehouse
+    is the folder name, the date comes from the file name
+    """
+    dates = DATE_IN_NAME.findall(os.path.basename(path))
+    return os.path.basename(os.path.dirname(os.path.abspath(path))), dates[0] if dates else None
+
+
+def new_digest():
+    """空的前缀哈希对象 / An empty prefix hash object"""
+    return hashlib.new(HASH_NAME)
+
+
+def signature(options):
+    """读取选项、代码版本和字典标识的哈希；任一变化时旧水位作废
+    Hash of the read options, the code version and the dictionary identity; the old watermark is void
+    when any of them changes
+    """
+    # build_state 经 work_queue 导入 process_merged_files，而后者导入本模块；在这里导入以避免循环导入
+    # build_state imports process_merged_files through work_queue, which imports this module; imported here
+    # to avoid the import cycle
+    import build_state
+    payload = json.dumps([options, build_state.code_version(), id_dictionary.token()], default=str,
+                         ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def load(warehouse, date, sheet, sig, db_path=None):
+    """读取水位，签名不一致或不存在时为 None / Load the watermark, None when missing or signed differently
+
+    返回 {'rows', 'position', 'last_key', 'prefix_hash', 'state'} / Returns {'rows', 'position', 'last_key',
+    'prefix_hash', 'state'}.
+    """
+    conn = connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT signature, rows, position, last_key, prefix_hash, state FROM intraday_watermarks "
+            "WHERE warehouse = ? AND date = ? AND sheet = ?", (warehouse, date, sheet)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None or row[0] != sig:
+        return None
+    try:
+        state = npz_store.loads(row[5])
+    except ValueError:
+        # 旧格式或损坏的累加器：完整重算 / Old-format or corrupt accumulators: recompute in full
+        return None
+    return {'rows': row[1], 'position': row[2], 'last_key': row[3], 'prefix_hash': row[4], 'state': state}
+
+
+def store(warehouse, date, sheet, sig, mark, db_path=None):
+    """写入（覆盖）水位 / Write (replace) the watermark"""
+    # 累加器以压缩的 npz 保存，读取时不会执行代码 / Accumulators are a compressed npz, loading them never runs code
+    blob = npz_store.dumps(mark['state'], compress=True)
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO intraday_watermarks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (warehouse, date, sheet, sig, int(mark['rows']), int(mark['position']), mark['last_key'],
+                 mark['prefix_hash'], blob, datetime.now().isoformat(timespec='seconds')),
+            )
+    finally:
+        conn.close()
+
+
+def hash_file(path, digest, start, end):
+    """用文件第 start..end 字节更新 digest / Update digest with bytes start..end of the file"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(HASH_BLOCK_BYTES, remaining))
+            if not data:
+                break
+            digest.update(data)
+            remaining -= len(data)
+    return digest
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+库存日环比 / Day-over-day inventory delta
+
+功能说明 Function Description:
+-------------------------------------
+- 每个仓库每天的库存表压缩为按 SKU 编码排序的快照 (SKU, 数量, 体积)（SKU 编码见 id_dictionary），
+  随汇总行传递，并保存在指标库（warehouse_metrics.db）的 inventory_snapshots 表中
+  Every warehouse's inventory sheet of a day is reduced to a snapshot (SKU, qty, volume) sorted by SKU code
+  (codes from id_dictionary); it travels with the summary row and is kept in the inventory_snapshots table
+  of the metrics store (warehouse_metrics.db).
+- 汇总时与该仓库上一个有快照的日期做线性归并连接，得到新增、移除、数量变化的 SKU 数以及库存数量、体积的
+  增减，写入汇总 CSV；逐个 SKU 的变化另存为 inventory_delta_<日期>.csv
+  When the summary is written, each snapshot is merge-joined (linear) with the warehouse's previous
+  snapshot, giving the added, removed and changed SKU counts and the quantity / volume movement, which are
+  added to the summary CSV; the per-SKU changes go to inventory_delta_<date>.csv.
+- 体积与 inv_total_volume_m3 相同（尺寸缺失时由 SKU 主数据补全，见 sku_master）；只有请求的指标读取了 SKU、
+  数量并计算了体积时才生成快照（默认的全部指标即如此）；--metrics 只取部分指标时汇总中没有环比列
+  Volumes are the ones of inv_total_volume_m3 (dimension gaps filled from the SKU master, see sku_master);
+  a snapshot is only built when the requested metrics read the SKU and quantity and compute the volume
+  (the default full metric set does); with a partial --metrics the summary has no delta columns.
+"""
+
+import os
+import zlib
+import sqlite3
+import numpy as np
+import pandas as pd
+
+import metrics_store
+import id_dictionary
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 汇总行中携带快照的键（不写入 CSV） / Summary row key carrying the snapshot (never written to the CSV)
+SNAPSHOT_KEY = '_inventory_snapshot'
+
+# 生成快照需要的字段：SKU、数量和每行的单件体积（见 process_merged_files.prepare_block）
+# Fields a snapshot needs: SKU, quantity and the per-row unit volume (see process_merged_files.prepare_block)
+SNAPSHOT_FIELDS = ['sku', 'qty', 'unit_volume']
+
+# 尺寸单位换算：mm³ → m³（与 inv_total_volume_m3 一致） / Dimension unit: mm³ → m³ (as inv_total_volume_m3)
+VOLUME_DIVISOR = 1_000_000
+
+# 汇总中的环比列 / Delta columns of the summary
+BASE_DATE_COL = '对比日期 / inv_delta_base_date'
+DELTA_COLUMNS = {
+    'added': '新增SKU数 / inv_sku_added',
+    'removed': '移除SKU数 / inv_sku_removed',
+    'changed': '数量变化SKU数 / inv_sku_changed',
+    'units_in': '库存增加量 / inv_units_increase',
+    'units_out': '库存减少量 / inv_units_decrease',
+    'units_net': '库存净变化 / inv_units_delta',
+    'volume_net': '体积净变化(m³) / inv_volume_delta_m3',
+}
+
+# 明细状态 / Detail status
+ADDED, REMOVED, CHANGED = 'added', 'removed', 'changed'
+
+# ===============================================================
+
+
+def connect(db_path=None):
+    """打开指标库并确保快照表存在 / Open the metrics store and make sure the snapshot table exists"""
+    conn = sqlite3.connect(db_path or metrics_store.DB_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS inventory_snapshots ("
+        "warehouse TEXT NOT NULL, date TEXT NOT NULL, n INTEGER, sku BLOB, qty BLOB, volume BLOB, "
+        "PRIMARY KEY (warehouse, date))"
+    )
+    return conn
+
+
+# -------------------- 快照 Snapshots --------------------
+
+def build_snapshot(block):
+    """一批库存行 → 快照 {'sku': 排序后的 int32 编码, 'qty': 数量, 'volume': m³}；同一 SKU 的多行（多个库位）合并
+    A block of inventory rows → snapshot {'sku': sorted int32 codes, 'qty': quantity, 'volume': m³}; several
+    rows of one SKU (several locations) are added up
+
+    block 为 process_merged_files.prepare_block 处理过的 {字段: Series}（SKU 为字典编码，单件体积为 mm³）；
+    空白数量按 0 计，与 inv_total_volume_m3 的规则相同。
+    block is {field: Series} as prepared by process_merged_files.prepare_block (SKU as dictionary codes, unit
+    volume in mm³); blank quantities count as 0, the same rule inv_total_volume_m3 applies.
+    """
+    codes = np.asarray(block['sku'])
+    qty = pd.to_numeric(block['qty'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    volume = np.asarray(block['unit_volume'], dtype=np.float64) / VOLUME_DIVISOR * qty
+    keep = codes != id_dictionary.NA_CODE
+    sku, inverse = np.unique(codes[keep], return_inverse=True)
+    return {
+        'sku': sku.astype(id_dictionary.CODE_DTYPE),
+        'qty': np.bincount(inverse, weights=qty[keep], minlength=sku.size),
+        'volume': np.bincount(inverse, weights=volume[keep], minlength=sku.size),
+    }
+
+
+def merge_snapshots(parts):
+    """合并分块生成的快照（流式读取时每块一个） / Merge snapshots built per block (one per block when streaming)"""
+    if len(parts) == 1:
+        return parts[0]
+    sku, inverse = np.unique(np.concatenate([p['sku'] for p in parts]), return_inverse=True)
+    return {
+        'sku': sku.astype(id_dictionary.CODE_DTYPE),
+        'qty': np.bincount(inverse, weights=np.concatenate([p['qty'] for p in parts]), minlength=sku.size),
+        'volume': np.bincount(inverse, weights=np.concatenate([p['volume'] for p in parts]), minlength=sku.size),
+    }
+
+
+def store_day(date, rows, db_path=None):
+    """保存某一天各仓库的快照（SKU 编码差分后压缩，数量和体积按 float64 压缩）
+    Store the day's snapshot of every warehouse (SKU codes delta-encoded, quantity and volume as float64,
+    all zlib-compressed)
+    """
+    params = [
+        (row[metrics_store.WAREHOUSE_COL], str(date), int(snap['sku'].size), metrics_store.encode_ids(snap['sku']),
+         zlib.compress(snap['qty'].astype('<f8').tobytes(), 6), zlib.compress(snap['volume'].astype('<f8').tobytes(), 6))
+        for row in rows if (snap := row.get(SNAPSHOT_KEY)) is not None
+    ]
+    if not params:
+        return
+    with connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO inventory_snapshots (warehouse, date, n, sku, qty, volume) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (warehouse, date) DO UPDATE SET n = excluded.n, sku = excluded.sku, "
+            "qty = excluded.qty, volume = excluded.volume",
+            params,
+        )
+    conn.close()
+
+
+def load_previous(warehouse, date, db_path=None):
+    """该仓库在 date 之前最近一天的快照，返回 (日期, 快照)，没有时为 (None, None)
+    The warehouse's latest snapshot before date as (date, snapshot), (None, None) without one
+    """
+    if not os.path.exists(db_path or metrics_store.DB_PATH):
+        return None, None
+    conn = connect(db_path)
+    try:
+        found = conn.execute(
+            "SELECT date, sku, qty, volume FROM inventory_snapshots WHERE warehouse = ? AND date < ? "
+            "ORDER BY date DESC LIMIT 1", (warehouse, str(date))
+        ).fetchone()
+    finally:
+        conn.close()
+    if found is None:
+        return None, None
+    prev_date, sku, qty, volume = found
+    return prev_date, {
+        'sku': metrics_store.decode_ids(sku),
+        'qty': np.frombuffer(zlib.decompress(qty), dtype='<f8'),
+        'volume': np.frombuffer(zlib.decompress(volume), dtype='<f8'),
+    }
+
+
+# -------------------- 环比 Delta --------------------
+
+def merge_join(prev_sku, cur_sku):
+    """两个排序、去重的 SKU 编码数组的归并连接 / Merge join of two sorted, unique SKU code arrays
+
+    两段已排序的数组拼接后做稳定排序（timsort 识别出两个有序段，只做一次线性归并），相邻相等的编码即为
+    两天都有的 SKU。返回 (prev 中匹配的下标, cur 中匹配的下标, prev 是否匹配, cur 是否匹配)。
+    The two sorted runs are concatenated and stable-sorted (timsort finds the two runs and does a single
+    linear merge); equal neighbours are SKUs present on both days. Returns (matched prev positions,
+    matched cur positions, prev matched mask, cur matched mask).
+    """
+    keys = np.concatenate([prev_sku, cur_sku])
+    order = np.argsort(keys, kind='stable')
+    merged = keys[order]
+    pairs = np.flatnonzero(merged[1:] == merged[:-1])
+    prev_idx, cur_idx = order[pairs], order[pairs + 1] - prev_sku.size
+    prev_hit = np.zeros(prev_sku.size, dtype=bool)
+    cur_hit = np.zeros(cur_sku.size, dtype=bool)
+    prev_hit[prev_idx] = True
+    cur_hit[cur_idx] = True
+    return prev_idx, cur_idx, prev_hit, cur_hit
+
+
+def diff_snapshots(prev, cur):
+    """比较两天的快照 / Compare two daily snapshots
+
+    返回 (汇总 {DELTA_COLUMNS 的键: 值}, 明细 {'sku', 'status', 'qty_prev', 'qty_cur', 'volume_delta'})；
+    明细只包含新增、移除和数量变化的 SKU。
+    Returns (totals {DELTA_COLUMNS key: value}, details {'sku', 'status', 'qty_prev', 'qty_cur', 'volume_delta'});
+    the details hold only added, removed and changed SKUs.
+    """
+    prev_idx, cur_idx, prev_hit, cur_hit = merge_join(prev['sku'], cur['sku'])
+    moved = cur['qty'][cur_idx] - prev['qty'][prev_idx]
+    changed = moved != 0
+    added, removed = ~cur_hit, ~prev_hit
+
+    # 每个 SKU 的数量变化：新增为当天数量，移除为负的前一天数量 / Per-SKU movement: added = today's qty, removed = minus yesterday's
+    movement = np.concatenate([cur['qty'][added], -prev['qty'][removed], moved[changed]])
+    totals = {
+        'added': int(added.sum()),
+        'removed': int(removed.sum()),
+        'changed': int(changed.sum()),
+        'units_in': float(movement[movement > 0].sum()),
+        'units_out': float(-movement[movement < 0].sum()),
+        'units_net': float(cur['qty'].sum() - prev['qty'].sum()),
+        'volume_net': float(cur['volume'].sum() - prev['volume'].sum()),
+    }
+    n_added, n_removed, n_changed = totals['added'], totals['removed'], totals['changed']
+    details = {
+        'sku': np.concatenate([cur['sku'][added], prev['sku'][removed], cur['sku'][cur_idx[changed]]]),
+        'status': np.repeat([ADDED, REMOVED, CHANGED], [n_added, n_removed, n_changed]),
+        'qty_prev': np.concatenate([np.zeros(n_added), prev['qty'][removed], prev['qty'][prev_idx[changed]]]),
+        'qty_cur': np.concatenate([cur['qty'][added], np.zeros(n_removed), cur['qty'][cur_idx[changed]]]),
+        'volume_delta': np.concatenate([cur['volume'][added], -prev['volume'][removed],
+                                        cur['volume'][cur_idx[changed]] - prev['volume'][prev_idx[changed]]]),
+    }
+    return totals, details
+
+
+def apply_deltas(dated_results, db_path=None):
+    """为带快照的汇总行加上环比列，返回逐个 SKU 的变化明细（DataFrame，可能为空）
+    Add the delta columns to every summary row holding a snapshot and return the per-SKU changes (a
+    DataFrame, possibly empty)
+
+    dated_results 为按日期排序的 [(日期, 汇总行)]；回填时前一天的快照直接取自本批结果，否则从指标库读取。
+    dated_results is [(date, summary row)] ordered by date; in a backfill the previous day's snapshot comes
+    from the same batch, otherwise from the metrics store.
+    """
+    latest = {}
+    frames = []
+    for date, row in dated_results:
+        snap = row.get(SNAPSHOT_KEY)
+        if snap is None:
+            continue
+        warehouse = row[metrics_store.WAREHOUSE_COL]
+        prev_date, prev = latest.get(warehouse, (None, None))
+        if prev is None or str(prev_date) >= str(date):
+            prev_date, prev = load_previous(warehouse, date, db_path)
+        latest[warehouse] = (date, snap)
+        row[BASE_DATE_COL] = prev_date
+        if prev is None:
+            row.update({label: np.nan for label in DELTA_COLUMNS.values()})
+            continue
+        totals, details = diff_snapshots(prev, snap)
+        row.update({DELTA_COLUMNS[key]: value for key, value in totals.items()})
+        if details['sku'].size:
+            frames.append(pd.DataFrame({
+                '日期 / Date': date,
+                '对比日期 / Base date': prev_date,
+                metrics_store.WAREHOUSE_COL: warehouse,
+                'SKU': id_dictionary.decode('sku', details['sku'], db_path),
+                '状态 / Status': details['status'],
+                '前一天数量 / Previous qty': details['qty_prev'],
+                '当天数量 / Current qty': details['qty_cur'],
+                '数量变化 / Qty delta': details['qty_cur'] - details['qty_prev'],
+                '体积变化(m³) / Volume delta': details['volume_delta'],
+            }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def save_details(label, details):
+    """保存逐个 SKU 的变化明细 inventory_delta_<label>.csv（无变化时不写） / Save the per-SKU changes to
+    inventory_delta_<label>.csv (nothing is written without changes)
+    """
+    if details.empty:
+        return None
+    csv_path = os.path.join(PARENT_DIR, f"inventory_delta_{label}.csv")
+    details.to_csv(csv_path, index=False, encoding='utf-8-sig')
+    print(f"已保存库存变化明细 Inventory delta saved: {csv_path} ({len(details)} rows)")
+    return csv_path
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+每日指标库 / Persistent daily metrics store
+
+功能说明 Function Description:
+-------------------------------------
+- process_merged_files 每处理完一天，就把每个仓库的指标写入（更新）本地 SQLite 库，主键为 (仓库, 日期)
+  After each processed day, process_merged_files upserts every warehouse's metrics into a local
+  SQLite database keyed on (warehouse, date).
+- generate_weekly_report 直接按日期范围查询（本周、本月至今或任意范围），无需重新解析 xlsx
+  generate_weekly_report queries any date range (this week, month to date, arbitrary) directly,
+  without re-parsing any xlsx file.
+- 汇总范围时，流量指标（入库、出库）按天求和，存量指标（库存、体积）取范围内最后一天
+  When summarising a range, flow metrics (inbound, outbound) are summed over the days and stock
+  metrics (inventory, volume) are taken from the last day in the range.
+- 去重计数指标（SKU 数、订单数）另存每个 (仓库, 日期, 指标) 的精确 ID 集合（字典编码见 id_dictionary，
+  排序、差分后 zlib 压缩），
+  报告时对任意仓库子集和日期范围求并集，同一 SKU 在多天或多个仓库出现只计一次
+  Distinct-count metrics (SKUs, orders) also keep the exact ID set of every (warehouse, date, metric)
+  as dictionary codes (see id_dictionary), sorted, delta-encoded and zlib-compressed; reports union them over any warehouse subset and date range, so a SKU seen
+  on several days or in several warehouses is counted once.
+"""
+
+import os
+import zlib
+import sqlite3
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(PARENT_DIR, "warehouse_metrics.db")
+
+WAREHOUSE_COL = '仓库 / Warehouse'
+FILE_COL = '文件 / File'
+DATE_COL = '日期 / Date'
+
+# 汇总列 → (数据库字段, 类型)；flow = 按天求和，stock = 取最后一天
+# Summary column → (database field, kind); flow = summed over days, stock = last day
+METRICS = {
+    '库存SKU数 / inv_sku_qty_cur': ('inv_sku_qty_cur', 'stock'),
+    '库存总量 / inv_units_qty_cur': ('inv_units_qty_cur', 'stock'),
+    '入库订单数 / ib_order_qty_cur': ('ib_order_qty_cur', 'flow'),
+    '入库SKU数 / ib_sku_qty_cur': ('ib_sku_qty_cur', 'flow'),
+    '入库总量 / ib_units_qty_cur': ('ib_units_qty_cur', 'flow'),
+    '出库订单数 / ob_order_qty_cur': ('ob_order_qty_cur', 'flow'),
+    '出库总量 / ob_units_qty_cur': ('ob_units_qty_cur', 'flow'),
+    '在库总体积(m³ CBM) / inv_total_volume_m3': ('inv_total_volume_m3', 'stock'),
+}
+
+# 数据库字段 → 类型 / Database field → kind
+METRICS_KIND = {field: kind for field, kind in METRICS.values()}
+
+# 汇总行中携带去重 ID 集合的键（不写入 CSV） / Summary row key carrying the distinct ID sets (never written to the CSV)
+DISTINCT_KEY = '_distinct_ids'
+
+# 保存 ID 集合的去重计数指标（数据库字段） / Distinct-count metrics whose ID sets are kept (database fields)
+DISTINCT_FIELDS = ['inv_sku_qty_cur', 'ib_order_qty_cur', 'ib_sku_qty_cur', 'ob_order_qty_cur']
+
+# ===============================================================
+
+
+def connect(db_path=None):
+    """打开（必要时创建）指标库 / Open (and create if needed) the metrics database"""
+    conn = sqlite3.connect(db_path or DB_PATH)
+    fields = ", ".join(f"{field} REAL" for field, _ in METRICS.values())
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS daily_metrics ("
+        f"warehouse TEXT NOT NULL, date TEXT NOT NULL, file TEXT, {fields}, updated_at TEXT, "
+        f"PRIMARY KEY (warehouse, date))"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_metrics_date ON daily_metrics (date)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS distinct_ids ("
+        "warehouse TEXT NOT NULL, date TEXT NOT NULL, metric TEXT NOT NULL, n INTEGER, ids BLOB, "
+        "PRIMARY KEY (warehouse, date, metric))"
+    )
+    return conn
+
+
+def encode_ids(codes):
+    """ID 编码集合 → 压缩字节（排序、差分后压缩） / ID code set → compressed bytes (sorted, delta-encoded)"""
+    codes = np.unique(np.asarray(codes, dtype=np.int64))
+    return zlib.compress(np.diff(codes, prepend=0).astype('<i4').tobytes(), 6)
+
+
+def decode_ids(blob):
+    """压缩字节 → 排序后的 ID 编码数组 / Compressed bytes → sorted array of ID codes"""
+    return np.cumsum(np.frombuffer(zlib.decompress(blob), dtype='<i4'), dtype=np.int64).astype(np.int32)
+
+
+def public_row(row):
+    """去掉汇总行中的内部字段（以 _ 开头：ID 集合、库存快照） / Drop the internal fields (keys starting with _:
+    ID sets, inventory snapshot) from a summary row
+    """
+    return {k: v for k, v in row.items() if not str(k).startswith('_')}
+
+
+def _value(v):
+    return None if pd.isna(v) else float(v)
+
+
+def upsert_day(date, rows, db_path=None):
+    """写入或更新某一天的汇总行 / Insert or update the summary rows of one day
+
+    只更新汇总行中包含的指标（--metrics 只计算部分指标时，其余字段保留原值）。
+    Only the metrics present in the rows are updated (with --metrics computing a subset, the other fields keep their values).
+    """
+    if not rows:
+        return
+    columns = [col for col in METRICS if col in rows[0]]
+    fields = [METRICS[col][0] for col in columns]
+    names = ['warehouse', 'date', 'file', *fields, 'updated_at']
+    sql = (
+        f"INSERT INTO daily_metrics ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+        f"ON CONFLICT (warehouse, date) DO UPDATE SET "
+        + ", ".join(f"{f} = excluded.{f}" for f in names[2:])
+    )
+    now = datetime.now().isoformat(timespec="seconds")
+    params = [
+        (row[WAREHOUSE_COL], date, row.get(FILE_COL), *(_value(row.get(col)) for col in columns), now)
+        for row in rows
+    ]
+    distinct = [
+        (row[WAREHOUSE_COL], date, field, len(np.unique(ids)), encode_ids(ids))
+        for row in rows for field, ids in row.get(DISTINCT_KEY, {}).items() if field in DISTINCT_FIELDS
+    ]
+    with connect(db_path) as conn:
+        conn.executemany(sql, params)
+        conn.executemany(
+            "INSERT INTO distinct_ids (warehouse, date, metric, n, ids) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (warehouse, date, metric) DO UPDATE SET n = excluded.n, ids = excluded.ids",
+            distinct,
+        )
+    conn.close()
+
+
+def load_days(start, end, warehouses=None, db_path=None):
+    """读取日期范围内（含两端）的每日指标，列名与汇总 CSV 一致，另加日期列
+    Load the daily metrics between start and end (inclusive) with the summary CSV column names plus a date column
+    """
+    if not os.path.exists(db_path or DB_PATH):
+        return pd.DataFrame(columns=[DATE_COL, WAREHOUSE_COL, FILE_COL, *METRICS])
+    sql = "SELECT date, warehouse, file, " + ", ".join(f for f, _ in METRICS.values())
+    sql += " FROM daily_metrics WHERE date BETWEEN ? AND ?"
+    params = [str(start), str(end)]
+    if warehouses:
+        sql += f" AND warehouse IN ({', '.join('?' * len(warehouses))})"
+        params += list(warehouses)
+    sql += " ORDER BY date, warehouse"
+    conn = connect(db_path)
+    try:
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    df.columns = [DATE_COL, WAREHOUSE_COL, FILE_COL, *METRICS]
+    return df
+
+
+def summarise_range(start, end, warehouses=None, db_path=None):
+    """按仓库汇总日期范围：流量求和（去重计数取各天 ID 集合的并集），存量取最后一天；无数据时返回 None
+    Summarise a date range per warehouse: flows summed (distinct counts union the daily ID sets), stocks
+    from the last day; None without data
+    """
+    daily = load_days(start, end, warehouses, db_path)
+    if daily.empty:
+        return None
+    flows = [col for col, (_, kind) in METRICS.items() if kind == 'flow']
+    stocks = [col for col, (_, kind) in METRICS.items() if kind == 'stock']
+    grouped = daily.groupby(WAREHOUSE_COL, sort=True)
+    summary = grouped[flows].sum(min_count=1)
+    # 存量取最后一天那一行（该天为空时保持为空，不退回更早的值） / Stocks come from the row of the last day
+    # (blank when that day is blank, never an older day's value)
+    last_day = daily.sort_values(DATE_COL, kind='stable').groupby(WAREHOUSE_COL).tail(1).set_index(WAREHOUSE_COL)
+    summary[stocks] = last_day[stocks]
+    summary[FILE_COL] = last_day[FILE_COL]
+    summary['天数 / days'] = grouped[DATE_COL].nunique()
+
+    # 去重流量指标：各仓库按天求并集，而不是把每天的计数相加
+    # Distinct flow metrics: union the days per warehouse instead of adding the daily counts
+    if daily[DATE_COL].nunique() > 1:
+        for col, (field, kind) in METRICS.items():
+            if kind != 'flow' or field not in DISTINCT_FIELDS:
+                continue
+            for warehouse in summary.index:
+                n = distinct_count(field, start, end, [warehouse], db_path)
+                if n is not None:
+                    summary.loc[warehouse, col] = n
+    return summary.reset_index()[[WAREHOUSE_COL, FILE_COL, *METRICS, '天数 / days']]
+
+
+def distinct_count(field, start, end, warehouses=None, db_path=None):
+    """日期范围内、仓库子集上的精确去重计数；流量指标对全部天求并集，存量指标取每个仓库最后一天的集合
+    Exact distinct count over a date range and a warehouse subset: flow metrics union every day, stock
+    metrics union each warehouse's last day
+
+    某个有指标值的 (仓库, 日期) 缺少 ID 集合时（例如在保存集合之前处理的日期）返回 None，由调用方退回求和。
+    Returns None when a (warehouse, date) with a stored value has no ID set (e.g. a day processed before the
+    sets were kept), so the caller can fall back to adding the counts.
+    """
+    if not os.path.exists(db_path or DB_PATH):
+        return None
+    where = "date BETWEEN ? AND ?"
+    params = [str(start), str(end)]
+    if warehouses:
+        where += f" AND warehouse IN ({', '.join('?' * len(warehouses))})"
+        params += list(warehouses)
+    conn = connect(db_path)
+    try:
+        days = conn.execute(
+            f"SELECT warehouse, date FROM daily_metrics WHERE {where} AND {field} IS NOT NULL", params
+        ).fetchall()
+        kept = dict(((w, d), blob) for w, d, blob in conn.execute(
+            f"SELECT warehouse, date, ids FROM distinct_ids WHERE {where} AND metric = ?", [*params, field]
+        ))
+    finally:
+        conn.close()
+    if not days or any(day not in kept for day in days):
+        return None
+    if METRICS_KIND[field] == 'stock':
+        last = {}
+        for warehouse, date in days:
+            last[warehouse] = max(last.get(warehouse, date), date)
+        days = list(last.items())
+    return int(np.unique(np.concatenate([decode_ids(kept[day]) for day in days])).size)
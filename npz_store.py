@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+不执行代码的二进制存储 / Binary storage that never runs code on load
+
+功能说明 Function Description:
+-------------------------------------
+- 解析缓存、队列完成记录、构建状态记录和日内水位都保存在共享的数据目录或指标库中，可能来自其他主机。
+  它们统一用本模块保存：numpy 数组为 npz 成员，其余结构（字典、列表、标量、DataFrame 的列）为 JSON 树，
+  读取时 allow_pickle=False，文件内容只会被当作数据解析
+  The parse cache, the queue completion records, the build state records and the intraday watermarks
+  live in the shared data directory or the metrics store and may come from other hosts. They are all
+  saved with this module: numpy arrays as npz members, everything else (dicts, lists, scalars,
+  DataFrame columns) as a JSON tree, loaded with allow_pickle=False so the contents are only ever
+  parsed as data.
+- 支持的类型：None、bool、int、float、str、list、tuple、set、dict、numpy 数组和标量、日期时间、
+  pandas DataFrame / Series / Index；其他类型写入时抛出 TypeError
+  Supported types: None, bool, int, float, str, list, tuple, set, dict, numpy arrays and scalars,
+  dates and times, pandas DataFrame / Series / Index; anything else raises TypeError on write.
+- 文件损坏或格式不符时读取抛出 ValueError / A corrupt or foreign file raises ValueError on load.
+"""
+
+import io
+import json
+import zipfile
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+
+# ==================== 配置区 Configuration Area ====================
+
+# JSON 树在 npz 中的成员名 / Name of the npz member holding the JSON tree
+TREE_KEY = "__tree__"
+
+# ===============================================================
+
+_PLAIN = (str, int, float, bool, type(None))
+
+
+def _encode(obj, arrays):
+    """对象 → JSON 树，数组追加到 arrays / Object → JSON tree, arrays are appended to arrays"""
+    if obj is None or isinstance(obj, (str, bool)):
+        return obj
+    if isinstance(obj, np.generic):
+        if obj.dtype.kind in "biuf":
+            return {"$n": obj.dtype.str, "v": obj.item()}
+        return {"$n": obj.dtype.str, "a": _array(np.asarray(obj), arrays)}
+    if isinstance(obj, (int, float)):
+        return obj
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "O":
+            return {"$oa": _encode_list(obj.ravel().tolist(), arrays), "shape": list(obj.shape)}
+        return {"$a": _array(obj, arrays)}
+    if isinstance(obj, dict):
+        if all(isinstance(k, str) and not k.startswith("$") for k in obj):
+            return {k: _encode(v, arrays) for k, v in obj.items()}
+        return {"$d": [[_encode(k, arrays), _encode(v, arrays)] for k, v in obj.items()]}
+    if isinstance(obj, list):
+        return [_encode(v, arrays) for v in obj]
+    if isinstance(obj, tuple):
+        return {"$t": [_encode(v, arrays) for v in obj]}
+    if isinstance(obj, (set, frozenset)):
+        return {"$set": [_encode(v, arrays) for v in obj]}
+    if obj is pd.NaT:
+        return {"$nat": None}
+    if obj is pd.NA:
+        return {"$na": None}
+    if isinstance(obj, pd.Timestamp):
+        return {"$ts": obj.isoformat()}
+    if isinstance(obj, pd.Timedelta):
+        return {"$ptd": obj.value}
+    if isinstance(obj, datetime):
+        return {"$dt": obj.isoformat()}
+    if isinstance(obj, date):
+        return {"$date": obj.isoformat()}
+    if isinstance(obj, time):
+        return {"$time": obj.isoformat()}
+    if isinstance(obj, timedelta):
+        return {"$td": [obj.days, obj.seconds, obj.microseconds]}
+    if isinstance(obj, pd.DataFrame):
+        return {"$df": {"columns": _encode_index(obj.columns, arrays), "index": _encode_index(obj.index, arrays),
+                        "data": [_encode_values(obj.iloc[:, i], arrays) for i in range(obj.shape[1])]}}
+    if isinstance(obj, pd.Series):
+        return {"$s": {"values": _encode_values(obj, arrays), "index": _encode_index(obj.index, arrays),
+                       "name": _encode(obj.name, arrays)}}
+    if isinstance(obj, pd.Index):
+        return {"$i": _encode_index(obj, arrays)}
+    raise TypeError(f"无法保存的类型 Unsupported type: {type(obj).__name__}")
+
+
+def _array(arr, arrays):
+    name = f"a{len(arrays)}"
+    arrays[name] = arr
+    return name
+
+
+def _encode_list(values, arrays):
+    # 全是 JSON 原生标量时整列直接交给 json（C 实现） / A column of JSON-native scalars goes to json (C code) as is
+    if set(map(type, values)) <= set(_PLAIN):
+        return {"plain": values}
+    return {"tagged": [_encode(v, arrays) for v in values]}
+
+
+def _encode_values(values, arrays):
+    """Series / Index 的值 / The values of a Series or Index"""
+    dtype = values.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind != "O":
+        return {"$a": _array(values.to_numpy(), arrays)}
+    encoded = _encode_list(values.to_numpy(dtype=object).tolist(), arrays)
+    return {"$o": encoded} if dtype == object else {"$ext": str(dtype), "values": encoded}
+
+
+def _encode_index(index, arrays):
+    if isinstance(index, pd.RangeIndex):
+        return {"range": [index.start, index.stop, index.step], "name": _encode(index.name, arrays)}
+    return {"values": _encode_values(index, arrays), "name": _encode(index.name, arrays)}
+
+
+def _decode(node, arrays):
+    """JSON 树 → 对象 / JSON tree → object"""
+    if isinstance(node, list):
+        return [_decode(v, arrays) for v in node]
+    if not isinstance(node, dict):
+        return node
+    tag = next((k for k in node if k.startswith("$")), None)
+    if tag is None:
+        return {k: _decode(v, arrays) for k, v in node.items()}
+    value = node[tag]
+    if tag == "$n":
+        if "v" in node:
+            return np.dtype(value).type(node["v"])
+        return arrays[node["a"]][()]
+    if tag == "$a":
+        return arrays[value]
+    if tag == "$oa":
+        return _object_array(_decode_list(value, arrays)).reshape(node["shape"])
+    if tag == "$d":
+        return {_hashable(_decode(k, arrays)): _decode(v, arrays) for k, v in value}
+    if tag == "$t":
+        return tuple(_decode(v, arrays) for v in value)
+    if tag == "$set":
+        return {_hashable(_decode(v, arrays)) for v in value}
+    if tag == "$nat":
+        return pd.NaT
+    if tag == "$na":
+        return pd.NA
+    if tag == "$ts":
+        return pd.Timestamp(value)
+    if tag == "$ptd":
+        return pd.Timedelta(value, unit="ns")
+    if tag == "$dt":
+        return datetime.fromisoformat(value)
+    if tag == "$date":
+        return date.fromisoformat(value)
+    if tag == "$time":
+        return time.fromisoformat(value)
+    if tag == "$td":
+        return timedelta(*value)
+    if tag == "$df":
+        index = _decode_index(value["index"], arrays)
+        df = pd.DataFrame({i: _series(_decode_values(v, arrays), index) for i, v in enumerate(value["data"])},
+                          index=index)
+        df.columns = _decode_index(value["columns"], arrays)
+        return df
+    if tag == "$s":
+        return _series(_decode_values(value["values"], arrays), _decode_index(value["index"], arrays),
+                       _decode(value["name"], arrays))
+    if tag == "$i":
+        return _decode_index(value, arrays)
+    raise ValueError(f"未知的标记 Unknown tag: {tag}")
+
+
+def _hashable(key):
+    # 字典键和集合元素中的列表来自元组 / Lists inside dict keys and set members were tuples
+    return tuple(_hashable(k) for k in key) if isinstance(key, list) else key
+
+
+def _series(values, index, name=None):
+    # 指定原 dtype，object 列不会被推断成其他类型 / The dtype is given so object columns are not re-inferred
+    return pd.Series(values, index=index, name=name, dtype=values.dtype, copy=False)
+
+
+def _object_array(values):
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def _decode_list(node, arrays):
+    if "plain" in node:
+        return node["plain"]
+    return [_decode(v, arrays) for v in node["tagged"]]
+
+
+def _decode_values(node, arrays):
+    if "$a" in node:
+        return arrays[node["$a"]]
+    if "$o" in node:
+        return _object_array(_decode_list(node["$o"], arrays))
+    return pd.array(_object_array(_decode_list(node["values"], arrays)), dtype=node["$ext"])
+
+
+def _decode_index(node, arrays):
+    name = _decode(node["name"], arrays)
+    if "range" in node:
+        return pd.RangeIndex(*node["range"], name=name)
+    values = _decode_values(node["values"], arrays)
+    return pd.Index(values, name=name, dtype=values.dtype)
+
+
+def dump(obj, f, compress=False):
+    """把 obj 写入文件（路径或二进制文件对象） / Write obj to a file (path or binary file object)"""
+    arrays = {}
+    tree = json.dumps(_encode(obj, arrays), ensure_ascii=False).encode("utf-8")
+    arrays[TREE_KEY] = np.frombuffer(tree, dtype=np.uint8)
+    (np.savez_compressed if compress else np.savez)(f, **arrays)
+
+
+def load(f):
+    """从文件（路径或二进制文件对象）读取对象；不会执行文件中的任何内容
+    Read an object from a file (path or binary file object); nothing in the file is ever executed
+    """
+    try:
+        with np.load(f, allow_pickle=False) as npz:
+            tree = json.loads(npz[TREE_KEY].tobytes().decode("utf-8"))
+            return _decode(tree, {name: npz[name] for name in npz.files if name != TREE_KEY})
+    except (zipfile.BadZipFile, KeyError, EOFError, UnicodeDecodeError, TypeError, IndexError, AttributeError) as e:
+        raise ValueError(f"无法读取的存储文件 Unreadable store file: {e}") from e
+
+
+def dumps(obj, compress=False):
+    """obj → bytes（用于 SQLite BLOB） / obj → bytes (for SQLite BLOBs)"""
+    buf = io.BytesIO()
+    dump(obj, buf, compress)
+    return buf.getvalue()
+
+
+def loads(data):
+    """bytes → 对象 / bytes → object"""
+    return load(io.BytesIO(data))
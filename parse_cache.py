@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+解析缓存 / Parse cache for iWMS exports
+
+功能说明 Function Description:
+-------------------------------------
+- 每个解析后的 sheet 以 npz 文件保存在项目目录下的 .parse_cache 中
+  Every parsed sheet is stored as an npz file under .parse_cache in the project directory.
+  流式汇总的结果同样可以缓存（cached_call）。
+  Results of streaming aggregation can be cached the same way (cached_call).
+- 缓存键 = 源文件绝对路径 + 大小 + 修改时间 + 读取参数 + pandas 版本
+  Cache key = absolute source path + size + mtime + reader settings + pandas version.
+  源文件被重新导出（大小或修改时间变化）时缓存自动失效。
+  Re-exporting a source file (size or mtime changes) invalidates its entries automatically.
+- 缓存总大小超过 CACHE_MAX_BYTES 时按最近最少使用（LRU）淘汰
+  When the cache grows past CACHE_MAX_BYTES the least recently used entries are evicted.
+
+存储格式 Storage format:
+-------------------------------------
+数值和日期列为 npz 中连续的 numpy 数组，读取时无需解码单元格；字符串列和出库表第二表头行造成的混合类型列
+按单元格存为 JSON（见 npz_store）。缓存目录可能由多台主机共享（--queue），因此不使用 pickle：
+读取缓存条目不会执行其中的任何内容。
+Numeric and date columns are contiguous numpy arrays in the npz, so loading needs no cell decoding;
+string columns and the mixed-type columns caused by the outbound sheet's second header row are stored
+cell by cell as JSON (see npz_store). The cache directory may be shared by several hosts (--queue), so
+pickle is not used: loading an entry never executes anything in it.
+"""
+
+import os
+import json
+import hashlib
+import pandas as pd
+
+import readers
+import npz_store
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 缓存目录（以 . 开头，合并步骤遍历子文件夹时会自动跳过）
+# Cache directory (dot-prefixed, so the combine step skips it when iterating subfolders)
+CACHE_DIR = os.path.join(PARENT_DIR, ".parse_cache")
+
+# 缓存大小上限（字节），超过后按 LRU 淘汰
+# Size cap in bytes, least recently used entries are evicted beyond it
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# 缓存条目后缀；旧版本留下的 .pkl 条目不再读取，淘汰时删除
+# Cache entry suffix; .pkl entries left by older versions are never read and are removed on eviction
+ENTRY_SUFFIX = ".npz"
+
+# ===============================================================
+
+
+def cache_key(path, **reader_kwargs):
+    """根据源文件状态和读取参数生成缓存键 / Build the cache key from the source file state and reader settings"""
+    st = os.stat(path)
+    payload = {
+        "path": os.path.abspath(path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "reader": {k: reader_kwargs[k] for k in sorted(reader_kwargs)},
+        "pandas": pd.__version__,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, f"{key}{ENTRY_SUFFIX}")
+
+
+def load(key):
+    """读取缓存条目，未命中返回 None / Load a cache entry, None on a miss"""
+    entry = _entry_path(key)
+    try:
+        df = npz_store.load(entry)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[WARN] 缓存条目损坏，已忽略 Corrupt cache entry ignored: {e}")
+        return None
+    # 更新访问时间，用于 LRU 淘汰
+    # Touch the entry so LRU eviction sees it as recently used
+    try:
+        os.utime(entry, None)
+    except OSError:
+        pass
+    return df
+
+
+def store(key, df):
+    """原子写入缓存条目并按需淘汰 / Atomically write a cache entry, then evict if over the cap"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    entry = _entry_path(key)
+    tmp = f"{entry}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            npz_store.dump(df, f)
+        os.replace(tmp, entry)
+    except Exception as e:
+        print(f"[WARN] 写入缓存失败 Cache write failed: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    evict()
+
+
+def evict(max_bytes=None):
+    """删除最久未使用的条目直到总大小不超过上限 / Remove least recently used entries until under the cap"""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = [e for e in os.scandir(CACHE_DIR) if e.is_file() and e.name.endswith((ENTRY_SUFFIX, ".pkl"))]
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for e in [e for e in entries if e.name.endswith(".pkl")]:
+        try:
+            os.remove(e.path)
+            removed += 1
+        except OSError:
+            pass
+    entries = [e for e in entries if e.name.endswith(ENTRY_SUFFIX)]
+    stats = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries))
+    total = sum(size for _, size, _ in stats)
+    for _, size, path in stats:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def cached_call(path, func, use_cache=True, **kwargs):
+    """以源文件状态为键缓存 func(path, **kwargs) 的结果 / Cache func(path, **kwargs) keyed on the source file state
+
+    结果可以是 DataFrame、DataFrame 字典或预先汇总的指标。
+    The result may be a DataFrame, a dict of DataFrames or pre-aggregated metrics.
+    use_cache=False（--no-cache）时直接调用，不读也不写缓存。
+    With use_cache=False (--no-cache) func is called directly and the cache is neither read nor written.
+    """
+    if not use_cache:
+        return func(path, **kwargs)
+
+    key = cache_key(path, func=func.__qualname__, **kwargs)
+    result = load(key)
+    if result is not None:
+        print(f"缓存命中 Cache hit: {os.path.basename(path)}")
+        return result
+
+    result = func(path, **kwargs)
+    store(key, result)
+    return result
+
+
+def read_excel_cached(path, use_cache=True, **reader_kwargs):
+    """带缓存的读取（xlsx 或 CSV，后端见 readers） / Cached read of an xlsx or CSV export (backends: see readers)
+
+    后端是缓存键的一部分 / The backend is part of the cache key.
+    """
+    return cached_call(path, readers.read_table, use_cache, backend=readers.choose_backend(path), **reader_kwargs)
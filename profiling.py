@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+运行剖析与安静模式 / Run profiling and quiet mode
+
+功能说明 Function Description:
+-------------------------------------
+- --profile：每个阶段（发现文件、读取 sheet、写出合并文件、计算指标、汇总、报告）记录一条 JSON 行，
+  包含耗时、处理行数、当前和峰值内存（RSS），以及所属仓库、日期和 sheet
+  --profile: every stage (discovery, sheet read, merged workbook write, metrics, summary, report) writes one
+  JSON line with its duration, rows processed, current and peak RSS, and the warehouse, date and sheet it belongs to.
+- 记录写入 profile_<时间>.jsonl（或 --profile-file 指定的文件），run_program 结束时打印汇总表
+  Records go to profile_<timestamp>.jsonl (or the --profile-file path); run_program prints a summary table at the end.
+- --quiet：不再构造和打印 [DEBUG] 信息 / --quiet: the [DEBUG] messages are neither built nor printed.
+- 设置通过环境变量传递，工作进程和 --subprocess 模式下的各脚本写入同一个文件
+  The settings travel through environment variables, so worker processes and the scripts of --subprocess
+  mode append to the same file.
+"""
+
+import os
+import sys
+import json
+import time
+from datetime import datetime
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 环境变量：剖析输出文件、运行编号、安静模式
+# Environment variables: profile output file, run id, quiet mode
+PROFILE_ENV = "WARELYTIC_PROFILE"
+RUN_ENV = "WARELYTIC_PROFILE_RUN"
+QUIET_ENV = "WARELYTIC_QUIET"
+
+# ===============================================================
+
+# 嵌套 span 的标识字段（仓库、日期、sheet），内层 span 继承外层
+# Identifying fields of the enclosing spans (warehouse, date, sheet); inner spans inherit them
+_context = []
+
+
+def configure(profile=False, profile_file=None, quiet=False):
+    """根据命令行开关启用剖析或安静模式；已由父进程设置时保持不变，返回剖析文件路径
+    Enable profiling or quiet mode from the command-line switches; settings inherited from a parent process
+    are kept. Returns the profile file path (None when profiling is off).
+    """
+    if (profile or profile_file) and not os.environ.get(PROFILE_ENV):
+        started = datetime.now()
+        path = profile_file or os.path.join(PARENT_DIR, f"profile_{started:%Y%m%d_%H%M%S}.jsonl")
+        os.environ[PROFILE_ENV] = os.path.abspath(path)
+        os.environ[RUN_ENV] = f"{started:%Y%m%dT%H%M%S}-{os.getpid()}"
+        print(f"[INFO] 剖析记录写入 Profiling to: {os.environ[PROFILE_ENV]}")
+    if quiet:
+        os.environ[QUIET_ENV] = "1"
+    return profile_path()
+
+
+def configure_from_argv(argv):
+    """按 sys.argv 风格的参数列表配置 / Configure from a sys.argv style argument list"""
+    profile_file = None
+    if "--profile-file" in argv:
+        idx = argv.index("--profile-file")
+        profile_file = argv[idx + 1] if idx + 1 < len(argv) else None
+    return configure("--profile" in argv, profile_file, "--quiet" in argv)
+
+
+def profile_path():
+    """当前剖析文件路径，未启用时为 None / Current profile file path, None when profiling is off"""
+    return os.environ.get(PROFILE_ENV)
+
+
+def verbose():
+    """是否输出 [DEBUG] 信息（--quiet 时为 False） / Whether [DEBUG] messages are printed (False with --quiet)"""
+    return os.environ.get(QUIET_ENV) != "1"
+
+
+def _rss_mb():
+    """当前常驻内存（MB），无法获取时为 None / Current resident memory in MB, None where unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    """进程峰值常驻内存（MB） / Peak resident memory of the process in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 为字节 / KB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _round(value, digits=1):
+    return None if value is None else round(value, digits)
+
+
+@contextmanager
+def span(stage, **fields):
+    """记录一个阶段的耗时与内存；返回的字典可设置 rows 等字段
+    Record the duration and memory of one stage; the yielded dict accepts rows and other fields
+
+    未启用剖析时几乎没有开销 / Nearly free when profiling is off.
+    """
+    path = profile_path()
+    if not path:
+        yield {}
+        return
+    inherited = {}
+    for outer in _context:
+        inherited.update(outer)
+    _context.append(fields)
+    record = {}
+    started = datetime.now()
+    rss_before = _rss_mb()
+    t0 = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        _context.pop()
+        rss_after = _rss_mb()
+        line = {
+            "run": os.environ.get(RUN_ENV),
+            "pid": os.getpid(),
+            "ts": started.isoformat(timespec="milliseconds"),
+            "stage": stage,
+            **inherited,
+            **fields,
+            "seconds": round(seconds, 6),
+            **record,
+            "rss_mb": _round(rss_after),
+            "rss_delta_mb": _round(rss_after - rss_before) if rss_after is not None and rss_before is not None else None,
+            "peak_rss_mb": _round(_peak_rss_mb()),
+        }
+        try:
+            # 每条记录一次追加写入，多个进程可共用一个文件 / One append per record, so processes can share the file
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"[WARN] 写入剖析记录失败 Profile write failed: {e}")
+
+
+def load_records(path=None, run=None):
+    """读取剖析记录（默认当前文件和当前运行） / Load the profile records (current file and run by default)"""
+    path = path or profile_path()
+    run = run or os.environ.get(RUN_ENV)
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r for r in records if run is None or r.get("run") == run]
+
+
+def print_summary(path=None, run=None):
+    """按阶段汇总并打印剖析记录 / Print the profile records aggregated per stage"""
+    records = load_records(path, run)
+    if not records:
+        return
+    stages = {}
+    for r in records:
+        s = stages.setdefault(r["stage"], {"count": 0, "seconds": 0.0, "max": 0.0, "rows": 0, "peak": None})
+        s["count"] += 1
+        s["seconds"] += r["seconds"]
+        s["max"] = max(s["max"], r["seconds"])
+        s["rows"] += r.get("rows") or 0
+        if r.get("peak_rss_mb") is not None:
+            s["peak"] = max(s["peak"] or 0, r["peak_rss_mb"])
+    print("\n" + "=" * 80)
+    print(f"剖析汇总 Profile summary ({len(records)} spans) → {path or profile_path()}")
+    print(f"{'stage':<12}{'count':>7}{'total (s)':>12}{'max (s)':>10}{'rows':>14}{'rows/s':>12}{'peak RSS MB':>13}")
+    for name, s in sorted(stages.items(), key=lambda kv: -kv[1]["seconds"]):
+        rows_per_s = f"{s['rows'] / s['seconds']:,.0f}" if s["rows"] and s["seconds"] else "-"
+        peak = "-" if s["peak"] is None else f"{s['peak']:.0f}"
+        print(f"{name:<12}{s['count']:>7}{s['seconds']:>12.2f}{s['max']:>10.2f}{s['rows'] or '-':>14}{rows_per_s:>12}{peak:>13}")
+    print("=" * 80)
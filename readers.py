@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+可替换的读取后端 / Pluggable reader backends
+
+功能说明 Function Description:
+-------------------------------------
+- combine_excel_sheets 和 process_merged_files 的所有读取都经过 read_table，按文件类型选择后端：
+  All reads of combine_excel_sheets and process_merged_files go through read_table, which picks a backend
+  by file type:
+    * csv      : .csv / .tsv 导出，pandas C 引擎，只读需要的列，标识列声明为字符串
+                 .csv / .tsv exports with the pandas C engine, only the needed columns, identifiers declared as strings
+    * calamine : 本地安装了 python-calamine 时用于 xlsx（Rust 实现，通常比 openpyxl 快数倍）
+                 xlsx when python-calamine is installed locally (Rust, usually several times faster than openpyxl)
+    * openpyxl : xlsx 默认后端（pandas 以只读模式打开工作簿）
+                 default xlsx backend (pandas opens the workbook in read-only mode)
+- --reader 覆盖自动选择（通过环境变量传给工作进程和 --subprocess 模式下的各脚本）
+  --reader overrides the automatic choice (passed to worker processes and --subprocess scripts through
+  the environment).
+- python readers.py --benchmark：在模拟导出（或指定文件）上对每个可用后端计时，把各文件类型最快的后端
+  写入 .reader_choice.json，之后自动选择以此为准
+  python readers.py --benchmark times every available backend on synthetic exports (or the given files) and
+  writes the fastest backend per file type to .reader_choice.json, which the automatic choice then follows.
+
+所有后端接受 read_excel 的参数子集：sheet_name、usecols（列位置）、dtype（按列名）、skiprows（行号列表），
+返回的 DataFrame 与 pd.read_excel 的规则一致，指标逻辑无需区分来源。
+Every backend takes the same subset of read_excel arguments: sheet_name, usecols (positions), dtype (by
+column name) and skiprows (row numbers), and returns frames following pd.read_excel's rules, so the metric
+logic never needs to know where a frame came from.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import importlib.util
+
+import pandas as pd
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 环境变量：强制使用的后端 / Environment variable: forced backend
+READER_ENV = "WARELYTIC_READER"
+
+# 微基准的结果文件 / Micro-benchmark result file
+CHOICE_PATH = os.path.join(PARENT_DIR, ".reader_choice.json")
+
+# 文件类型 → 分隔符 / File type → delimiter
+DELIMITERS = {'.csv': ',', '.tsv': '\t'}
+
+# CSV 编码：带 BOM 的 UTF-8（iWMS 默认），否则为中文 Windows 的 GB18030
+# CSV encodings: UTF-8 with BOM (iWMS default), otherwise GB18030 from Chinese Windows
+CSV_ENCODINGS = ('utf-8-sig', 'gb18030')
+
+# --reader 的可选值 / Choices of --reader
+BACKENDS = ('openpyxl', 'calamine', 'csv')
+
+# ===============================================================
+
+# 已检测的 CSV 编码 {(路径, 大小, 修改时间): 编码} / Detected CSV encodings {(path, size, mtime): encoding}
+_encodings = {}
+
+
+def is_delimited(path):
+    """是否为 CSV/TSV 文件 / Whether the file is a CSV/TSV export"""
+    return os.path.splitext(path)[1].lower() in DELIMITERS
+
+
+def available_backends():
+    """本地可用的后端 / Backends available locally"""
+    found = ['openpyxl', 'csv']
+    if importlib.util.find_spec('python_calamine') is not None:
+        found.insert(1, 'calamine')
+    return found
+
+
+def configure(reader=None):
+    """设置 --reader（'auto' 或 None 表示自动选择） / Apply --reader ('auto' or None = automatic choice)"""
+    if reader and reader != 'auto':
+        if reader not in available_backends():
+            raise ValueError(f"读取后端不可用 Reader backend not available: {reader}. "
+                             f"可选 Available: {', '.join(available_backends())}")
+        os.environ[READER_ENV] = reader
+
+
+def configure_from_argv(argv):
+    """按 sys.argv 风格的参数列表配置 / Configure from a sys.argv style argument list"""
+    if "--reader" in argv:
+        idx = argv.index("--reader")
+        configure(argv[idx + 1] if idx + 1 < len(argv) else None)
+
+
+def _benchmark_choice():
+    try:
+        with open(CHOICE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def choose_backend(path):
+    """为文件选择后端：CSV/TSV 总是 csv；xlsx 依次看 --reader、微基准结果、calamine 是否可用
+    Pick the backend of a file: CSV/TSV always use csv; xlsx follows --reader, then the micro-benchmark
+    result, then whether calamine is available
+    """
+    if is_delimited(path):
+        return 'csv'
+    forced = os.environ.get(READER_ENV)
+    if forced and forced != 'csv':
+        return forced
+    available = available_backends()
+    chosen = _benchmark_choice().get(os.path.splitext(path)[1].lower())
+    if chosen in available and chosen != 'csv':
+        return chosen
+    return 'calamine' if 'calamine' in available else 'openpyxl'
+
+
+def csv_encoding(path):
+    """CSV 的编码：整个文件能按 UTF-8 解码则为 utf-8-sig，否则为 GB18030（每个文件版本只检测一次）
+    Encoding of a CSV: utf-8-sig when the whole file decodes as UTF-8, GB18030 otherwise (detected once per file version)
+    """
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in _encodings:
+        try:
+            with open(path, encoding=CSV_ENCODINGS[0]) as f:
+                while f.read(1 << 20):
+                    pass
+            _encodings[key] = CSV_ENCODINGS[0]
+        except UnicodeDecodeError:
+            _encodings[key] = CSV_ENCODINGS[1]
+    return _encodings[key]
+
+
+def _csv_kwargs(path):
+    return {'sep': DELIMITERS[os.path.splitext(path)[1].lower()], 'encoding': csv_encoding(path), 'engine': 'c',
+            'low_memory': False}
+
+
+def _read_delimited(path, sheet_name=None, usecols=None, dtype=None, skiprows=None, nrows=None):
+    """用 pandas C 引擎读取 CSV/TSV；sheet_name 被忽略（一个文件只有一张表）
+    Read a CSV/TSV with the pandas C engine; sheet_name is ignored (one table per file)
+    """
+    return pd.read_csv(path, usecols=usecols, dtype=dtype, skiprows=skiprows, nrows=nrows, **_csv_kwargs(path))
+
+
+def read_table(path, backend=None, **kwargs):
+    """用选定的后端读取一张表，参数同 pd.read_excel 的子集 / Read one table with the chosen backend, arguments
+    are a subset of pd.read_excel's
+    """
+    backend = backend or choose_backend(path)
+    if backend == 'csv':
+        return _read_delimited(path, **kwargs)
+    return pd.read_excel(path, engine=backend, **kwargs)
+
+
+def head_rows(path, n=2):
+    """CSV/TSV 前 n 个非空行及第一个的行号（与 pandas skiprows 一致，从 0 开始）
+    First n non-blank rows of a CSV/TSV and the 0-based line number of the first one (like pandas skiprows)
+    """
+    with open(path, newline='', encoding=csv_encoding(path)) as f:
+        reader = csv.reader(f, delimiter=DELIMITERS[os.path.splitext(path)[1].lower()])
+        first, rows = None, []
+        for idx, row in enumerate(reader):
+            if first is None and not any(cell.strip() for cell in row):
+                continue
+            if first is None:
+                first = idx
+            rows.append([cell if cell != '' else None for cell in row])
+            if len(rows) == n:
+                break
+    return first, rows
+
+
+def iter_delimited_blocks(path, usecols, names, dtype, skip, chunk_rows, offset=0):
+    """按块读取 CSV/TSV 的指定列（列位置 usecols → 名称 names），跳过前 skip 行
+    Read the given columns of a CSV/TSV in blocks (positions usecols → names), skipping the first skip lines
+
+    offset > 0 时从该字节位置（须为行首）开始读取，skip 从那里算起（日内增量只读新追加的行）。
+    With offset > 0 reading starts at that byte position (a line start) and skip counts from there (the
+    intraday increments read only the appended lines).
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        try:
+            reader = pd.read_csv(f, header=None, skiprows=skip, usecols=usecols, dtype=dtype, chunksize=chunk_rows,
+                                 **_csv_kwargs(path))
+        except pd.errors.EmptyDataError:
+            return
+        with reader:
+            for block in reader:
+                yield block[usecols].set_axis(names, axis=1)
+
+
+# -------------------- 微基准 Micro-benchmark --------------------
+
+def _sample_files(workdir, rows):
+    """生成模拟库存导出（xlsx 和 csv 各一份） / Generate a synthetic inventory export as xlsx and as csv"""
+    import numpy as np
+    import synthetic_exports
+    xlsx = os.path.join(workdir, "commodityInventoryInformationInquiry_bench.xlsx")
+    csv_path = os.path.join(workdir, "commodityInventoryInformationInquiry_bench.csv")
+    synthetic_exports.write_sheet(xlsx, 'Inventory', 'UK', '2025-10-29', rows, 'en', np.random.default_rng(0))
+    synthetic_exports.write_sheet_csv(csv_path, 'Inventory', 'UK', '2025-10-29', rows, 'en', np.random.default_rng(0))
+    return [xlsx, csv_path]
+
+
+def benchmark(files, repeat=3):
+    """对每个文件和每个可用后端计时（取最快的一次），返回 {扩展名: 最快后端} 并打印结果表
+    Time every available backend on every file (best of repeat) and return {extension: fastest backend},
+    printing a results table
+    """
+    best = {}
+    print(f"{'file':<48}{'MB':>8}{'backend':>12}{'seconds':>10}{'rows/s':>14}")
+    for path in files:
+        ext = os.path.splitext(path)[1].lower()
+        candidates = ['csv'] if is_delimited(path) else [b for b in available_backends() if b != 'csv']
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        for backend in candidates:
+            timings, rows = [], 0
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                rows = len(read_table(path, backend=backend))
+                timings.append(time.perf_counter() - t0)
+            seconds = min(timings)
+            print(f"{os.path.basename(path)[:47]:<48}{size_mb:>8.1f}{backend:>12}{seconds:>10.3f}{rows / seconds:>14,.0f}")
+            if ext not in best or seconds < best[ext][1]:
+                best[ext] = (backend, seconds)
+    return {ext: backend for ext, (backend, _) in best.items()}
+
+
+def parse_args(argv=None):
+    """解析命令行参数 / Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="读取后端微基准 / Reader backend micro-benchmark.")
+    parser.add_argument("--benchmark", action="store_true", help="对可用后端计时并保存默认选择 / Time the available backends and save the default choice.")
+    parser.add_argument("files", nargs="*", help="用于计时的导出文件（默认生成模拟文件） / Export files to time (default: synthetic files).")
+    parser.add_argument("--rows", type=int, default=100_000, help="模拟文件行数（默认 100000） / Rows of the synthetic files (default 100000).")
+    parser.add_argument("--repeat", type=int, default=3, help="每个后端重复次数（默认 3） / Repeats per backend (default 3).")
+    parser.add_argument("--no-save", action="store_true", help=f"不写入 {os.path.basename(CHOICE_PATH)} / Do not write {os.path.basename(CHOICE_PATH)}.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.benchmark:
+        print(f"可用后端 Available backends: {', '.join(available_backends())}")
+        print(f"当前选择 Current choice: {json.dumps(_benchmark_choice()) or '-'}")
+        return
+    import tempfile
+    with tempfile.TemporaryDirectory() as workdir:
+        files = args.files or _sample_files(workdir, args.rows)
+        choice = benchmark(files, args.repeat)
+    print(f"最快后端 Fastest backends: {choice}")
+    if not args.no_save:
+        with open(CHOICE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(choice, f)
+        print(f"已保存 Saved: {CHOICE_PATH}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
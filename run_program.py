@@ -1,21 +1,217 @@
 import os
-import sys
+import argparse
 
 # Support CML Parameters, for example:
 # python run_all.py --yesterday
 # python run_all.py 2025-10-29
 # python run_all.py --date 2025-10-29
+# python run_all.py --no-merged-output   (in-process pipeline, skip writing the merged workbooks)
+# python run_all.py --subprocess         (legacy: launch each script separately)
+# python run_all.py --workers 4          (process the warehouse folders with 4 worker processes)
+# python run_all.py --no-cache           (bypass the parse cache in .parse_cache)
+# python run_all.py --no-merged-output --stream-threshold-mb 50   (stream inventory files above 50 MB)
+# python run_all.py --fast-merge         (merge at xlsx package level, only the needed columns are parsed)
+# python run_all.py --from 2025-10-01 --to 2025-10-31 [--long-summary]   (backfill every day of a range)
+# python run_all.py --no-merged-output --metrics report   (compute only the metrics the weekly report uses)
+# python run_all.py --profile [--profile-file run.jsonl] --quiet   (JSON-lines span timings + summary table, no [DEBUG] output)
+# python run_all.py --watch [--poll-seconds 10]   (stay running, process each warehouse as soon as its exports land)
+# python run_all.py --reader calamine      (force a reader backend; CSV/TSV exports are read by the pandas C engine)
+# python run_all.py --dimensions master    (skip the dimension columns, the volume comes from the SKU master)
+# python run_all.py --distributions [--top-k 20]   (top SKUs and lines-per-order distribution in the same scan)
+# python run_all.py --no-merged-output --sheet-workers 8   (parse the largest inventory sheet in 8 row ranges in parallel)
+# python run_all.py --no-merged-output --intraday   (re-exported outbound/inbound files: parse only the appended rows)
+# python run_all.py --queue [--workers 4]   (work queue with lease files; run on several hosts sharing the folder)
+# python run_all.py --force              (ignore the incremental build state in .build_state and rerun every stage)
 
-args = " ".join(sys.argv[1:])  # Concatenate command-line arguments into a single string and then pass that string to second program.
 
-scripts = [
-    f"combine_excel_sheets.py {args}",  # Add the arguments here
-    f"process_merged_files.py {args}",  # Add the arguments here
-    "generate_weekly_report.py",
-]
+def parse_args(argv=None):
+    """Parse the flags owned by run_program; everything else is forwarded to the stages."""
+    parser = argparse.ArgumentParser(
+        description="Run combine → process → report. Unknown arguments are passed on to the stages."
+    )
+    parser.add_argument(
+        "--subprocess",
+        action="store_true",
+        help="Launch each stage as a separate Python script (legacy behaviour).",
+    )
+    parser.add_argument(
+        "--no-merged-output",
+        action="store_true",
+        help="In-process mode only: keep the combined sheets in memory and do not write the merged workbooks.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="In-process mode only: ignore the incremental build state and rerun every unit and the summary.",
+    )
+    parser.add_argument(
+        "--queue",
+        action="store_true",
+        help="Work-queue mode: claim (warehouse, date) units with lease files so several workers or hosts can share the data directory.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and process each warehouse as soon as its three exports for the date are complete.",
+    )
+    parser.add_argument(
+        "--poll-seconds",
+        type=float,
+        default=None,
+        metavar="N",
+        help="Watch mode only: seconds between two scans of the warehouse folders (default 10).",
+    )
+    return parser.parse_known_args(argv)
 
-for script in scripts:
-    print(f"Running {script} ...")
-    os.system(f"python {script}")
 
-print("All done!")
+def run_subprocess(stage_args):
+    args = " ".join(stage_args)  # Concatenate command-line arguments into a single string and then pass that string to second program.
+
+    scripts = [
+        f"combine_excel_sheets.py {args}",  # Add the arguments here
+        f"process_merged_files.py {args}",  # Add the arguments here
+        "generate_weekly_report.py",
+    ]
+
+    for script in scripts:
+        print(f"Running {script} ...")
+        os.system(f"python {script}")
+
+
+def run_in_process(stage_args, write_merged=True, force=False):
+    # Import the stages once; each (warehouse folder, date) unit is read, merged and analysed in one go,
+    # with the DataFrames handed from one stage to the next in memory.
+    # Make-style: a unit whose source contents, code and options are unchanged reuses its stored summary row,
+    # and the summary stage is skipped when no unit changed (see build_state).
+    import combine_excel_sheets
+    import process_merged_files
+    import build_state
+    import distributions
+    from worker_pool import resolve_workers, run_units
+
+    args = combine_excel_sheets.parse_args(stage_args)
+    dates = combine_excel_sheets.resolve_date_range(args)
+    workers = resolve_workers(args.workers)
+
+    metrics = process_merged_files.resolve_metrics(args.metrics)
+    manifest = combine_excel_sheets.preflight(args)
+    units = combine_excel_sheets.plan_units(args, manifest)
+    label = units[0][2] if dates is None and units else f"{dates[0]} → {dates[-1]}" if dates else "-"
+
+    options = build_state.unit_options(write_merged, args, metrics)
+    digests = build_state.load_digests()
+    signatures = [build_state.unit_signature(files, options, digests) for _, _, _, files in units]
+    build_state.save_digests(digests)
+    records = [None if force else build_state.load_unit(item, date, signature)
+               for (item, _, date, _), signature in zip(units, signatures)]
+    stale = [i for i, record in enumerate(records) if record is None]
+    print(f"Running combine + process for {label} (workers: {workers}, "
+          f"{len(units) - len(stale)} unit(s) up to date, {len(stale)} to process) ...")
+
+    # Merged workbooks keep one name per unit and are replaced atomically, so reruns leave no "(1)" copies.
+    tasks = [
+        (item, folder_path, date, args.delete_others, write_merged, not args.no_cache,
+         args.stream_threshold_mb, args.fast_merge, files, metrics, True)
+        for item, folder_path, date, files in (units[i] for i in stale)
+    ]
+    for i, row in zip(stale, run_units(process_merged_files.analyse_folder, tasks, workers)):
+        item, _, date, _ = units[i]
+        outputs = [combine_excel_sheets.merged_output_path(item, date, overwrite=True)] if write_merged else []
+        build_state.store_unit(item, date, signatures[i], row, outputs)
+        records[i] = {"row": row}
+    dated_rows = [(unit[2], record["row"]) for unit, record in zip(units, records) if record["row"] is not None]
+
+    # The summary depends on every unit that produced a row; a row without a signature (missing files,
+    # --delete-others) can always have changed.
+    produced = [(unit[0], unit[2], signature)
+                for unit, signature, record in zip(units, signatures, records) if record["row"] is not None]
+    summary_signature = None if any(s is None for _, _, s in produced) else build_state.summary_signature(
+        produced, [dates, args.long_summary, distributions.top_k()])
+    summary_label = dates[0] + "_to_" + dates[-1] if dates else label
+    if not force and summary_signature and build_state.summary_is_fresh(summary_label, summary_signature):
+        print("Summary and report are up to date, nothing to rewrite (use --force to rebuild).")
+        return
+    finish_run(args, dates, dated_rows)
+    if dated_rows and summary_signature:
+        if dates is None:
+            outputs = [process_merged_files.summary_csv_path(dated_rows[0][0])]
+        elif args.long_summary:
+            outputs = [process_merged_files.summary_csv_path(summary_label)]
+        else:
+            outputs = [process_merged_files.summary_csv_path(date) for date in dict.fromkeys(d for d, _ in dated_rows)]
+        build_state.store_summary(summary_label, summary_signature, outputs)
+
+
+def finish_run(args, dates, dated_rows):
+    # Write the summaries (and the weekly report for a single day) from the [(date, summary row)] of a run.
+    import process_merged_files
+    import generate_weekly_report
+    import profiling
+    from dates import coerce_date
+
+    if not dated_rows:
+        print("Nothing combined, skipping the remaining stages.")
+        return
+
+    if dates is not None:
+        # Backfill: summaries per day (or one long-format file), every day is also stored in the metrics store.
+        process_merged_files.save_summaries(dated_rows, args.long_summary)
+        print("Backfill finished, weekly report not regenerated "
+              "(run generate_weekly_report.py --from/--to to report on the range).")
+        return
+    date = dated_rows[0][0]
+    summary = process_merged_files.save_summary([row for _, row in dated_rows], date)
+
+    # The report covers the Monday - Friday week of the processed date, read from the metrics store.
+    print("Running generate_weekly_report ...")
+    start, end = generate_weekly_report.week_range(coerce_date(str(date)))
+    with profiling.span("report"):
+        generate_weekly_report.main(summary, start, end)
+
+
+def run_queue(stage_args, write_merged=True):
+    # Work-queue mode: pull (warehouse, date) units claimed with lease files, so several processes or hosts
+    # can share one data directory; the summary is written once, by whichever worker claims it last.
+    import combine_excel_sheets
+    import work_queue
+    from worker_pool import resolve_workers
+
+    args = combine_excel_sheets.parse_args(stage_args)
+    work_queue.run(stage_args, write_merged, resolve_workers(args.workers))
+    with work_queue.summary_claim(stage_args, write_merged) as dated_rows:
+        if dated_rows is None:
+            print("Summary is written by another worker (or was already written).")
+            return
+        finish_run(args, combine_excel_sheets.resolve_date_range(args), dated_rows)
+
+
+if __name__ == "__main__":
+    opts, stage_args = parse_args()
+    # Profiling settings are exported through the environment, so workers and --subprocess scripts share one file.
+    import profiling
+    import readers
+    import sku_master
+    import distributions
+    import sheet_ranges
+    import intraday
+    profiling.configure_from_argv(stage_args)
+    readers.configure_from_argv(stage_args)
+    sku_master.configure_from_argv(stage_args)
+    distributions.configure_from_argv(stage_args)
+    sheet_ranges.configure_from_argv(stage_args)
+    intraday.configure_from_argv(stage_args)
+    mode = "watch" if opts.watch else "queue" if opts.queue else "subprocess" if opts.subprocess else "in-process"
+    with profiling.span("pipeline", mode=mode):
+        if opts.watch:
+            import watch_exports
+            watch_exports.watch(stage_args, write_merged=not opts.no_merged_output,
+                                poll_seconds=opts.poll_seconds or watch_exports.POLL_SECONDS)
+        elif opts.queue:
+            run_queue(stage_args, write_merged=not opts.no_merged_output)
+        elif opts.subprocess:
+            run_subprocess(stage_args)
+        else:
+            run_in_process(stage_args, write_merged=not opts.no_merged_output, force=opts.force)
+    if profiling.profile_path():
+        profiling.print_summary()
+    print("All done!")
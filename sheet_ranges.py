@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+单个大工作表的按行区间并行读取 / Reading one large worksheet in parallel by row ranges
+
+功能说明 Function Description:
+-------------------------------------
+- 按仓库并行时，最大的那个库存导出决定整个阶段的耗时。--sheet-workers N 把一个工作表按行号切成 N 个区间，
+  每个工作进程只解析自己区间内的行并预先汇总（见 process_merged_files.stream_sheet_metrics），最后合并部分结果
+  With per-warehouse parallelism the largest inventory export decides the runtime of the whole stage.
+  --sheet-workers N cuts one worksheet into N row ranges; every worker process parses and pre-aggregates
+  only the rows of its range (see process_merged_files.stream_sheet_metrics) and the partial results are merged.
+- 区间边界对齐到流式汇总的批大小，每一批的内容与串行运行完全相同，部分结果按批的顺序合并，
+  因此求和（包括浮点体积）、去重集合、快照和异常样本都与串行运行逐位一致
+  Range boundaries are aligned to the streaming block size, so every block holds exactly the rows of the
+  serial run and the partial results are merged in block order: sums (floating-point volume included),
+  distinct sets, snapshots and exception samples are identical to a serial run.
+- 每个工作进程解压工作表 XML，快速跳过区间之前的数据（只看每段最后一行的行号），再把区间内的 <row>
+  元素交给 openpyxl 自己的 WorkSheetParser：单元格类型、共享字符串、日期和缺行的处理与 openpyxl 只读模式相同
+  Every worker inflates the worksheet XML, skips the data before its range quickly (only the row number
+  of the last row of each piece is read) and hands the <row> elements of its range to openpyxl's own
+  WorkSheetParser, so cell types, shared strings, dates and missing rows are handled as in openpyxl's
+  read-only mode.
+- 没有尺寸信息（<dimension>）、带前缀的 XML 或缺少行号的工作表抛出 RangeReadUnsupported，调用方退回串行读取
+  Worksheets without a <dimension>, with prefixed XML or without row numbers raise RangeReadUnsupported
+  and the caller falls back to the serial read.
+- 依赖 openpyxl 的内部接口（WorkSheetParser、ws._get_source / _shared_strings / _get_row、wb._date_formats /
+  _timedelta_formats），只在 TESTED_OPENPYXL 列出的版本上启用；其他版本或内部接口变化时同样抛出
+  RangeReadUnsupported，升级 openpyxl 前须重新验证
+  Depends on openpyxl internals (WorkSheetParser, ws._get_source / _shared_strings / _get_row,
+  wb._date_formats / _timedelta_formats) and is only enabled on the versions listed in TESTED_OPENPYXL;
+  other versions, or changed internals, raise RangeReadUnsupported as well. Re-verify before upgrading openpyxl.
+"""
+
+import io
+import os
+import re
+
+import openpyxl
+
+try:
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:  # 内部模块已变化 / The internal module changed
+    WorkSheetParser = None
+
+# ==================== 配置区 Configuration Area ====================
+
+# 环境变量：单个工作表的工作进程数 / Environment variable: worker processes per worksheet
+SHEET_WORKERS_ENV = "WARELYTIC_SHEET_WORKERS"
+
+# 启用 --sheet-workers 时，超过该大小（MB）的库存文件即使低于流式阈值也按行区间并行汇总
+# With --sheet-workers, inventory files above this size (MB) are aggregated by row ranges even below the
+# streaming threshold
+PARALLEL_MIN_MB = 10
+
+# 每次从压缩包读取的解压字节数 / Inflated bytes read from the package at a time
+READ_BYTES = 4 * 1024 * 1024
+
+# 每次交给 WorkSheetParser 的行数 / Rows handed to WorkSheetParser at a time
+PARSE_ROWS = 10_000
+
+# 验证过的 openpyxl 版本（前缀） / openpyxl versions the reader was verified against (prefixes)
+TESTED_OPENPYXL = ('3.1.',)
+
+# ===============================================================
+
+ROOT_RE = re.compile(rb"<worksheet\b[^>]*>")
+ROW_NUMBER_RE = re.compile(rb'<row\b[^>]*?\sr="(\d+)"')
+SHARED_CELL_RE = re.compile(rb'(<c\b[^>]*?\st="s"[^>]*>\s*<v>)(\d+)(</v>)')
+
+
+class RangeReadUnsupported(Exception):
+    """工作表无法按行区间读取 / The worksheet cannot be read by row ranges"""
+
+
+class PrefixChanged(Exception):
+    """区间之前的行与预期的哈希不一致 / The rows before the range do not match the expected hash"""
+
+
+def configure(workers=None):
+    """设置 --sheet-workers（0 = 全部核心，None 或 1 = 不拆分） / Apply --sheet-workers (0 = all cores,
+    None or 1 = no split)
+    """
+    if workers is not None:
+        from worker_pool import resolve_workers
+        os.environ[SHEET_WORKERS_ENV] = str(resolve_workers(workers))
+
+
+def configure_from_argv(argv):
+    """按 sys.argv 风格的参数列表配置 / Configure from a sys.argv style argument list"""
+    if "--sheet-workers" in argv:
+        idx = argv.index("--sheet-workers")
+        configure(argv[idx + 1] if idx + 1 < len(argv) else None)
+
+
+def workers():
+    """单个工作表的工作进程数（1 = 串行） / Worker processes per worksheet (1 = serial)"""
+    return int(os.environ.get(SHEET_WORKERS_ENV) or 1)
+
+
+def _check_openpyxl():
+    """当前 openpyxl 不在验证过的版本中或缺少所需内部接口时抛出 RangeReadUnsupported
+    Raise RangeReadUnsupported when the installed openpyxl is not a verified version or lacks the internals used
+    """
+    if WorkSheetParser is None or not openpyxl.__version__.startswith(TESTED_OPENPYXL):
+        raise RangeReadUnsupported(f"openpyxl {openpyxl.__version__} 未经验证 not verified "
+                                   f"(tested {', '.join(v + 'x' for v in TESTED_OPENPYXL)})")
+
+
+def _internals(wb, ws):
+    """按行区间读取用到的 openpyxl 内部接口 / The openpyxl internals the range reader uses"""
+    try:
+        return (ws._get_source, ws._shared_strings, wb._date_formats, wb._timedelta_formats, ws._get_row)
+    except AttributeError as e:
+        raise RangeReadUnsupported(f"openpyxl {openpyxl.__version__} 内部接口已变化 internals changed: {e}") from e
+
+
+def _open_sheet(path, sheet=None):
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    return wb, wb[sheet] if sheet else wb.worksheets[0]
+
+
+def sheet_rows(path, sheet=None):
+    """工作表 <dimension> 中的最后一行 / Last row of the worksheet according to its <dimension>"""
+    _check_openpyxl()
+    wb, ws = _open_sheet(path, sheet)
+    try:
+        if ws.max_row is None:
+            raise RangeReadUnsupported(f"{os.path.basename(path)}: 工作表没有尺寸信息 worksheet has no dimension")
+        return ws.max_row
+    finally:
+        wb.close()
+
+
+def plan(first_row, last_row, chunk_rows, parts):
+    """把 first_row..last_row 切成最多 parts 个区间 [(lo, hi)]，边界落在 chunk_rows 的整数倍上；
+    不足两批时返回空列表
+    Cut first_row..last_row into at most parts ranges [(lo, hi)] whose boundaries fall on multiples of
+    chunk_rows; an empty list when there are fewer than two blocks
+    """
+    blocks = max(0, -(-(last_row - first_row + 1) // chunk_rows))
+    parts = min(parts, blocks)
+    if parts < 2:
+        return []
+    cuts = [first_row + blocks * k // parts * chunk_rows for k in range(parts + 1)]
+    return [(cuts[k], min(cuts[k + 1] - 1, last_row)) for k in range(parts)]
+
+
+def _row_number(element, path):
+    match = ROW_NUMBER_RE.match(element)
+    if match is None:
+        raise RangeReadUnsupported(f"{os.path.basename(path)}: 行缺少行号 row without a row number")
+    return int(match.group(1))
+
+
+def _hash_rows(digest, xml, strings):
+    """用 <row> XML 更新 digest，共享字符串单元格换成其文本：只改了共享字符串表的重新导出也会被发现
+    Update digest with <row> XML whose shared-string cells carry their text instead of the index, so a
+    re-export that only changed the shared string table is noticed too
+    """
+    def text(match):
+        idx = int(match.group(2))
+        value = strings[idx] if idx < len(strings) else None
+        return match.group(1) + (b"" if value is None else str(value).encode("utf-8")) + match.group(3)
+    digest.update(SHARED_CELL_RE.sub(text, xml))
+
+
+def _row_elements(src, lo, path, digest=None, expected=None, strings=()):
+    """解压后的工作表中行号 >= lo 的 <row> 元素 (行号, 字节)，以及开头的 <worksheet> 标签（第一个产出值）
+    The <row> elements (row number, bytes) of the inflated worksheet with a row number >= lo, preceded by the
+    opening <worksheet> tag (first value yielded)
+
+    每段数据先看最后一行的行号，整段都在 lo 之前时直接丢弃 / Each piece is dropped whole when its last row is before lo.
+    digest 用 lo 之前的 <row> 元素更新（共享字符串按 strings 换成文本，见 _hash_rows）；给出 expected 时，
+    到达 lo（或工作表末尾）时其十六进制摘要须与之相同，否则抛出 PrefixChanged。
+    digest is updated with the <row> elements before lo (shared strings replaced by their text from strings,
+    see _hash_rows); with expected given, its hex digest must equal expected on reaching lo (or the end of the
+    worksheet), otherwise PrefixChanged is raised.
+    """
+    buf, root, checked = b"", None, expected is None
+
+    def check():
+        if digest.hexdigest() != expected:
+            raise PrefixChanged(f"{os.path.basename(path)}: 第 {lo} 行之前的内容已变化 rows before {lo} changed")
+        return True
+
+    while True:
+        data = src.read(READ_BYTES)
+        buf += data
+        if root is None:
+            match = ROOT_RE.search(buf)
+            if match is None:
+                if not data or b"<sheetData" in buf:
+                    raise RangeReadUnsupported(f"{os.path.basename(path)}: 带前缀的 XML prefixed worksheet XML")
+                continue
+            root = match.group(0)
+            yield root
+        end = buf.find(b"</sheetData>")
+        if end >= 0:
+            piece, final = buf[:end], True
+        elif not data:
+            raise RangeReadUnsupported(f"{os.path.basename(path)}: 工作表不完整 truncated worksheet")
+        else:
+            cut = buf.rfind(b"<row ")
+            if cut <= 0:
+                continue
+            piece, buf, final = buf[:cut], buf[cut:], False
+        first = piece.find(b"<row ")
+        if first >= 0 and _row_number(piece[piece.rfind(b"<row "):], path) >= lo:
+            for element in piece[first + 5:].split(b"<row "):
+                element = b"<row " + element
+                idx = _row_number(element, path)
+                if idx >= lo:
+                    checked = checked or check()
+                    yield idx, element
+                elif digest is not None:
+                    _hash_rows(digest, element, strings)
+        elif first >= 0 and digest is not None:
+            _hash_rows(digest, piece[first:], strings)
+        if final:
+            checked = checked or check()
+            return
+
+
+def iter_rows(path, sheet=None, lo=1, hi=None, digest=None, expected=None):
+    """读取第 lo..hi 行的值，与 ws.iter_rows(min_row=lo, max_row=hi, values_only=True) 相同
+    Read the values of rows lo..hi, as ws.iter_rows(min_row=lo, max_row=hi, values_only=True) would
+
+    与 openpyxl 一样，区间内缺失的行补为空行，但只补到最后一个存在的行（或后面还有行时补到 hi）。
+    Like openpyxl, missing rows inside the range are filled with empty rows, up to the last row present
+    (or up to hi when rows follow the range).
+    digest（hashlib 对象）依次用 hi 及之前所有行的 <row> 元素更新（见 _hash_rows），expected 见 _row_elements（日内增量使用）。
+    digest (a hashlib object) is updated with the <row> elements of every row up to hi in order (see
+    _hash_rows); expected: see _row_elements (used by the intraday increments).
+    """
+    _check_openpyxl()
+    wb, ws = _open_sheet(path, sheet)
+    hi = hi or ws.max_row
+    max_col = ws.max_column
+    empty_row = (None,) * max_col if max_col else ()
+    try:
+        get_source, shared_strings, date_formats, timedelta_formats, get_row = _internals(wb, ws)
+        with get_source() as src:
+            elements = _row_elements(src, lo, path, digest, expected, shared_strings)
+            root = next(elements)
+            counter, batch, more = lo, [], False
+
+            def parse(batch):
+                xml = root + b"<sheetData>" + b"".join(batch) + b"</sheetData></worksheet>"
+                parser = WorkSheetParser(io.BytesIO(xml), shared_strings, data_only=True, epoch=wb.epoch,
+                                         date_formats=date_formats, timedelta_formats=timedelta_formats)
+                return parser.parse()
+
+            def flush(batch, counter):
+                rows = []
+                try:
+                    for idx, cells in parse(batch):
+                        rows.extend(empty_row for _ in range(counter, idx))
+                        if counter <= idx:
+                            rows.append(get_row(cells, 1, max_col, values_only=True))
+                            counter = idx + 1
+                except (AttributeError, TypeError) as e:
+                    # 内部接口的签名或结构变化 / Signature or structure of the internals changed
+                    raise RangeReadUnsupported(f"openpyxl {openpyxl.__version__} 内部接口已变化 "
+                                               f"internals changed: {e}") from e
+                return rows, counter
+
+            for idx, element in elements:
+                if idx > hi:
+                    more = True
+                    break
+                batch.append(element)
+                if digest is not None:
+                    _hash_rows(digest, element, shared_strings)
+                if len(batch) >= PARSE_ROWS:
+                    rows, counter = flush(batch, counter)
+                    yield from rows
+                    batch = []
+            elements.close()
+            if batch:
+                rows, counter = flush(batch, counter)
+                yield from rows
+            if more:
+                for _ in range(counter, hi + 1):
+                    yield empty_row
+    finally:
+        wb.close()
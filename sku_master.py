@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SKU 主数据：按 SKU 保存的尺寸 / SKU master: per-SKU dimensions
+
+功能说明 Function Description:
+-------------------------------------
+- 每个 SKU（字典编码见 id_dictionary）的长、宽、高按来源日期保存在指标库（warehouse_metrics.db）的
+  sku_master_history 表中，只记录变化；每天的库存表和入库表（有尺寸列时）在写入指标库时增量更新
+  The length, width and height of every SKU (codes from id_dictionary) are kept per source date in the
+  sku_master_history table of the metrics store (warehouse_metrics.db), changes only. Each day's inventory
+  sheet and inbound sheet (when it has dimension columns) update it incrementally when the day is recorded.
+- 处理某一天时只使用该日期之前看到的尺寸（见 set_date），因此重跑同一天或回填较早的日期结果不变
+  A day only uses dimensions seen before its date (see set_date), so rerunning a day or backfilling older
+  dates gives the same result.
+- 查找是向量化的：每个进程把主数据读入按 SKU 编码下标的稠密数组（每个日期一份），一次取整列
+  Lookups are vectorized: each process loads the master into dense arrays indexed by SKU code (one per
+  date) and fetches a whole column at once.
+- 体积指标中尺寸缺失或为 0 的行用主数据中的尺寸补全，补全的体积单独作为 inv_volume_filled_m3 报告；
+  主数据中也没有的行数记为 inv_volume_unresolved，不为 0 时打印 [WARN]
+  Rows of the volume metric with missing or zero dimensions are filled from the master; the filled volume
+  is reported on its own as inv_volume_filled_m3. Rows the master cannot resolve either are counted as
+  inv_volume_unresolved, with a [WARN] when there are any.
+- --dimensions master：完全不读取尺寸列，体积全部按数量 × 主数据尺寸计算（主数据中没有的 SKU 计入
+  inv_volume_unresolved）；此模式下主数据不更新，需要定期以默认模式运行。主数据为空时退回默认模式
+  --dimensions master reads no dimension column at all; the volume is quantity × master dimensions (SKUs
+  missing from the master are counted in inv_volume_unresolved). The master is not updated in this mode, so
+  run the default mode regularly. With an empty master the default mode is used instead.
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+import numpy as np
+
+import metrics_store
+
+# ==================== 配置区 Configuration Area ====================
+
+# 环境变量：尺寸来源 / Environment variable: dimension source
+DIMENSIONS_ENV = "WARELYTIC_DIMENSIONS"
+
+# --dimensions 的可选值：sheet = 读取尺寸列（缺失时用主数据补全），master = 只用主数据
+# Choices of --dimensions: sheet = read the dimension columns (gaps filled from the master), master = master only
+MODES = ('sheet', 'master')
+
+# 尺寸字段（见 process_merged_files.SHEET_COLUMNS） / Dimension fields (see process_merged_files.SHEET_COLUMNS)
+DIMENSION_FIELDS = ['length', 'width', 'height']
+
+# 环境变量：正在处理的日期，只使用该日期之前的尺寸 / Environment variable: the date being processed; only
+# dimensions seen before it are used
+DATE_ENV = "WARELYTIC_DIMENSIONS_DATE"
+
+# 汇总行中携带当天尺寸观测的键（不写入 CSV） / Summary row key carrying the day's observed dimensions (never written to the CSV)
+DIMENSIONS_KEY = '_sku_dimensions'
+
+# SQLite 写锁等待时间（秒） / SQLite lock timeout in seconds
+LOCK_TIMEOUT = 60
+
+# ===============================================================
+
+# 本进程读入的主数据 {库路径: (版本, 编码, 日期, 单件体积, {日期: 稠密数组})}
+# Master loaded in this process {db path: (revision, codes, dates, unit volumes, {date: dense array})}
+_loaded = {}
+
+
+def configure(mode=None):
+    """设置 --dimensions（None 表示默认的 sheet）；主数据为空时 master 退回 sheet
+    Apply --dimensions (None = the default, sheet); master falls back to sheet while the master is empty
+    """
+    if mode == 'master' and revision() == 0:
+        print("[WARN] SKU 主数据为空，--dimensions master 改为读取尺寸列 "
+              "The SKU master is empty, --dimensions master falls back to the dimension columns")
+        mode = MODES[0]
+    if mode:
+        os.environ[DIMENSIONS_ENV] = mode
+
+
+def configure_from_argv(argv):
+    """按 sys.argv 风格的参数列表配置 / Configure from a sys.argv style argument list"""
+    if "--dimensions" in argv:
+        idx = argv.index("--dimensions")
+        configure(argv[idx + 1] if idx + 1 < len(argv) else None)
+
+
+def mode():
+    """当前的尺寸来源 / Current dimension source"""
+    return os.environ.get(DIMENSIONS_ENV) or MODES[0]
+
+
+def from_master():
+    """是否只用主数据中的尺寸（不读取尺寸列） / Whether dimensions come from the master only (no dimension columns read)"""
+    return mode() == 'master'
+
+
+def set_date(date=None):
+    """设置正在处理的日期（None 表示使用全部尺寸） / Set the date being processed (None = every dimension)"""
+    if date:
+        os.environ[DATE_ENV] = str(date)
+    else:
+        os.environ.pop(DATE_ENV, None)
+
+
+def connect(db_path=None):
+    """打开指标库并确保主数据表存在 / Open the metrics store and make sure the master tables exist"""
+    conn = sqlite3.connect(db_path or metrics_store.DB_PATH, timeout=LOCK_TIMEOUT)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sku_master_history ("
+        "code INTEGER NOT NULL, source_date TEXT NOT NULL, length REAL, width REAL, height REAL, updated_at TEXT, "
+        "PRIMARY KEY (code, source_date))"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS sku_master_meta (key TEXT PRIMARY KEY, value INTEGER)")
+    return conn
+
+
+def revision(db_path=None):
+    """主数据的版本号，每次有变化的更新加一；用作缓存键的一部分
+    Revision of the master, bumped by every update that changes it; part of the cache key of anything
+    computed from it
+    """
+    if not os.path.exists(db_path or metrics_store.DB_PATH):
+        return 0
+    conn = connect(db_path)
+    try:
+        found = conn.execute("SELECT value FROM sku_master_meta WHERE key = 'revision'").fetchone()
+    finally:
+        conn.close()
+    return found[0] if found else 0
+
+
+def token(db_path=None):
+    """尺寸来源和主数据版本，作为缓存键 / Dimension source and master revision, used as a cache key"""
+    return f"{mode()}:{revision(db_path)}"
+
+
+def _history(path):
+    """按 (编码, 日期) 排序的尺寸记录 (版本, 编码, 日期, 单件体积, 缓存)，版本变化时重新读取
+    Dimension records sorted by (code, date) as (revision, codes, dates, unit volumes, cache), reloaded when
+    the revision changes
+    """
+    current = revision(path)
+    if path not in _loaded or _loaded[path][0] != current:
+        rows = []
+        if current:
+            conn = connect(path)
+            try:
+                rows = conn.execute("SELECT code, source_date, length * width * height FROM sku_master_history "
+                                    "ORDER BY code, source_date").fetchall()
+            finally:
+                conn.close()
+        codes = np.array([r[0] for r in rows], dtype=np.int64)
+        dates = np.array([r[1] for r in rows], dtype=str)
+        volumes = np.array([r[2] for r in rows], dtype=np.float64)
+        _loaded[path] = (current, codes, dates, volumes, {})
+    return _loaded[path]
+
+
+def _unit_volumes(db_path=None, date=None):
+    """按 SKU 编码下标的单件体积数组（长 × 宽 × 高，未知为 NaN），取 date 之前每个 SKU 最后一次记录的尺寸
+    Unit volume array indexed by SKU code (length × width × height, NaN when unknown), from the last record
+    of every SKU before date
+    """
+    _, codes, dates, volumes, cache = _history(db_path or metrics_store.DB_PATH)
+    if date not in cache:
+        keep = dates < date if date else np.ones(codes.size, dtype=bool)
+        codes, volumes = codes[keep], volumes[keep]
+        # 按编码、日期排序，每个编码的最后一条即最新的尺寸 / Sorted by code and date, the last record of each code is the latest
+        last = np.append(codes[1:] != codes[:-1], True) if codes.size else np.zeros(0, dtype=bool)
+        dense = np.full(int(codes.max()) + 1 if codes.size else 0, np.nan)
+        dense[codes[last]] = volumes[last]
+        cache[date] = dense
+    return cache[date]
+
+
+def unit_volume(codes, db_path=None, date=None):
+    """SKU 编码数组 → 主数据中的单件体积（mm³，未知为 NaN）；date 默认为 set_date 设置的日期
+    SKU code array → unit volume from the master (mm³, NaN when unknown); date defaults to the one given to set_date
+    """
+    volumes = _unit_volumes(db_path, date or os.environ.get(DATE_ENV))
+    codes = np.asarray(codes, dtype=np.int64)
+    out = np.full(codes.size, np.nan)
+    known = (codes >= 0) & (codes < volumes.size)
+    out[known] = volumes[codes[known]]
+    return out
+
+
+def observe(codes, length, width, height):
+    """一批行中的有效尺寸（三个都为正数），每个 SKU 保留最后一行
+    Valid dimensions of a block (all three positive), keeping the last row of every SKU
+
+    返回 {'code', 'length', 'width', 'height'} 数组 / Returns arrays {'code', 'length', 'width', 'height'}.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    dims = [np.asarray(d, dtype=np.float64) for d in (length, width, height)]
+    valid = (codes >= 0) & (dims[0] > 0) & (dims[1] > 0) & (dims[2] > 0)
+    codes, dims = codes[valid], [d[valid] for d in dims]
+    # 反转后 np.unique 取第一次出现，即原顺序的最后一行 / After reversing, np.unique's first hit is the last row
+    _, last = np.unique(codes[::-1], return_index=True)
+    keep = codes.size - 1 - last
+    return {'code': codes[keep], 'length': dims[0][keep], 'width': dims[1][keep], 'height': dims[2][keep]}
+
+
+def merge_observations(parts):
+    """合并多批（或多个 sheet）的尺寸观测，后面的优先 / Merge the observations of several blocks (or sheets),
+    later ones win
+    """
+    parts = [p for p in parts if p is not None and p['code'].size]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return observe(*(np.concatenate([p[f] for p in parts]) for f in ('code', *DIMENSION_FIELDS)))
+
+
+def store_day(date, rows, db_path=None):
+    """用某一天各仓库的尺寸观测更新主数据；只记录与该日期之前（含当天）最后一次记录不同的尺寸
+    Update the master with the day's observed dimensions of every warehouse; only dimensions that differ
+    from the last record on or before the date are kept
+    """
+    parts = merge_observations([row.get(DIMENSIONS_KEY) for row in rows])
+    if parts is None:
+        return 0
+    now = datetime.now().isoformat(timespec="seconds")
+    params = [(int(c), str(date), float(l), float(w), float(h), now)
+              for c, l, w, h in zip(parts['code'], parts['length'], parts['width'], parts['height'])]
+    conn = connect(db_path)
+    try:
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT INTO sku_master_history (code, source_date, length, width, height, updated_at) "
+                "SELECT ?1, ?2, ?3, ?4, ?5, ?6 WHERE (?3, ?4, ?5) IS NOT ("
+                "SELECT length, width, height FROM sku_master_history WHERE code = ?1 AND source_date <= ?2 "
+                "ORDER BY source_date DESC LIMIT 1) "
+                "ON CONFLICT (code, source_date) DO UPDATE SET "
+                "length = excluded.length, width = excluded.width, height = excluded.height, "
+                "updated_at = excluded.updated_at",
+                params,
+            )
+            changed = conn.total_changes - before
+            if changed:
+                conn.execute(
+                    "INSERT INTO sku_master_meta VALUES ('revision', 1) "
+                    "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+                )
+    finally:
+        conn.close()
+    return changed
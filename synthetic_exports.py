@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+模拟 iWMS 导出文件生成器 / Synthetic iWMS export generator
+
+功能说明 Function Description:
+-------------------------------------
+- 在目标目录下生成 UK/DE/NL/FR 文件夹，每个文件夹包含某一天的
+  checkPackageNumber（出库）/ acceptanceOfDataQuery（入库）/ commodityInventoryInformationInquiry（库存）xlsx 文件
+  Builds UK/DE/NL/FR folders under the target directory, each holding one day's
+  checkPackageNumber (outbound) / acceptanceOfDataQuery (inbound) / commodityInventoryInformationInquiry (inventory) xlsx files.
+- 表头可以是中文或英文（默认 UK/NL 英文，DE/FR 中文），出库表带第二表头行，与真实导出一致
+  Headers are CN or EN (default: UK/NL English, DE/FR Chinese); the outbound sheet carries the extra
+  header row just like the real exports.
+- 分块直接写出工作表 XML，内存占用与行数无关，可生成百万行文件（单个 sheet 上限 1,048,575 行数据）
+  Worksheet XML is written block by block, so memory does not grow with the row count and
+  million-row files are possible (a sheet holds at most 1,048,575 data rows).
+- 相同的 --seed 和日期生成完全相同的数据 / The same --seed and date always produce the same data.
+
+使用方法 Usage:
+-------------------------------------
+python synthetic_exports.py ./bench_data 2025-10-29 --rows 100000
+python synthetic_exports.py ./bench_data 2025-10-29 --rows 1000000 --headers en --warehouses UK DE
+python synthetic_exports.py ./bench_data 2025-10-29 --rows 1000000 --format csv
+"""
+
+import os
+import csv
+import zipfile
+import argparse
+from xml.sax.saxutils import escape
+import numpy as np
+
+from file_manifest import SOURCE_KEYWORDS
+from xlsx_merge import MAIN_NS, REL_NS, PKG_REL_NS, XML_DECL
+
+# ==================== 配置区 Configuration Area ====================
+
+WAREHOUSES = ['UK', 'DE', 'NL', 'FR']
+
+# 默认表头语言 / Default header language per warehouse
+HEADER_LANGUAGE = {'UK': 'en', 'NL': 'en', 'DE': 'cn', 'FR': 'cn'}
+
+# xlsx 单个 sheet 的数据行上限（去掉表头行）/ Data rows a single xlsx sheet can hold (minus the header row)
+MAX_SHEET_ROWS = 1_048_575
+
+# 每批生成并写出的行数 / Rows generated and written per block
+BLOCK_ROWS = 50_000
+
+# 各 sheet 的列：(中文表头, 英文表头, 生成器名)
+# Columns of every sheet: (CN header, EN header, generator name)
+SHEET_LAYOUT = {
+    'Inventory': [
+        ('仓库',     'Warehouse',        'warehouse'),
+        ('商品条码', 'JD SKU',           'sku'),
+        ('商品名称', 'Goods Name',       'goods_name'),
+        ('库位',     'Location',         'location'),
+        ('批次号',   'Batch NO.',        'batch'),
+        ('库存量',   'Inventory QTY.',   'inv_qty'),
+        ('可用量',   'Available QTY.',   'available_qty'),
+        ('长',       'Length',           'length'),
+        ('宽',       'Width',            'width'),
+        ('高',       'Height',           'height'),
+        ('重量',     'Weight',           'weight'),
+        ('库存状态', 'Inventory Status', 'status'),
+    ],
+    'Inbound': [
+        ('仓库',         'Warehouse',            'warehouse'),
+        ('客户入库单号', 'JD Inbound NO.',       'inbound_no'),
+        ('入库单号',     'Customer Inbound NO.', 'customer_no'),
+        ('商品编码',     'Goods NO.',            'sku'),
+        ('商品名称',     'Goods Name',           'goods_name'),
+        ('预期量',       'Expected QTY.',        'expected_qty'),
+        ('验收量',       'Receiving QTY.',       'receiving_qty'),
+        ('验收时间',     'Receiving Time',       'timestamp'),
+    ],
+    'Outbound': [
+        ('仓库',     'Warehouse',       'warehouse'),
+        ('订单号',   'JD Outbound NO.', 'outbound_no'),
+        ('商品编码', 'Goods NO.',       'sku'),
+        ('商品名称', 'Goods Name',      'goods_name'),
+        ('复核数量', 'Rechecked QTY',   'rechecked_qty'),
+        ('复核时间', 'Rechecked Time',  'timestamp'),
+        ('承运商',   'Carrier',         'carrier'),
+    ],
+}
+
+CARRIERS = ['DHL', 'DPD', 'GLS', 'UPS', 'Royal Mail', 'PostNL', 'Colissimo']
+STATUSES = ['良品 Good', '残次 Defective', '冻结 Frozen']
+
+# ===============================================================
+
+_CT = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+
+# 单工作表 xlsx 包的固定部件 / Fixed parts of a single-sheet xlsx package
+PACKAGE_PARTS = {
+    "[Content_Types].xml": (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        f'<Override PartName="/xl/workbook.xml" ContentType="{_CT}.sheet.main+xml"/>'
+        f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{_CT}.worksheet+xml"/>'
+        f'<Override PartName="/xl/styles.xml" ContentType="{_CT}.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        f'<Relationships xmlns="{PKG_REL_NS}"><Relationship Id="rId1" '
+        f'Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+    ),
+    "xl/workbook.xml": (
+        f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><bookViews><workbookView activeTab="0"/></bookViews>'
+        '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        f'<Relationships xmlns="{PKG_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{REL_NS}/styles" Target="styles.xml"/></Relationships>'
+    ),
+    "xl/styles.xml": (
+        f'<styleSheet xmlns="{MAIN_NS}">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+
+def _sku_pool(rows):
+    return max(rows // 4, 1)
+
+
+def generate_block(sheet_name, warehouse, date, rows, total_rows, rng):
+    """生成一批数据行（按 SHEET_LAYOUT 的列顺序） / Generate one block of rows in SHEET_LAYOUT column order"""
+    skus = rng.integers(0, _sku_pool(total_rows), rows)
+    columns = {
+        'warehouse': [warehouse] * rows,
+        'sku': [f"{warehouse}SKU{x:08d}" for x in skus],
+        'goods_name': [f"Item {x % 5000}" for x in skus],
+        'location': [f"{chr(65 + x % 26)}-{x % 40:02d}-{x % 7}" for x in rng.integers(0, 1_000_000, rows)],
+        'batch': [f"B{date.replace('-', '')}{x:04d}" for x in rng.integers(0, 10_000, rows)],
+        'status': [STATUSES[x] for x in rng.choice(3, rows, p=[0.95, 0.04, 0.01])],
+        'carrier': [CARRIERS[x] for x in rng.integers(0, len(CARRIERS), rows)],
+        'timestamp': [f"{date} {h:02d}:{m:02d}:{s:02d}" for h, m, s in
+                      zip(rng.integers(6, 22, rows), rng.integers(0, 60, rows), rng.integers(0, 60, rows))],
+        'inbound_no': [f"IB{warehouse}{x:07d}" for x in rng.integers(0, max(total_rows // 8, 1), rows)],
+        'customer_no': [f"ASN{x:07d}" for x in rng.integers(0, max(total_rows // 8, 1), rows)],
+        'outbound_no': [f"OB{warehouse}{x:08d}" for x in rng.integers(0, max(total_rows // 3, 1), rows)],
+    }
+    inv_qty = rng.integers(0, 200, rows)
+    columns['inv_qty'] = inv_qty.tolist()
+    columns['available_qty'] = np.maximum(inv_qty - rng.integers(0, 5, rows), 0).tolist()
+    columns['expected_qty'] = rng.integers(1, 60, rows).tolist()
+    columns['receiving_qty'] = rng.integers(0, 60, rows).tolist()
+    columns['rechecked_qty'] = rng.integers(1, 6, rows).tolist()
+    columns['weight'] = np.round(rng.uniform(0.5, 80, rows), 2).tolist()
+    # 尺寸（mm），约 1% 为空，与真实导出中缺失的物流属性一致
+    # Dimensions in mm, about 1% blank like the missing logistics attributes in real exports
+    for dim in ('length', 'width', 'height'):
+        values = rng.integers(100, 2400, rows).astype(object)
+        values[rng.random(rows) < 0.01] = None
+        columns[dim] = values.tolist()
+    fields = [gen for _, _, gen in SHEET_LAYOUT[sheet_name]]
+    return zip(*(columns[f] for f in fields))
+
+
+def _column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _cell(ref, value):
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return f'<c r="{ref}" t="inlineStr"><is><t>{escape(value)}</t></is></c>'
+    return f'<c r="{ref}"><v>{value}</v></c>'
+
+
+def _row_xml(row_number, letters, values):
+    cells = "".join(_cell(f"{col}{row_number}", v) for col, v in zip(letters, values))
+    return f'<row r="{row_number}">{cells}</row>'
+
+
+def write_sheet(path, sheet_name, warehouse, date, rows, language, rng):
+    """分块写出一个导出文件 / Write one export file block by block
+
+    直接写出工作表 XML（内联字符串，与大批量导出工具的流式写法相同），比逐个单元格经 openpyxl 编码快一个数量级。
+    The worksheet XML is written directly with inline strings, the way streaming exporters write large files;
+    this is an order of magnitude faster than encoding every cell through openpyxl.
+    """
+    layout = SHEET_LAYOUT[sheet_name]
+    letters = [_column_letter(i) for i in range(len(layout))]
+    headers = [[cn if language == 'cn' else en for cn, en, _ in layout]]
+    if sheet_name == 'Outbound':
+        # 出库导出的第二表头行（另一种语言）/ The outbound export's extra header row (in the other language)
+        headers.append([en if language == 'cn' else cn for cn, en, _ in layout])
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for part, xml in PACKAGE_PARTS.items():
+            zf.writestr(part, XML_DECL + xml.encode("utf-8"))
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as out:
+            last = f"{letters[-1]}{len(headers) + rows}"
+            out.write(XML_DECL + f'<worksheet xmlns="{MAIN_NS}"><dimension ref="A1:{last}"/><sheetData>'.encode("utf-8"))
+            row_number = 0
+            for values in headers:
+                row_number += 1
+                out.write(_row_xml(row_number, letters, values).encode("utf-8"))
+            for start in range(0, rows, BLOCK_ROWS):
+                chunk = []
+                for values in generate_block(sheet_name, warehouse, date, min(BLOCK_ROWS, rows - start), rows, rng):
+                    row_number += 1
+                    chunk.append(_row_xml(row_number, letters, values))
+                out.write("".join(chunk).encode("utf-8"))
+            out.write(b"</sheetData></worksheet>")
+    os.replace(tmp_path, path)
+
+
+def write_sheet_csv(path, sheet_name, warehouse, date, rows, language, rng):
+    """以 CSV（UTF-8 带 BOM，与 iWMS 的 CSV 导出相同）分块写出一个导出文件
+    Write one export file block by block as CSV (UTF-8 with BOM, like iWMS's CSV export)
+    """
+    layout = SHEET_LAYOUT[sheet_name]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow([cn if language == 'cn' else en for cn, en, _ in layout])
+        if sheet_name == 'Outbound':
+            writer.writerow([en if language == 'cn' else cn for cn, en, _ in layout])
+        for start in range(0, rows, BLOCK_ROWS):
+            writer.writerows(generate_block(sheet_name, warehouse, date, min(BLOCK_ROWS, rows - start), rows, rng))
+    os.replace(tmp_path, path)
+
+
+def generate(root, date, rows=1000, inventory_rows=None, inbound_rows=None, outbound_rows=None,
+             warehouses=None, headers='default', seed=0, fmt='xlsx'):
+    """生成一天的模拟导出文件，返回 {(仓库, sheet): (路径, 行数)}
+    Generate one day of synthetic exports, returns {(warehouse, sheet): (path, rows)}
+
+    rows 为每个 sheet 的默认行数，可分别用 inventory_rows / inbound_rows / outbound_rows 覆盖。
+    headers: 'default'（UK/NL 英文，DE/FR 中文）、'cn' 或 'en'。fmt: 'xlsx' 或 'csv'。
+    rows is the default row count of every sheet, overridden per sheet by inventory_rows / inbound_rows / outbound_rows.
+    headers: 'default' (UK/NL English, DE/FR Chinese), 'cn' or 'en'. fmt: 'xlsx' or 'csv'.
+    """
+    counts = {
+        'Inventory': inventory_rows or rows,
+        'Inbound': inbound_rows or rows,
+        'Outbound': outbound_rows or rows,
+    }
+    for sheet_name, count in counts.items():
+        if count > MAX_SHEET_ROWS:
+            print(f"[WARN] {sheet_name} 行数超过 xlsx 上限，已截断为 {MAX_SHEET_ROWS} "
+                  f"Row count above the xlsx limit, capped at {MAX_SHEET_ROWS}")
+            counts[sheet_name] = MAX_SHEET_ROWS
+    keywords = {kind: kw for kw, kind in SOURCE_KEYWORDS}
+    written = {}
+    for index, warehouse in enumerate(warehouses or WAREHOUSES):
+        language = HEADER_LANGUAGE.get(warehouse, 'en') if headers == 'default' else headers
+        folder = os.path.join(root, warehouse)
+        os.makedirs(folder, exist_ok=True)
+        for sheet_name, count in counts.items():
+            # 每个 (日期, 仓库, sheet) 使用独立的随机流 / Every (date, warehouse, sheet) gets its own random stream
+            rng = np.random.default_rng([seed, int(date.replace('-', '')), index, list(counts).index(sheet_name)])
+            path = os.path.join(folder, f"{keywords[sheet_name]}_{date}.{fmt}")
+            print(f"生成 Generating {warehouse}/{os.path.basename(path)} ({count} 行 rows, {language.upper()})")
+            writer = write_sheet_csv if fmt == 'csv' else write_sheet
+            writer(path, sheet_name, warehouse, date, count, language, rng)
+            written[(warehouse, sheet_name)] = (path, count)
+    return written
+
+
+def parse_args(argv=None):
+    """解析命令行参数 / Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="生成模拟 iWMS 导出文件 / Generate synthetic iWMS export files.")
+    parser.add_argument("root", help="输出目录（在其中创建仓库文件夹） / Output directory (warehouse folders are created in it).")
+    parser.add_argument("date", help="导出日期 / Export date, YYYY-MM-DD.")
+    parser.add_argument("--rows", type=int, default=1000, help="每个 sheet 的行数（默认 1000） / Rows per sheet (default 1000).")
+    parser.add_argument("--inventory-rows", type=int, help="库存表行数 / Inventory rows.")
+    parser.add_argument("--inbound-rows", type=int, help="入库表行数 / Inbound rows.")
+    parser.add_argument("--outbound-rows", type=int, help="出库表行数 / Outbound rows.")
+    parser.add_argument("--warehouses", nargs="+", default=WAREHOUSES, help="仓库文件夹 / Warehouse folders (default UK DE NL FR).")
+    parser.add_argument("--headers", choices=["default", "cn", "en"], default="default",
+                        help="表头语言（默认 UK/NL 英文，DE/FR 中文） / Header language (default: UK/NL English, DE/FR Chinese).")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子 / Random seed.")
+    parser.add_argument("--format", choices=["xlsx", "csv"], default="xlsx",
+                        help="导出格式（默认 xlsx） / Export format (default xlsx).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    generate(args.root, args.date, args.rows, args.inventory_rows, args.inbound_rows, args.outbound_rows,
+             args.warehouses, args.headers, args.seed, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""增量构建状态 / Incremental build state"""
+
+import os
+
+import pytest
+
+import build_state
+
+OPTIONS = [True, False, None]
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    monkeypatch.setattr(build_state, "STATE_DIR", str(tmp_path / ".build_state"))
+    monkeypatch.setattr(build_state, "DIGESTS_PATH", str(tmp_path / ".build_state" / "digests.json"))
+    files = {}
+    for kind in ('Outbound', 'Inbound', 'Inventory'):
+        path = tmp_path / f"{kind}_2025-10-29.xlsx"
+        path.write_bytes(kind.encode())
+        files[kind] = str(path)
+    return tmp_path, files
+
+
+def sign(files, options=OPTIONS):
+    return build_state.unit_signature(files, options, build_state.load_digests())
+
+
+def test_unchanged_unit_is_up_to_date(state):
+    tmp_path, files = state
+    merged = tmp_path / "UK2025-10-29.xlsx"
+    merged.write_bytes(b"merged")
+    build_state.store_unit('UK', '2025-10-29', sign(files), {'qty': 3}, [str(merged)])
+    record = build_state.load_unit('UK', '2025-10-29', sign(files))
+    assert record['row'] == {'qty': 3}
+
+
+def test_touched_file_with_same_content_stays_up_to_date(state):
+    _, files = state
+    before = sign(files)
+    st = os.stat(files['Inbound'])
+    os.utime(files['Inbound'], ns=(st.st_atime_ns, st.st_mtime_ns + 10_000_000_000))
+    assert sign(files) == before
+
+
+def test_changed_export_or_options_invalidate_the_unit(state):
+    _, files = state
+    build_state.store_unit('UK', '2025-10-29', sign(files), {'qty': 3})
+    assert build_state.load_unit('UK', '2025-10-29', sign(files, [False, False, None])) is None
+    with open(files['Outbound'], 'ab') as f:
+        f.write(b"more rows")
+    assert build_state.load_unit('UK', '2025-10-29', sign(files)) is None
+
+
+def test_missing_output_or_source_invalidates_the_unit(state):
+    tmp_path, files = state
+    merged = tmp_path / "UK2025-10-29.xlsx"
+    merged.write_bytes(b"merged")
+    build_state.store_unit('UK', '2025-10-29', sign(files), {'qty': 3}, [str(merged)])
+    merged.unlink()
+    assert build_state.load_unit('UK', '2025-10-29', sign(files)) is None
+    assert sign({**files, 'Inventory': None}) is None
+
+
+def test_summary_follows_the_unit_signatures(state):
+    tmp_path, files = state
+    summary = tmp_path / "warehouse_summary_2025-10-29.csv"
+    summary.write_text("x")
+    signature = build_state.summary_signature([sign(files)], OPTIONS)
+    build_state.store_summary('2025-10-29', signature, [str(summary)])
+    assert build_state.summary_is_fresh('2025-10-29', signature)
+    assert not build_state.summary_is_fresh('2025-10-29', build_state.summary_signature([sign(files), 'x'], OPTIONS))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""异常检测规则 / Exception detection rules"""
+
+import numpy as np
+import pandas as pd
+
+import exception_rules
+
+NA = -1
+
+
+def codes(*values):
+    return pd.Series(np.array(values, dtype=np.int32))
+
+
+def results(sheet, block):
+    return exception_rules.finish(exception_rules.evaluate(exception_rules.sheet_rules(sheet), block))
+
+
+def test_inventory_rules_count_rows_and_sample_skus():
+    block = {'sku': codes(1, 2, 3, 4, 5),
+             'qty': pd.Series([3, 'x', None, -2, 7], dtype=object),
+             'length': pd.Series([100, 0, 100, None, 7000]),
+             'width': pd.Series([100, 100, 100, 100, 100]),
+             'height': pd.Series([100, 100, np.nan, 100, 100])}
+    found = results('Inventory', block)
+    assert found['inv_qty_invalid']['count'] == 2 and found['inv_qty_invalid']['samples'].tolist() == [2, 3]
+    assert found['inv_qty_negative']['count'] == 1 and found['inv_qty_negative']['samples'].tolist() == [4]
+    assert found['inv_dimensions_missing']['count'] == 3
+    assert found['inv_dimensions_implausible']['samples'].tolist() == [5]
+
+
+def test_duplicate_lines_count_each_extra_row():
+    block = {'order': codes(10, 10, 10, 11, 11, NA), 'sku': codes(1, 1, 1, 2, 3, 1), 'qty': pd.Series([1.0] * 6)}
+    found = results('Outbound', block)
+    assert found['ob_duplicate_lines']['count'] == 2
+    assert found['ob_duplicate_lines']['samples'].tolist() == [10]
+
+
+def test_blocks_merge_to_the_single_block_result():
+    block = {'order': codes(10, 11, 10, 12, 10, 11), 'sku': codes(1, 2, 1, 3, 1, 2),
+             'qty': pd.Series([1, -1, None, 2, 'y', 3], dtype=object)}
+    names = exception_rules.sheet_rules('Outbound')
+    whole = exception_rules.finish(exception_rules.evaluate(names, block))
+    halves = [exception_rules.evaluate(names, {f: s.iloc[i:i + 3].reset_index(drop=True) for f, s in block.items()})
+              for i in (0, 3)]
+    merged = exception_rules.finish(exception_rules.merge_parts(halves))
+    for name in names:
+        assert merged[name]['count'] == whole[name]['count']
+        assert merged[name]['samples'].tolist() == whole[name]['samples'].tolist()
+    assert whole['ob_duplicate_lines']['count'] == 3 and whole['ob_qty_invalid']['count'] == 2
+
+
+def totals(keys, values):
+    return {'key': np.array(keys, dtype=np.int32), 'value': np.array(values, dtype=np.float64)}
+
+
+def test_receiving_above_the_historical_norm():
+    history = {f'2025-10-{d}': totals([1, 2], [10, 10]) for d in (20, 21, 22)}
+    history['2025-10-23'] = totals([3], [1])
+    today = totals([1, 2, 3, 4], [60, 40, 100, 100])
+    found = exception_rules.above_norm(today, history)
+    # SKU 1 超过 5 倍；SKU 2 未超过；SKU 3 历史不足 3 天；SKU 4 没有历史
+    # SKU 1 is above 5x; SKU 2 is not; SKU 3 has under 3 days of history; SKU 4 has none
+    assert found['count'] == 1 and found['samples'].tolist() == [1]
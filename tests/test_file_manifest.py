@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+"""仓库文件夹的识别 / Warehouse folder discovery"""
+
+import file_manifest
+
+
+def test_only_folders_with_source_exports_are_warehouses(tmp_path):
+    for name in ('UK', 'DE', 'tests', 'notes', '.hidden'):
+        (tmp_path / name).mkdir()
+    (tmp_path / 'UK' / 'commodityInventoryInformationInquiry_2025-10-29.xlsx').write_bytes(b'')
+    (tmp_path / 'DE' / 'checkPackageNumber_2025-10-28.csv').write_bytes(b'')
+    (tmp_path / 'tests' / 'checkPackageNumber_2025-10-28.csv').write_bytes(b'')
+    (tmp_path / 'notes' / 'todo_2025-10-29.txt').write_bytes(b'')
+
+    assert [name for name, _ in file_manifest.warehouse_folders(str(tmp_path))] == ['DE', 'UK']
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""SKU / 订单号字典编码 / Dictionary encoding of SKU and order identifiers"""
+
+import numpy as np
+import pytest
+
+import id_dictionary
+import metrics_store
+
+
+@pytest.fixture(autouse=True)
+def metrics_db(tmp_path, monkeypatch):
+    """每个测试使用独立的指标库 / Every test gets its own metrics store"""
+    monkeypatch.setattr(metrics_store, "DB_PATH", str(tmp_path / "warehouse_metrics.db"))
+    monkeypatch.setattr(id_dictionary, "_codes", {})
+    monkeypatch.setattr(id_dictionary, "_token", {})
+
+
+def test_encode_decode_round_trip():
+    values = ['SKU1', 'SKU2', None, 'SKU1', 12345]
+    codes = id_dictionary.encode('sku', values)
+    assert codes.dtype == id_dictionary.CODE_DTYPE
+    assert codes[2] == id_dictionary.NA_CODE and codes[0] == codes[3]
+    assert id_dictionary.decode('sku', codes) == ['SKU1', 'SKU2', None, 'SKU1', '12345']
+
+
+def test_codes_are_stable_across_processes(monkeypatch):
+    first = id_dictionary.encode('order', ['A', 'B'])
+    # 新进程：本进程的字典缓存为空，从指标库读回 / A new process: the in-process dictionary is empty and is
+    # read back from the metrics store
+    monkeypatch.setattr(id_dictionary, "_codes", {})
+    again = id_dictionary.encode('order', ['C', 'B', 'A'])
+    assert again[1:].tolist() == first[::-1].tolist()
+    assert again[0] not in first
+
+
+def test_kinds_are_separate():
+    sku = id_dictionary.encode('sku', ['X'])
+    order = id_dictionary.encode('order', ['X'])
+    assert id_dictionary.decode('sku', sku) == ['X'] and id_dictionary.decode('order', order) == ['X']
+
+
+def test_decode_reads_codes_written_by_another_process(monkeypatch):
+    codes = id_dictionary.encode('sku', ['A'])
+    monkeypatch.setattr(id_dictionary, "_codes", {'sku': {}})
+    assert id_dictionary.decode('sku', np.append(codes, id_dictionary.NA_CODE)) == ['A', None]
+
+
+def test_token_changes_with_a_rebuilt_store(tmp_path, monkeypatch):
+    first = id_dictionary.token()
+    assert id_dictionary.token() == first
+    monkeypatch.setattr(metrics_store, "DB_PATH", str(tmp_path / "rebuilt.db"))
+    assert id_dictionary.token() != first
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""日内增量与完整重算一致 / Intraday increments match a full recompute"""
+
+import openpyxl
+import pytest
+
+import id_dictionary
+import intraday
+import metrics_store
+import process_merged_files
+from xlsx_helpers import shared_strings
+
+HEADER = ['JD Outbound NO.', 'Rechecked QTY', 'Goods NO.']
+
+
+@pytest.fixture(autouse=True)
+def metrics_db(tmp_path, monkeypatch):
+    """每个测试使用独立的指标库 / Every test gets its own metrics store"""
+    monkeypatch.setattr(metrics_store, "DB_PATH", str(tmp_path / "warehouse_metrics.db"))
+    monkeypatch.setattr(id_dictionary, "_codes", {})
+    monkeypatch.setattr(id_dictionary, "_token", {})
+    monkeypatch.setenv(intraday.INTRADAY_ENV, "1")
+
+
+def export(path, rows):
+    """写出一次出库导出（字符串以共享字符串保存） / Write one outbound export (strings go to shared strings)"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(HEADER)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    shared_strings(path)
+    return str(path)
+
+
+def outbound(path):
+    return process_merged_files.read_sheet_columns(path, 'Outbound', use_cache=False)
+
+
+def full(path, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(metrics_store, "DB_PATH", metrics_store.DB_PATH + ".full")
+        return outbound(path)
+
+
+def summary(result):
+    return {k: result[k] for k in ('rows', 'ob_order_qty_cur', 'ob_units_qty_cur')}
+
+
+@pytest.fixture
+def path(tmp_path):
+    (tmp_path / "UK").mkdir()
+    return tmp_path / "UK" / "checkPackageNumber_2025-10-29.xlsx"
+
+
+def test_appended_rows_match_a_full_recompute(path, monkeypatch, capsys):
+    rows = [[f"O{i // 2}", i % 3 + 1, f"SKU{i % 5}"] for i in range(30)]
+    export(path, rows[:12])
+    outbound(path)
+    export(path, rows)
+    appended = outbound(path)
+    assert "appended 18" in capsys.readouterr().out
+    assert summary(appended) == summary(full(path, monkeypatch))
+    assert appended['rows'] == 30
+
+
+def test_changed_shared_string_forces_a_full_recompute(path, monkeypatch, capsys):
+    export(path, [['O1', 1, 'SKU1'], ['O2', 2, 'SKU2']])
+    outbound(path)
+    # 第一行的订单号变了，但共享字符串的编号不变 / The first order number changed, its shared string index did not
+    export(path, [['X1', 1, 'SKU1'], ['O2', 2, 'SKU2'], ['O2', 3, 'SKU3']])
+    result = outbound(path)
+    assert "Prefix changed" in capsys.readouterr().out
+    assert summary(result) == summary(full(path, monkeypatch))
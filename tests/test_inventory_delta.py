@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""库存日环比 / Day-over-day inventory delta"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import id_dictionary
+import inventory_delta
+import metrics_store
+from inventory_delta import DELTA_COLUMNS, SNAPSHOT_KEY
+
+
+@pytest.fixture(autouse=True)
+def metrics_db(tmp_path, monkeypatch):
+    """每个测试使用独立的指标库 / Every test gets its own metrics store"""
+    monkeypatch.setattr(metrics_store, "DB_PATH", str(tmp_path / "warehouse_metrics.db"))
+    monkeypatch.setattr(id_dictionary, "_codes", {})
+    monkeypatch.setattr(id_dictionary, "_token", {})
+
+
+def row(skus, qty, unit_volume=1_000_000):
+    """一个仓库一天的汇总行（单件体积 mm³，默认 1 m³） / A warehouse's summary row of one day (unit volume in
+    mm³, 1 m³ by default)
+    """
+    block = {'sku': pd.Series(id_dictionary.encode('sku', skus)), 'qty': pd.Series(qty, dtype=object),
+             'unit_volume': pd.Series([unit_volume] * len(skus))}
+    return {metrics_store.WAREHOUSE_COL: 'UK', SNAPSHOT_KEY: inventory_delta.build_snapshot(block)}
+
+
+def test_snapshot_adds_up_locations_and_skips_blank_skus():
+    snap = row(['B', 'A', 'B', None], [1, 2, 3, 4])[SNAPSHOT_KEY]
+    assert (np.diff(snap['sku']) > 0).all()
+    assert dict(zip(id_dictionary.decode('sku', snap['sku']), snap['qty'].tolist())) == {'A': 2.0, 'B': 4.0}
+    assert snap['volume'].sum() == 6.0
+
+
+def test_day_over_day_deltas():
+    day1 = row(['A', 'B', 'C'], [5, 3, 2])
+    day2 = row(['A', 'B', 'D'], [5, 1, 4])
+    details = inventory_delta.apply_deltas([('2025-10-28', day1), ('2025-10-29', day2)])
+    assert np.isnan(day1[DELTA_COLUMNS['added']])
+    got = {key: day2[label] for key, label in DELTA_COLUMNS.items()}
+    assert got == {'added': 1, 'removed': 1, 'changed': 1, 'units_in': 4.0, 'units_out': 4.0,
+                   'units_net': 0.0, 'volume_net': 0.0}
+    assert day2[inventory_delta.BASE_DATE_COL] == '2025-10-28'
+    changes = dict(zip(details['SKU'], details['状态 / Status']))
+    assert changes == {'D': 'added', 'C': 'removed', 'B': 'changed'}
+
+
+def test_previous_day_comes_from_the_store_and_skips_gaps():
+    inventory_delta.store_day('2025-10-24', [row(['A'], [1])])
+    inventory_delta.store_day('2025-10-27', [row(['A', 'B'], [2, 2])])
+    today = row(['A', 'B'], [2, 5])
+    inventory_delta.apply_deltas([('2025-10-28', today)])
+    assert today[inventory_delta.BASE_DATE_COL] == '2025-10-27'
+    assert today[DELTA_COLUMNS['changed']] == 1 and today[DELTA_COLUMNS['units_net']] == 3.0
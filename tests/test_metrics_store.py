@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""每日指标库 / Daily metrics store"""
+
+import numpy as np
+import pytest
+
+import metrics_store
+from metrics_store import DISTINCT_KEY, FILE_COL, WAREHOUSE_COL
+
+SKUS = '库存SKU数 / inv_sku_qty_cur'
+UNITS = '库存总量 / inv_units_qty_cur'
+OB_UNITS = '出库总量 / ob_units_qty_cur'
+IB_ORDERS = '入库订单数 / ib_order_qty_cur'
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "warehouse_metrics.db")
+
+
+def row(warehouse, units=None, ob_units=None, orders=None):
+    out = {WAREHOUSE_COL: warehouse, FILE_COL: f"{warehouse}.xlsx", UNITS: units, OB_UNITS: ob_units}
+    if orders is not None:
+        out[IB_ORDERS] = len(orders)
+        out[DISTINCT_KEY] = {'ib_order_qty_cur': np.array(orders, dtype=np.int32)}
+    return out
+
+
+def test_encoded_ids_round_trip():
+    codes = np.array([7, 3, 3, 1_000_000, 0], dtype=np.int32)
+    assert metrics_store.decode_ids(metrics_store.encode_ids(codes)).tolist() == [0, 3, 7, 1_000_000]
+
+
+def test_upsert_and_load_round_trip(db):
+    metrics_store.upsert_day('2025-10-28', [row('UK', 10, 5), row('DE', 20, 7)], db)
+    metrics_store.upsert_day('2025-10-28', [row('UK', 11, 6)], db)
+    days = metrics_store.load_days('2025-10-28', '2025-10-28', db_path=db).set_index(WAREHOUSE_COL)
+    assert days.loc['UK', UNITS] == 11 and days.loc['UK', OB_UNITS] == 6
+    assert days.loc['DE', UNITS] == 20
+
+
+def test_range_sums_flows_unions_ids_and_takes_last_day_stock(db):
+    metrics_store.upsert_day('2025-10-27', [row('UK', 10, 5, orders=[1, 2])], db)
+    metrics_store.upsert_day('2025-10-28', [row('UK', 12, 6, orders=[2, 3])], db)
+    summary = metrics_store.summarise_range('2025-10-27', '2025-10-28', db_path=db).set_index(WAREHOUSE_COL)
+    assert summary.loc['UK', OB_UNITS] == 11
+    assert summary.loc['UK', IB_ORDERS] == 3
+    assert summary.loc['UK', UNITS] == 12
+    assert summary.loc['UK', FILE_COL] == 'UK.xlsx'
+
+
+def test_blank_stock_on_the_last_day_stays_blank(db):
+    metrics_store.upsert_day('2025-10-27', [row('UK', 10, 5)], db)
+    metrics_store.upsert_day('2025-10-28', [row('UK', None, 6)], db)
+    summary = metrics_store.summarise_range('2025-10-27', '2025-10-28', db_path=db).set_index(WAREHOUSE_COL)
+    assert np.isnan(summary.loc['UK', UNITS])
+    assert summary.loc['UK', OB_UNITS] == 11
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""解析缓存 / Parse cache"""
+
+import pickle
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import parse_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, 'CACHE_DIR', str(tmp_path / ".parse_cache"))
+    return tmp_path
+
+
+class Payload:
+    def __reduce__(self):
+        return (print, ("pickle payload ran",))
+
+
+def test_mixed_columns_round_trip(cache_dir):
+    df = pd.DataFrame({'订单号': ['发货单号', 'ESL1', 'ESL2'], 'qty': ['数量', 3, np.nan],
+                       'weight': [1.5, 2.0, np.nan], 'time': [datetime(2025, 10, 28, 9), 'x', None]})
+    source = cache_dir / "Outbound.csv"
+    source.write_text("x")
+    calls = []
+
+    def parse(path):
+        calls.append(path)
+        return {'Outbound': df}
+
+    first = parse_cache.cached_call(str(source), parse)
+    second = parse_cache.cached_call(str(source), parse)
+    assert len(calls) == 1 and first is not second
+    pd.testing.assert_frame_equal(second['Outbound'], df)
+
+
+def test_pickled_entry_is_never_loaded(cache_dir, capsys):
+    source = cache_dir / "Outbound.csv"
+    source.write_text("x")
+    key = parse_cache.cache_key(str(source), func='parse')
+    (cache_dir / ".parse_cache").mkdir()
+    with open(parse_cache._entry_path(key), 'wb') as f:
+        pickle.dump(Payload(), f)
+    assert parse_cache.load(key) is None
+    assert "pickle payload ran" not in capsys.readouterr().out
+
+
+def test_evict_removes_legacy_pickles(cache_dir):
+    (cache_dir / ".parse_cache").mkdir()
+    (cache_dir / ".parse_cache" / "old.pkl").write_bytes(b"x")
+    assert parse_cache.evict() == 1
+    assert not (cache_dir / ".parse_cache" / "old.pkl").exists()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""SKU 主数据补全体积 / Volumes filled from the SKU master"""
+
+import pandas as pd
+import pytest
+
+import id_dictionary
+import metrics_store
+import process_merged_files
+import sku_master
+
+
+@pytest.fixture(autouse=True)
+def metrics_db(tmp_path, monkeypatch):
+    """每个测试使用独立的指标库 / Every test gets its own metrics store"""
+    monkeypatch.setattr(metrics_store, "DB_PATH", str(tmp_path / "warehouse_metrics.db"))
+    monkeypatch.setattr(id_dictionary, "_codes", {})
+    monkeypatch.setattr(id_dictionary, "_token", {})
+    monkeypatch.delenv(sku_master.DIMENSIONS_ENV, raising=False)
+    monkeypatch.delenv(sku_master.DATE_ENV, raising=False)
+
+
+def inventory(skus, qty, dims):
+    return pd.DataFrame({'JD SKU': skus, 'Inventory QTY.': qty,
+                         'Length(mm)': [d[0] for d in dims], 'Width(mm)': [d[1] for d in dims],
+                         'Height(mm)': [d[2] for d in dims]})
+
+
+def summary(df, metrics):
+    row = process_merged_files.compute_metrics({'Inventory': df}, 'UK', 'inventory.xlsx', metrics=metrics)
+    return {name: row[process_merged_files.METRIC_REGISTRY[name]['label']] for name in metrics}
+
+
+def test_unresolved_rows_are_counted():
+    names = ['inv_total_volume_m3', 'inv_volume_filled_m3', 'inv_volume_unresolved']
+    day1 = inventory(['A', 'B'], [1, 1], [(100, 100, 100), (200, 100, 100)])
+    sku_master.store_day('2025-10-28', [process_merged_files.compute_metrics({'Inventory': day1}, 'UK', 'day1.xlsx')])
+
+    day2 = inventory(['A', 'C', 'D'], [2, 3, 0], [(None, None, None), (None, None, None), (None, None, None)])
+    sku_master.set_date('2025-10-29')
+    values = summary(day2, names)
+    assert values['inv_volume_filled_m3'] == pytest.approx(2.0)
+    assert values['inv_volume_unresolved'] == 1
+
+    sku_master.configure('master')
+    assert sku_master.from_master()
+    assert summary(day2, names)['inv_volume_unresolved'] == 1
+
+
+def test_master_mode_falls_back_while_master_is_empty(capsys):
+    sku_master.configure('master')
+    assert sku_master.mode() == 'sheet'
+    assert '[WARN]' in capsys.readouterr().out
+
+
+def test_rerun_and_backfill_only_use_earlier_dimensions():
+    names = ['inv_total_volume_m3', 'inv_volume_filled_m3', 'inv_volume_unresolved']
+    day = inventory(['A', 'B'], [1, 2], [(100, 100, 100), (None, None, None)])
+    sku_master.set_date('2025-10-29')
+    first = summary(day, names)
+    assert first['inv_volume_unresolved'] == 1
+
+    # B 的尺寸在当天（另一个仓库）和之后才出现 / B's dimensions only show up the same day (another warehouse) and later
+    other = inventory(['B'], [1], [(200, 100, 100)])
+    sku_master.store_day('2025-10-29', [process_merged_files.compute_metrics({'Inventory': day}, 'UK', 'a.xlsx'),
+                                        process_merged_files.compute_metrics({'Inventory': other}, 'DE', 'b.xlsx')])
+    later = inventory(['B'], [1], [(300, 100, 100)])
+    sku_master.store_day('2025-10-30', [process_merged_files.compute_metrics({'Inventory': later}, 'DE', 'c.xlsx')])
+    assert summary(day, names) == first
+
+    sku_master.set_date('2025-10-30')
+    assert summary(day, names)['inv_volume_filled_m3'] == pytest.approx(4.0)
+    sku_master.set_date('2025-10-31')
+    assert summary(day, names)['inv_volume_filled_m3'] == pytest.approx(6.0)
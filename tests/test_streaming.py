@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""流式汇总与 read_excel 路径的一致性 / Streamed totals agree with the read_excel path"""
+
+import openpyxl
+import pytest
+from openpyxl.styles import PatternFill
+
+import exception_rules
+import id_dictionary
+import metrics_store
+import process_merged_files
+import sheet_ranges
+import synthetic_exports
+
+
+@pytest.fixture(autouse=True)
+def metrics_db(tmp_path, monkeypatch):
+    """每个测试使用独立的指标库 / Every test gets its own metrics store"""
+    monkeypatch.setattr(metrics_store, "DB_PATH", str(tmp_path / "warehouse_metrics.db"))
+    monkeypatch.setattr(id_dictionary, "_codes", {})
+    monkeypatch.setattr(id_dictionary, "_token", {})
+    monkeypatch.delenv(sheet_ranges.SHEET_WORKERS_ENV, raising=False)
+
+
+def inventory_with_formatted_blanks(path, data_rows=3, blank_rows=15):
+    """库存表：data_rows 行数据，之后 blank_rows 行只有底色没有值 / Inventory sheet with data_rows rows of data
+    followed by blank_rows rows that only carry a fill
+    """
+    layout = synthetic_exports.SHEET_LAYOUT['Inventory']
+    header = [en for _, en, _ in layout]
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(header)
+    mapping = process_merged_files.resolve_columns('Inventory', header)
+    for i in range(data_rows):
+        row = [None] * len(header)
+        row[mapping['sku']] = f"SKU{i}"
+        row[mapping['qty']] = 10 + i
+        for field in ('length', 'width', 'height'):
+            row[mapping[field]] = 100
+        ws.append(row)
+    fill = PatternFill("solid", fgColor="FFFF00")
+    for r in range(data_rows + 2, data_rows + blank_rows + 2):
+        for c in range(1, len(header) + 1):
+            ws.cell(r, c).fill = fill
+    wb.save(path)
+    return path
+
+
+def read_excel_result(path):
+    df = process_merged_files.read_sheet_columns(path, 'Inventory', use_cache=False, stream_threshold_mb=1e9)
+    row = process_merged_files.compute_metrics({'Inventory': df}, 'UK', path.name)
+    return len(df), row.get(exception_rules.EXCEPTIONS_KEY, {})
+
+
+def counts(found):
+    return {name: result['count'] for name, result in found.items() if result['count']}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_formatted_blank_rows_are_not_exceptions(tmp_path, monkeypatch, workers):
+    path = inventory_with_formatted_blanks(tmp_path / "commodityInventoryInformationInquiry_2025-10-29.xlsx")
+    rows, found = read_excel_result(path)
+    monkeypatch.setenv(sheet_ranges.SHEET_WORKERS_ENV, str(workers))
+    streamed = process_merged_files.stream_sheet_metrics(
+        path, 'Inventory', chunk_rows=4, rules=tuple(exception_rules.sheet_rules('Inventory')))
+
+    assert rows == 3
+    assert streamed['rows'] == rows
+    assert counts(streamed['exceptions']) == counts(found) == {}
+    assert streamed['inv_units_qty_cur'] == 33
+
+
+def test_unverified_openpyxl_falls_back_to_serial(tmp_path, monkeypatch):
+    path = inventory_with_formatted_blanks(tmp_path / "commodityInventoryInformationInquiry_2025-10-29.xlsx",
+                                           data_rows=12, blank_rows=0)
+    monkeypatch.setattr(sheet_ranges, "TESTED_OPENPYXL", ('0.0.',))
+    with pytest.raises(sheet_ranges.RangeReadUnsupported):
+        next(sheet_ranges.iter_rows(path))
+
+    monkeypatch.setenv(sheet_ranges.SHEET_WORKERS_ENV, "2")
+    streamed = process_merged_files.stream_sheet_metrics(path, 'Inventory', chunk_rows=4)
+    assert streamed['rows'] == 12
+    assert streamed['inv_units_qty_cur'] == sum(range(10, 22))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""租约认领、收回和完成记录 / Lease claims, takeovers and completion records"""
+
+import os
+import time
+import pickle
+
+import numpy as np
+
+import work_queue
+
+
+def make_stale(path):
+    old = time.time() - work_queue.LEASE_SECONDS - 10
+    os.utime(path, (old, old))
+
+
+def test_claim_is_exclusive_until_released(tmp_path):
+    lease = str(tmp_path / "UK_2025-10-29.lease")
+    assert work_queue.try_claim(lease)
+    assert not work_queue.try_claim(lease)
+    assert work_queue.lease_owner(lease) == work_queue.owner_id()
+    with work_queue.held(lease):
+        pass
+    assert not os.path.exists(lease)
+    assert work_queue.try_claim(lease)
+
+
+def test_stale_lease_is_taken_over(tmp_path):
+    lease = str(tmp_path / "UK_2025-10-29.lease")
+    assert work_queue.try_claim(lease)
+    assert not work_queue.try_claim(lease)
+    make_stale(lease)
+    assert work_queue.try_claim(lease)
+    assert not os.path.exists(lease + ".breaking")
+
+
+def test_two_claimers_racing_for_a_stale_lease(tmp_path, monkeypatch):
+    # 第二个工作进程在第一个检查失效租约之后、删除之前插入，只能有一个认领成功
+    # The second worker steps in after the first one checked the stale lease and before it removed it; only
+    # one of them may end up with the claim
+    lease = str(tmp_path / "UK_2025-10-29.lease")
+    assert work_queue.try_claim(lease)
+    make_stale(lease)
+    real_stat, claims = os.stat, []
+
+    def stat(path, *args, **kwargs):
+        result = real_stat(path, *args, **kwargs)
+        if path == lease and not claims:
+            claims.append(work_queue.try_claim(lease))
+        return result
+
+    monkeypatch.setattr(os, "stat", stat)
+    claims.append(work_queue.try_claim(lease))
+    monkeypatch.setattr(os, "stat", real_stat)
+    assert sorted(claims) == [False, True]
+    assert not work_queue.try_claim(lease)
+
+
+def test_leftover_guard_is_cleared(tmp_path):
+    lease = str(tmp_path / "UK_2025-10-29.lease")
+    assert work_queue.try_claim(lease)
+    make_stale(lease)
+    open(lease + ".breaking", "w").close()
+    assert not work_queue.try_claim(lease)
+    make_stale(lease + ".breaking")
+    assert not work_queue.try_claim(lease)
+    assert work_queue.try_claim(lease)
+
+
+def test_done_record_needs_a_matching_signature(tmp_path):
+    done = str(tmp_path / "UK_2025-10-29.done")
+    assert work_queue.read_done(done, "abc") is None
+    work_queue.write_atomic(done, {"signature": "abc", "owner": "host:1", "row": {"x": 1.5}})
+    assert work_queue.read_done(done, "abc")["row"] == {"x": 1.5}
+    assert work_queue.read_done(done, "def") is None
+
+
+def test_done_record_keeps_summary_arrays(tmp_path):
+    done = str(tmp_path / "UK_2025-10-29.done")
+    row = {"仓库 / warehouse": "UK", "qty": np.int64(7), "_distinct": {"ob_order": np.array([1, 5], dtype=np.int32)}}
+    work_queue.write_atomic(done, {"signature": "abc", "row": row})
+    loaded = work_queue.read_done(done, "abc")["row"]
+    assert loaded["qty"] == 7 and loaded["_distinct"]["ob_order"].tolist() == [1, 5]
+
+
+class Payload:
+    def __reduce__(self):
+        return (print, ("pickle payload ran",))
+
+
+def test_pickled_done_record_is_ignored(tmp_path, capsys):
+    done = tmp_path / "UK_2025-10-29.done"
+    done.write_bytes(pickle.dumps({"signature": "abc", "row": Payload()}))
+    assert work_queue.read_done(str(done), "abc") is None
+    assert "pickle payload ran" not in capsys.readouterr().out
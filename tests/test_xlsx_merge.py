@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""xlsx 包级合并与 pandas 读写一致 / The package-level xlsx merge matches a pandas round trip"""
+
+from datetime import datetime
+
+import openpyxl
+import pandas as pd
+from openpyxl.styles import Font
+
+import xlsx_merge
+from xlsx_helpers import shared_strings
+
+
+def export(path, header, rows, bold=False, number_format=None):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    if bold:
+        for cell in ws[1]:
+            cell.font = Font(bold=True)
+    if number_format:
+        for cell in ws['B'][1:]:
+            cell.number_format = number_format
+    wb.save(path)
+    shared_strings(path)
+    return str(path)
+
+
+def sources(tmp_path):
+    return {
+        'Outbound': export(tmp_path / "checkPackageNumber.xlsx", ['JD Outbound NO.', 'Rechecked QTY', 'Goods NO.'],
+                           [[f'ESL{i}', i, f'SKU{i % 7}'] for i in range(50)], bold=True),
+        'Inbound': export(tmp_path / "acceptanceOfDataQuery.xlsx", ['Order NO.', 'Accepted QTY', 'Time'],
+                          [['IB1', 2.5, datetime(2025, 10, 29, 8)], ['IB2', 3, datetime(2025, 10, 29, 9)]],
+                          number_format='0.00'),
+        'Inventory': export(tmp_path / "commodityInventoryInformationInquiry.xlsx", ['JD SKU', 'Inventory QTY.'],
+                            [['SKU1', 4], ['ESL1', None], ['SKU3', 0]]),
+    }
+
+
+def test_merged_workbook_matches_pandas(tmp_path):
+    files = sources(tmp_path)
+    out = str(tmp_path / "UK2025-10-29.xlsx")
+    xlsx_merge.merge_workbooks(files, out)
+    merged = pd.read_excel(out, sheet_name=None)
+    assert list(merged) == list(files)
+    for name, path in files.items():
+        pd.testing.assert_frame_equal(merged[name], pd.read_excel(path))
+
+
+def test_styles_follow_their_sheets(tmp_path):
+    out = str(tmp_path / "UK2025-10-29.xlsx")
+    xlsx_merge.merge_workbooks(sources(tmp_path), out)
+    wb = openpyxl.load_workbook(out)
+    assert wb['Outbound']['A1'].font.bold and not wb['Inbound']['A1'].font.bold
+    assert wb['Inbound']['B2'].number_format == '0.00'
+    assert wb['Outbound']['B2'].number_format == 'General'
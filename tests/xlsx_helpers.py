@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+"""测试用 xlsx 工具 / xlsx helpers for the tests"""
+
+import re
+import zipfile
+
+INLINE_RE = re.compile(r'<c r="([A-Z]+\d+)"((?: s="\d+")?) t="inlineStr"><is><t>([^<]*)</t></is></c>')
+
+
+def shared_strings(path):
+    """把 openpyxl 写出的内联字符串改为共享字符串（按首次出现编号，与 iWMS 导出相同）
+    Turn the inline strings openpyxl writes into shared strings, numbered by first appearance like the iWMS exports
+    """
+    with zipfile.ZipFile(path) as z:
+        parts = {name: z.read(name) for name in z.namelist()}
+    strings = []
+
+    def shared(match):
+        if match.group(3) not in strings:
+            strings.append(match.group(3))
+        return f'<c r="{match.group(1)}"{match.group(2)} t="s"><v>{strings.index(match.group(3))}</v></c>'
+
+    sheet = 'xl/worksheets/sheet1.xml'
+    parts[sheet] = INLINE_RE.sub(shared, parts[sheet].decode('utf-8')).encode('utf-8')
+    parts['xl/sharedStrings.xml'] = (
+        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        + ''.join(f'<si><t>{t}</t></si>' for t in strings) + '</sst>').encode('utf-8')
+    parts['[Content_Types].xml'] = parts['[Content_Types].xml'].replace(
+        b'</Types>', b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-'
+        b'officedocument.spreadsheetml.sharedStrings+xml"/></Types>')
+    rels = 'xl/_rels/workbook.xml.rels'
+    parts[rels] = parts[rels].replace(
+        b'</Relationships>', b'<Relationship Id="rIdSst" Type="http://schemas.openxmlformats.org/officeDocument/'
+        b'2006/relationships/sharedStrings" Target="sharedStrings.xml"/></Relationships>')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, data in parts.items():
+            z.writestr(name, data)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+监视模式：导出文件一到齐就处理 / Watch mode: process the exports as soon as they land
+
+功能说明 Function Description:
+-------------------------------------
+- 常驻进程，定期刷新文件清单（见 file_manifest，未变化的文件夹只需一次 stat）
+  A long-running process that refreshes the file manifest at every poll (see file_manifest; an unchanged
+  folder costs one stat).
+- 某个仓库某一天的三个文件到齐、且在一个轮询间隔内大小和修改时间不再变化（复制完成）时，
+  只合并并计算这个仓库的指标
+  When a warehouse's three files for a date are present and their size and mtime held still for one poll
+  interval (the copy has finished), only that warehouse is combined and analysed.
+- 每个仓库完成后立即刷新当天的汇总 CSV、指标库和周报
+  After every warehouse the day's summary CSV, the metrics store and the weekly report are refreshed.
+- 解释器保持运行，pandas 已导入，列匹配和解析缓存保持热状态；文件被重新导出时自动重新处理
+  The interpreter stays warm (pandas imported, column resolution and parse caches hot); a file that is
+  exported again is processed again.
+
+用法 Usage:
+    python run_program.py --watch [--poll-seconds 10] [--no-merged-output] [其他参数 other stage flags]
+"""
+
+import time
+from datetime import datetime
+
+import combine_excel_sheets
+import process_merged_files
+import generate_weekly_report
+import file_manifest
+import profiling
+from dates import coerce_date
+
+# ==================== 配置区 Configuration Area ====================
+
+# 默认轮询间隔（秒） / Default poll interval in seconds
+POLL_SECONDS = 10
+
+# ===============================================================
+
+
+def watched_dates(args):
+    """本次轮询要监视的日期；未指定日期时为今天（跨过午夜自动切换）
+    Dates watched by this poll; today when no date is given (rolls over at midnight)
+    """
+    dates = combine_excel_sheets.resolve_date_range(args)
+    return dates or [combine_excel_sheets.resolve_target_date(args).strftime("%Y-%m-%d")]
+
+
+def signature(stats, files):
+    """三个源文件的 (路径, 大小, 修改时间) 签名 / (path, size, mtime) signature of the three source files"""
+    return tuple((kind, path, *stats.get(path, (None, None))) for kind, path in sorted(files.items()))
+
+
+def ready_units(manifest, dates, folders, last_seen, processed):
+    """返回到齐、已稳定且尚未处理（或已被重新导出）的单元 [(仓库, 路径, 日期, 文件, 签名)]
+    Return the units that are complete, stable and not processed yet (or exported again)
+    as [(warehouse, path, date, files, signature)]
+
+    last_seen 记录上一次轮询看到的签名，用来判断文件是否仍在复制。
+    last_seen keeps the signatures of the previous poll to tell whether a file is still being copied.
+    """
+    entries = file_manifest.lookup(manifest, dates, kinds=file_manifest.SOURCE_KINDS)
+    stats = {e['path']: (e['size'], e['mtime_ns']) for e in entries}
+    found = file_manifest.source_files(manifest, dates, [item for item, _ in folders])
+    ready = []
+    for date in dates:
+        for item, folder_path in folders:
+            files = found.get((item, date))
+            if files is None or any(path is None for path in files.values()):
+                continue
+            sig = signature(stats, files)
+            stable = last_seen.get((item, date)) == sig
+            last_seen[(item, date)] = sig
+            if stable and processed.get((item, date)) != sig:
+                ready.append((item, folder_path, date, files, sig))
+    return ready
+
+
+def refresh_outputs(date, rows):
+    """刷新当天的汇总 CSV、指标库和周报 / Refresh the day's summary CSV, metrics store and weekly report"""
+    summary = process_merged_files.save_summary([rows[item] for item in sorted(rows)], date)
+    start, end = generate_weekly_report.week_range(coerce_date(date))
+    with profiling.span("report"):
+        generate_weekly_report.main(summary, start, end)
+
+
+def watch(stage_args, write_merged=True, poll_seconds=POLL_SECONDS, max_polls=None):
+    """监视仓库文件夹并逐个处理到齐的仓库，直到 Ctrl+C（或轮询 max_polls 次）
+    Watch the warehouse folders and process every warehouse as it completes, until Ctrl+C (or max_polls polls)
+    """
+    args = combine_excel_sheets.parse_args(stage_args)
+    metrics = process_merged_files.resolve_metrics(args.metrics)
+    use_cache = not args.no_cache
+    last_seen = {}   # 上一次轮询的签名 / signatures seen at the previous poll
+    processed = {}   # 已处理的签名 / signatures already processed
+    rows = {}        # {日期: {仓库: 汇总行}} / {date: {warehouse: summary row}}
+
+    print("\n" + "=" * 70)
+    print(f"监视模式 Watch mode: {combine_excel_sheets.PARENT_DIR}")
+    print(f"轮询间隔 Poll interval: {poll_seconds}s, 写出合并文件 Write merged workbooks: {write_merged}")
+    print("按 Ctrl+C 退出 Press Ctrl+C to stop.")
+    print("=" * 70 + "\n")
+
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            dates = watched_dates(args)
+            folders = combine_excel_sheets.iter_warehouse_folders()
+            manifest = file_manifest.refresh(combine_excel_sheets.PARENT_DIR)
+            for item, folder_path, date, files, sig in ready_units(manifest, dates, folders, last_seen, processed):
+                print(f"[INFO] {datetime.now():%H:%M:%S} 文件已到齐 Exports complete: {item} {date}")
+                row = process_merged_files.analyse_folder(
+                    item, folder_path, date, False, write_merged, use_cache,
+                    args.stream_threshold_mb, args.fast_merge, files, metrics)
+                processed[(item, date)] = sig
+                if row is None:
+                    continue
+                rows.setdefault(date, {})[item] = row
+                refresh_outputs(date, rows[date])
+            if max_polls is None or polls < max_polls:
+                time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        print("\n监视已停止 Watch stopped.")
+    return rows
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+工作队列：多个进程或主机共享同一个数据目录 / Work queue: several processes or hosts share one data directory
+
+功能说明 Function Description:
+-------------------------------------
+- 每个 (仓库, 日期) 单元用租约文件认领（O_CREAT | O_EXCL 原子创建），任意数量的工作进程从同一队列中取单元
+  Every (warehouse, date) unit is claimed with a lease file created atomically (O_CREAT | O_EXCL); any
+  number of workers pull units from the same queue.
+- 处理期间后台线程定期更新租约的修改时间（心跳）；超过 LEASE_SECONDS 没有心跳的租约视为失效，
+  由其他工作进程原子地收回并重新处理
+  While a unit runs a background thread refreshes the lease mtime (heartbeat); a lease without a heartbeat
+  for LEASE_SECONDS is stale and another worker atomically takes it over and redoes the unit.
+- 单元结果写入 .done 文件（临时文件 + 原子替换），并记录源文件签名和运行选项：源文件被重新导出或选项变化时
+  单元会重新处理，而不是沿用旧结果
+  Unit results go to .done files (temporary file + atomic rename) together with the source file signature
+  and the run options, so a re-exported file or changed options reprocess the unit instead of reusing it.
+- 合并文件固定命名为 <仓库><日期>.xlsx 并原子替换，不会产生 (1)、(2) 副本
+  Merged workbooks are always <warehouse><date>.xlsx, replaced atomically, never (1)/(2) copies.
+- 全部单元完成后，只有一个工作进程（认领汇总租约者）写出汇总 CSV、指标库和报告
+  Once every unit is done exactly one worker (the one that claims the summary lease) writes the summary
+  CSV, the metrics store and the report.
+
+用法 Usage:
+    python run_program.py --queue [--workers 4] [--no-merged-output] [其他参数 other stage flags]
+    （每台主机、每个容器各运行一次 / run once per host or container）
+"""
+
+import os
+import json
+import time
+import socket
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import combine_excel_sheets
+import process_merged_files
+import file_manifest
+import npz_store
+from worker_pool import run_units
+
+# ==================== 配置区 Configuration Area ====================
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 队列目录（以 . 开头，不会被当作仓库文件夹） / Queue directory (dot-prefixed, never taken for a warehouse folder)
+QUEUE_DIR = os.path.join(PARENT_DIR, ".work_queue")
+
+# 租约超过多少秒没有心跳视为失效 / Seconds without a heartbeat after which a lease is stale
+LEASE_SECONDS = 120
+
+# 心跳间隔（秒） / Heartbeat interval in seconds
+HEARTBEAT_SECONDS = 20
+
+# 其他工作进程仍持有租约时的等待间隔（秒） / Wait between checks while other workers hold leases
+POLL_SECONDS = 2
+
+# ===============================================================
+
+
+def owner_id():
+    """工作进程标识：主机名:进程号 / Worker identity: host:pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def queue_dir(dates):
+    """本次运行的队列目录（按日期范围区分） / Queue directory of a run (one per date range)"""
+    label = dates[0] if len(dates) == 1 else f"{dates[0]}_{dates[-1]}"
+    path = os.path.join(QUEUE_DIR, label)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def unit_signature(files, options):
+    """源文件 (路径, 大小, 修改时间) 和运行选项的签名 / Signature of the source files (path, size, mtime) and the run options"""
+    state = []
+    for kind, path in sorted((files or {}).items()):
+        try:
+            st = os.stat(path)
+            state.append((kind, path, st.st_size, st.st_mtime_ns))
+        except (OSError, TypeError):
+            state.append((kind, path, None, None))
+    return hashlib.sha1(json.dumps([state, options], default=str).encode("utf-8")).hexdigest()
+
+
+def write_atomic(path, obj):
+    """临时文件 + 原子替换；以 npz 保存，读取时不会执行代码（见 npz_store）
+    Temporary file + atomic rename; stored as npz, so reading it never runs code (see npz_store)
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        npz_store.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def read_done(path, signature):
+    """读取签名一致的完成记录，否则返回 None / Read a completion record with a matching signature, None otherwise"""
+    try:
+        with open(path, "rb") as f:
+            record = npz_store.load(f)
+    except (OSError, ValueError):
+        return None
+    return record if record.get("signature") == signature else None
+
+
+def try_claim(lease_path):
+    """原子地认领一个租约；已被持有时收回失效租约后重试一次 / Atomically claim a lease; when it is held, take
+    over a stale lease and retry once
+    """
+    for _ in range(2):
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not break_stale(lease_path):
+                return False
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"owner": owner_id(), "claimed": time.time()}, f)
+        return True
+    return False
+
+
+def lease_owner(lease_path):
+    """租约中记录的工作进程标识，读取失败时为 None / Worker identity recorded in a lease, None when unreadable"""
+    try:
+        with open(lease_path, encoding="utf-8") as f:
+            return json.load(f).get("owner")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def break_stale(lease_path):
+    """收回失效租约 / Take over a stale lease
+
+    检查和删除在 <租约>.breaking 守护文件（O_EXCL）内完成，同一时刻只有一个工作进程能收回，
+    不会误删刚被其他工作进程重新认领的新租约；守护文件本身超过 LEASE_SECONDS 视为残留并清除
+    The check and the removal run under a <lease>.breaking guard file (O_EXCL), so one worker at a time takes
+    over and a lease another worker has just claimed afresh is never removed; a guard older than
+    LEASE_SECONDS is a leftover and is cleared.
+    """
+    guard = f"{lease_path}.breaking"
+    try:
+        fd = os.open(guard, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.stat(guard).st_mtime > LEASE_SECONDS:
+                os.remove(guard)
+        except OSError:
+            pass
+        return False
+    os.close(fd)
+    try:
+        if time.time() - os.stat(lease_path).st_mtime <= LEASE_SECONDS:
+            return False
+        os.remove(lease_path)
+    except FileNotFoundError:
+        # 租约刚被释放，可以直接重试 / The lease was just released, retry right away
+        return True
+    except OSError:
+        return False
+    finally:
+        os.remove(guard)
+    print(f"[WARN] 收回失效租约 Reclaimed stale lease: {os.path.basename(lease_path)}")
+    return True
+
+
+@contextmanager
+def held(lease_path):
+    """持有租约期间定期心跳，结束后释放；租约已被其他工作进程收回时既不续期也不删除
+    Heartbeat while the lease is held, release it afterwards; a lease another worker took over is neither
+    refreshed nor removed
+    """
+    stop = threading.Event()
+    me = owner_id()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            if lease_owner(lease_path) != me:
+                return
+            try:
+                os.utime(lease_path)
+            except OSError:
+                return
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        if lease_owner(lease_path) == me:
+            try:
+                os.remove(lease_path)
+            except FileNotFoundError:
+                pass
+
+
+def plan(stage_args, write_merged):
+    """解析参数并列出单元 [(仓库, 路径, 日期, 源文件, 签名)]，所有工作进程得到相同的列表
+    Parse the arguments and list the units [(warehouse, path, date, files, signature)]; every worker gets the same list
+    """
+    args = combine_excel_sheets.parse_args(stage_args)
+    if args.delete_others:
+        raise ValueError("--queue 不支持 --delete-others / --queue does not support --delete-others")
+    # build_state 导入本模块，在这里导入以避免循环导入 / build_state imports this module, imported here to avoid the cycle
+    import build_state
+
+    metrics = process_merged_files.resolve_metrics(args.metrics)
+    options = build_state.unit_options(write_merged, args, metrics)
+    manifest = file_manifest.refresh(PARENT_DIR)
+    units = [(item, folder_path, date, files, unit_signature(files, options))
+             for item, folder_path, date, files in combine_excel_sheets.plan_units(args, manifest)]
+    dates = combine_excel_sheets.resolve_date_range(args) or sorted({u[2] for u in units})
+    return args, metrics, units, dates
+
+
+def drain(stage_args, write_merged=True):
+    """从队列中取单元直到全部完成；其他工作进程仍在处理时等待（并收回失效租约）
+    Pull units until every unit is done; wait while other workers are still busy (taking over stale leases)
+
+    返回本进程处理的单元数 / Returns the number of units this process handled.
+    """
+    args, metrics, units, dates = plan(stage_args, write_merged)
+    if not units:
+        return 0
+    directory = queue_dir(dates)
+    handled = 0
+    while True:
+        pending = [u for u in units
+                   if read_done(os.path.join(directory, f"{u[0]}_{u[2]}.done"), u[4]) is None]
+        if not pending:
+            return handled
+        progressed = False
+        for item, folder_path, date, files, signature in pending:
+            lease = os.path.join(directory, f"{item}_{date}.lease")
+            done = os.path.join(directory, f"{item}_{date}.done")
+            if not try_claim(lease):
+                continue
+            with held(lease):
+                # 认领前可能刚被其他工作进程完成 / Another worker may have finished it just before the claim
+                if read_done(done, signature) is not None:
+                    continue
+                print(f"[INFO] {owner_id()} 认领 Claimed: {item} {date}")
+                row = process_merged_files.analyse_folder(
+                    item, folder_path, date, False, write_merged, not args.no_cache,
+                    args.stream_threshold_mb, args.fast_merge, files, metrics, overwrite=True)
+                write_atomic(done, {"signature": signature, "owner": owner_id(), "row": row})
+                handled += 1
+                progressed = True
+        if not progressed:
+            time.sleep(POLL_SECONDS)
+
+
+@contextmanager
+def summary_claim(stage_args, write_merged=True):
+    """全部单元完成后认领汇总；产出按日期、仓库排序的 [(日期, 汇总行)]，未认领到（或已汇总过）时为 None
+    Claim the summary once every unit is done; yields [(date, summary row)] ordered by date then warehouse,
+    or None when another worker has it (or it was already written)
+
+    with 块正常结束后记录汇总已完成 / The summary is marked as written when the with block completes.
+    """
+    _, _, units, dates = plan(stage_args, write_merged)
+    directory = queue_dir(dates) if units else None
+    records = [read_done(os.path.join(directory, f"{u[0]}_{u[2]}.done"), u[4]) for u in units] if units else []
+    if not units or any(r is None for r in records):
+        yield None
+        return
+    signature = hashlib.sha1("".join(u[4] for u in units).encode("utf-8")).hexdigest()
+    marker = os.path.join(directory, "summary.done")
+    lease = os.path.join(directory, "summary.lease")
+    if read_done(marker, signature) is not None or not try_claim(lease):
+        yield None
+        return
+    with held(lease):
+        yield [(u[2], r["row"]) for u, r in zip(units, records) if r["row"] is not None]
+        write_atomic(marker, {"signature": signature, "owner": owner_id()})
+
+
+def run(stage_args, write_merged=True, workers=1):
+    """在本机启动 workers 个队列工作进程并等待队列清空 / Start workers queue workers on this host and wait
+    until the queue is empty
+    """
+    handled = run_units(drain, [(stage_args, write_merged)] * max(workers, 1), workers)
+    print(f"[INFO] 本机处理 Handled on this host: {sum(handled)} 个单元 units")
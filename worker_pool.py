@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+进程池工具 / Process pool helper
+
+每个仓库文件夹（读取、合并、计算指标）是一个独立的工作单元，可交给进程池并行处理。
+Each warehouse folder (read, merge, metrics) is an independent unit of work that can be handed to a process pool.
+结果始终按任务顺序返回，因此汇总 CSV 与串行运行完全一致。
+Results always come back in task order, so the summary CSV is identical to a serial run.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def resolve_workers(value):
+    """将 --workers 参数转换为进程数 / Turn a --workers value into a process count
+
+    None 或 1 → 串行；0 → 使用全部 CPU 核心。
+    None or 1 → serial; 0 → use every CPU core.
+    """
+    if value is None:
+        return 1
+    workers = int(value)
+    if workers < 0:
+        raise ValueError(f"--workers 必须 >= 0 / --workers must be >= 0, got {workers}")
+    if workers == 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def run_units(func, tasks, workers=1):
+    """对每个任务参数元组调用 func，按任务顺序返回结果 / Call func(*task) for every task, results in task order
+
+    workers <= 1 或只有一个任务时直接在当前进程中运行。
+    Runs in the current process when workers <= 1 or there is only one task.
+    func 必须是模块级函数，以便在子进程中导入。
+    func must be a module-level function so worker processes can import it.
+    """
+    tasks = list(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(*task) for task in tasks]
+
+    print(f"并行处理 Processing {len(tasks)} 个单元 units with {min(workers, len(tasks))} workers")
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        return list(executor.map(func, *zip(*tasks)))
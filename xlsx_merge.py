@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+xlsx 包级合并 / Package-level xlsx merge
+
+功能说明 Function Description:
+-------------------------------------
+- 不解析单元格，直接把每个源文件第一个工作表的 XML、共享字符串和样式复制到新的 xlsx 包中，
+  并把工作表重命名为 Outbound / Inbound / Inventory。
+  Copies the first worksheet XML, shared strings and styles of every source file into a new xlsx
+  package without parsing the cells, and renames the sheets to Outbound / Inbound / Inventory.
+- 最大的工作表作为基准：它的共享字符串和样式排在最前面，XML 原样流式复制；
+  其余工作表只需平移共享字符串下标（t="s" 的 <v>）和样式下标（s="..."）。
+  The largest worksheet is the base: its shared strings and styles come first and its XML is streamed
+  through unchanged; the other sheets only get their shared-string (<v> of t="s") and style (s="...") indices shifted.
+- 遇到无法安全复制的内容（工作表关系、条件格式、带前缀的 XML、日期系统不一致等）时抛出
+  XlsxMergeUnsupported，调用方应退回 openpyxl 写出。
+  Anything that cannot be copied safely (worksheet relationships, conditional formatting, prefixed XML,
+  mixed date systems, ...) raises XlsxMergeUnsupported and the caller should fall back to the openpyxl writer.
+"""
+
+import os
+import re
+import copy
+import shutil
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+MC_NS = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+
+ET.register_namespace("", MAIN_NS)
+ET.register_namespace("r", REL_NS)
+ET.register_namespace("mc", MC_NS)
+ET.register_namespace("x14ac", "http://schemas.microsoft.com/office/spreadsheetml/2009/9/ac")
+ET.register_namespace("x14", "http://schemas.microsoft.com/office/spreadsheetml/2009/9/main")
+ET.register_namespace("x16r2", "http://schemas.microsoft.com/office/spreadsheetml/2015/02/main")
+
+XML_DECL = b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# styles.xml 中各部分的固定顺序 / Fixed order of the styles.xml sections
+STYLE_SECTIONS = ["numFmts", "fonts", "fills", "borders", "cellStyleXfs", "cellXfs",
+                  "cellStyles", "dxfs", "tableStyles", "colors", "extLst"]
+
+# 第一个自定义数字格式编号 / First custom number format id
+FIRST_CUSTOM_NUMFMT = 164
+
+SI_RE = re.compile(rb"<si>.*?</si>|<si/>", re.S)
+CELL_RE = re.compile(rb"<c\b([^>]*)>(?:(\s*<v>)(\d+)(</v>))?")
+STYLE_ATTR_RE = re.compile(rb'(\bs=")(\d+)(")')
+ROW_RE = re.compile(rb"<row\b[^>]*>")
+COL_RE = re.compile(rb"<col\b[^>]*>")
+COL_STYLE_RE = re.compile(rb'(\bstyle=")(\d+)(")')
+TAB_SELECTED_RE = re.compile(rb'\s+tabSelected="(?:1|true)"')
+
+
+class XlsxMergeUnsupported(Exception):
+    """源文件包含无法在包级别安全合并的内容 / The source package cannot be merged safely at package level"""
+
+
+def _q(tag, ns=MAIN_NS):
+    return f"{{{ns}}}{tag}"
+
+
+def _resolve_target(base_dir, target):
+    """解析关系中的 Target 为包内路径 / Resolve a relationship Target to a part name"""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+
+def _rels_path(part):
+    return posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+
+
+def _read_rels(zf, part):
+    """读取某个部件的关系 {Id: (Type, 目标路径)} / Read a part's relationships {Id: (Type, part name)}"""
+    path = _rels_path(part)
+    if path not in zf.namelist():
+        return {}
+    root = ET.fromstring(zf.read(path))
+    base_dir = posixpath.dirname(part)
+    return {
+        rel.get("Id"): (rel.get("Type").rsplit("/", 1)[-1], _resolve_target(base_dir, rel.get("Target")))
+        for rel in root.iter(_q("Relationship", PKG_REL_NS))
+        if rel.get("TargetMode") != "External"
+    }
+
+
+class _Source:
+    """一个源 xlsx 包中需要的部件 / The parts needed from one source xlsx package"""
+
+    def __init__(self, path):
+        self.path = path
+        self.zf = zipfile.ZipFile(path)
+        names = set(self.zf.namelist())
+
+        root_rels = _read_rels(self.zf, "")
+        workbook = next((p for t, p in root_rels.values() if t == "officeDocument"), "xl/workbook.xml")
+        wb_root = ET.fromstring(self.zf.read(workbook))
+        sheet = wb_root.find(f"{_q('sheets')}/{_q('sheet')}")
+        if sheet is None:
+            raise XlsxMergeUnsupported(f"{os.path.basename(path)}: 没有工作表 no worksheet")
+        pr = wb_root.find(_q("workbookPr"))
+        self.date1904 = pr is not None and pr.get("date1904") in ("1", "true")
+
+        wb_rels = _read_rels(self.zf, workbook)
+        self.sheet_part = wb_rels[sheet.get(_q("id", REL_NS))][1]
+        self.sst_part = next((p for t, p in wb_rels.values() if t == "sharedStrings"), None)
+        self.styles_part = next((p for t, p in wb_rels.values() if t == "styles"), None)
+        self.theme_part = next((p for t, p in wb_rels.values() if t == "theme"), None)
+
+        if self.styles_part is None:
+            raise XlsxMergeUnsupported(f"{os.path.basename(path)}: 缺少样式部件 no styles part")
+        sheet_rels = _rels_path(self.sheet_part)
+        if sheet_rels in names and b"<Relationship " in self.zf.read(sheet_rels):
+            raise XlsxMergeUnsupported(f"{os.path.basename(path)}: 工作表带有关系部件 worksheet has relationships")
+
+        self.sheet_size = self.zf.getinfo(self.sheet_part).file_size
+        self.strings = []
+        if self.sst_part:
+            sst = self.zf.read(self.sst_part)
+            if b"<sst" not in sst[:512]:
+                raise XlsxMergeUnsupported(f"{os.path.basename(path)}: 共享字符串使用了命名空间前缀 prefixed sharedStrings")
+            self.strings = SI_RE.findall(sst)
+
+    def close(self):
+        self.zf.close()
+
+
+def _section(root, name, create=False):
+    """取得（或按顺序创建）styles.xml 的某个部分 / Get (or create in schema order) a styles.xml section"""
+    node = root.find(_q(name))
+    if node is None and create:
+        node = ET.Element(_q(name))
+        order = STYLE_SECTIONS.index(name)
+        pos = 0
+        for i, child in enumerate(list(root)):
+            tag = child.tag.split("}")[-1]
+            if tag in STYLE_SECTIONS and STYLE_SECTIONS.index(tag) < order:
+                pos = i + 1
+        root.insert(pos, node)
+    return node
+
+
+def _set_count(node):
+    if node is not None:
+        node.set("count", str(len(node)))
+
+
+def merge_styles(base_xml, other_xmls):
+    """合并样式表，返回 (styles.xml 字节, 每个其他源的 cellXfs 偏移)
+    Merge style sheets, returns (styles.xml bytes, cellXfs offset for every other source)
+
+    数字格式、字体、填充、边框、单元格样式格式（cellStyleXfs）和单元格格式（cellXfs）依次追加并重新编号。
+    Number formats, fonts, fills, borders, cellStyleXfs and cellXfs are appended and renumbered.
+    """
+    root = ET.fromstring(base_xml)
+    # 只保留标准命名空间中的内容，去掉可能引用未声明前缀的 mc:Ignorable
+    # Drop mc:Ignorable, which may name prefixes that serialization no longer declares
+    root.attrib.pop(_q("Ignorable", MC_NS), None)
+
+    numfmts = _section(root, "numFmts", create=True)
+    used_ids = [int(n.get("numFmtId")) for n in numfmts]
+    next_numfmt = max([FIRST_CUSTOM_NUMFMT - 1] + used_ids) + 1
+
+    offsets = []
+    for xml in other_xmls:
+        other = ET.fromstring(xml)
+
+        numfmt_map = {}
+        other_numfmts = other.find(_q("numFmts"))
+        for fmt in (other_numfmts if other_numfmts is not None else []):
+            old_id = int(fmt.get("numFmtId"))
+            if old_id < FIRST_CUSTOM_NUMFMT:
+                continue
+            new_fmt = copy.deepcopy(fmt)
+            new_fmt.set("numFmtId", str(next_numfmt))
+            numfmts.append(new_fmt)
+            numfmt_map[old_id] = next_numfmt
+            next_numfmt += 1
+
+        base_len = {}
+        for name in ("fonts", "fills", "borders", "cellStyleXfs", "cellXfs"):
+            target = _section(root, name, create=True)
+            base_len[name] = len(target)
+            source = other.find(_q(name))
+            for child in (source if source is not None else []):
+                target.append(copy.deepcopy(child))
+
+        def remap_xfs(name, with_xf_id):
+            target = root.find(_q(name))
+            for xf in list(target)[base_len[name]:]:
+                if xf.get("numFmtId") is not None:
+                    old = int(xf.get("numFmtId"))
+                    xf.set("numFmtId", str(numfmt_map.get(old, old)))
+                for attr, section in (("fontId", "fonts"), ("fillId", "fills"), ("borderId", "borders")):
+                    if xf.get(attr) is not None:
+                        xf.set(attr, str(int(xf.get(attr)) + base_len[section]))
+                if with_xf_id and xf.get("xfId") is not None:
+                    xf.set("xfId", str(int(xf.get("xfId")) + base_len["cellStyleXfs"]))
+
+        remap_xfs("cellStyleXfs", with_xf_id=False)
+        remap_xfs("cellXfs", with_xf_id=True)
+        offsets.append(base_len["cellXfs"])
+
+    for name in ("numFmts", "fonts", "fills", "borders", "cellStyleXfs", "cellXfs"):
+        _set_count(root.find(_q(name)))
+    if len(numfmts) == 0:
+        root.remove(numfmts)
+    return XML_DECL + ET.tostring(root), offsets
+
+
+def shift_sheet_xml(data, xf_offset, sst_offset, keep_selected):
+    """平移工作表 XML 中的样式和共享字符串下标 / Shift style and shared-string indices in worksheet XML"""
+    if b"<worksheet" not in data[:1024]:
+        raise XlsxMergeUnsupported("工作表使用了命名空间前缀 prefixed worksheet XML")
+    if b"<conditionalFormatting" in data:
+        raise XlsxMergeUnsupported("工作表含条件格式 worksheet has conditional formatting")
+
+    def shift_style(m):
+        return m.group(1) + str(int(m.group(2)) + xf_offset).encode() + m.group(3)
+
+    def shift_cell(m):
+        attrs = m.group(1)
+        if xf_offset:
+            attrs = STYLE_ATTR_RE.sub(shift_style, attrs)
+        out = b"<c" + attrs + b">"
+        if m.group(2) is None:
+            return out
+        value = m.group(3)
+        if sst_offset and b't="s"' in attrs:
+            value = str(int(value) + sst_offset).encode()
+        return out + m.group(2) + value + m.group(4)
+
+    data = CELL_RE.sub(shift_cell, data)
+    if xf_offset:
+        data = ROW_RE.sub(lambda m: STYLE_ATTR_RE.sub(shift_style, m.group(0)), data)
+        data = COL_RE.sub(lambda m: COL_STYLE_RE.sub(shift_style, m.group(0)), data)
+    if not keep_selected:
+        data = TAB_SELECTED_RE.sub(b"", data)
+    return data
+
+
+def _copy_sheet(source, zout, part, keep_selected):
+    """原样流式复制基准工作表（仅在需要时去掉 tabSelected） / Stream the base worksheet through unchanged"""
+    with source.zf.open(source.sheet_part) as fin, zout.open(part, "w", force_zip64=True) as fout:
+        head = fin.read(65536)
+        if not keep_selected:
+            cut = head.find(b"<sheetData")
+            cut = len(head) if cut < 0 else cut
+            head = TAB_SELECTED_RE.sub(b"", head[:cut]) + head[cut:]
+        fout.write(head)
+        shutil.copyfileobj(fin, fout, 1024 * 1024)
+
+
+def _package_parts(sheet_names, has_theme, date1904):
+    """生成工作簿、关系和内容类型部件 / Build the workbook, relationship and content-type parts"""
+    sheets = "".join(
+        f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>' for i, name in enumerate(sheet_names, 1)
+    )
+    n = len(sheet_names)
+    workbook_pr = '<workbookPr date1904="1"/>' if date1904 else ""
+    workbook = (
+        f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">{workbook_pr}'
+        f'<bookViews><workbookView activeTab="0"/></bookViews><sheets>{sheets}</sheets></workbook>'
+    )
+    rels = "".join(
+        f'<Relationship Id="rId{i}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, n + 1)
+    )
+    rels += f'<Relationship Id="rId{n + 1}" Type="{REL_NS}/styles" Target="styles.xml"/>'
+    rels += f'<Relationship Id="rId{n + 2}" Type="{REL_NS}/sharedStrings" Target="sharedStrings.xml"/>'
+    if has_theme:
+        rels += f'<Relationship Id="rId{n + 3}" Type="{REL_NS}/theme" Target="theme/theme1.xml"/>'
+    wb_rels = f'<Relationships xmlns="{PKG_REL_NS}">{rels}</Relationships>'
+
+    root_rels = (
+        f'<Relationships xmlns="{PKG_REL_NS}"><Relationship Id="rId1" '
+        f'Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+    )
+    ct = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+    overrides = [("/xl/workbook.xml", f"{ct}.sheet.main+xml"),
+                 ("/xl/styles.xml", f"{ct}.styles+xml"),
+                 ("/xl/sharedStrings.xml", f"{ct}.sharedStrings+xml")]
+    overrides += [(f"/xl/worksheets/sheet{i}.xml", f"{ct}.worksheet+xml") for i in range(1, n + 1)]
+    if has_theme:
+        overrides.append(("/xl/theme/theme1.xml", "application/vnd.openxmlformats-officedocument.theme+xml"))
+    content_types = (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        + "".join(f'<Override PartName="{p}" ContentType="{t}"/>' for p, t in overrides)
+        + "</Types>"
+    )
+    return workbook, wb_rels, root_rels, content_types
+
+
+def merge_workbooks(sources, output_path):
+    """把 {sheet 名: 源文件路径} 合并为一个工作簿，不解析单元格
+    Merge {sheet name: source path} into one workbook without parsing the cells
+
+    输出先写入临时文件再改名，失败时不会留下半个文件。
+    The output is written to a temporary file and renamed, so a failure leaves no partial file behind.
+    """
+    opened = []
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        for path in sources.values():
+            opened.append(_Source(path))
+        if len({s.date1904 for s in opened}) > 1:
+            raise XlsxMergeUnsupported("源文件日期系统不一致 mixed 1900/1904 date systems")
+
+        # 最大的工作表作为基准，原样复制 / The largest worksheet is the base and is copied unchanged
+        base_idx = max(range(len(opened)), key=lambda i: opened[i].sheet_size)
+        order = [base_idx] + [i for i in range(len(opened)) if i != base_idx]
+
+        styles_xml, xf_offsets = merge_styles(
+            opened[base_idx].zf.read(opened[base_idx].styles_part),
+            [opened[i].zf.read(opened[i].styles_part) for i in order[1:]],
+        )
+        xf_offset = {base_idx: 0, **dict(zip(order[1:], xf_offsets))}
+
+        strings, sst_offset = [], {}
+        for i in order:
+            sst_offset[i] = len(strings)
+            strings.extend(opened[i].strings)
+        sst_xml = (XML_DECL + f'<sst xmlns="{MAIN_NS}" uniqueCount="{len(strings)}">'.encode()
+                   + b"".join(strings) + b"</sst>")
+
+        base = opened[base_idx]
+        workbook, wb_rels, root_rels, content_types = _package_parts(
+            list(sources), base.theme_part is not None, base.date1904)
+
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zout:
+            zout.writestr("[Content_Types].xml", XML_DECL + content_types.encode())
+            zout.writestr("_rels/.rels", XML_DECL + root_rels.encode())
+            zout.writestr("xl/workbook.xml", XML_DECL + workbook.encode())
+            zout.writestr("xl/_rels/workbook.xml.rels", XML_DECL + wb_rels.encode())
+            zout.writestr("xl/styles.xml", styles_xml)
+            zout.writestr("xl/sharedStrings.xml", sst_xml)
+            if base.theme_part:
+                zout.writestr("xl/theme/theme1.xml", base.zf.read(base.theme_part))
+            for pos, source in enumerate(opened):
+                part = f"xl/worksheets/sheet{pos + 1}.xml"
+                keep_selected = pos == 0
+                if pos == base_idx:
+                    _copy_sheet(source, zout, part, keep_selected)
+                else:
+                    data = shift_sheet_xml(source.zf.read(source.sheet_part),
+                                           xf_offset[pos], sst_offset[pos], keep_selected)
+                    zout.writestr(part, data)
+        os.replace(tmp_path, output_path)
+    finally:
+        for source in opened:
+            source.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)